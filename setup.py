@@ -63,6 +63,13 @@ setup(
         'rfc3987==1.3.1'
     ],
 
+    extras_require={
+        'ujson': ['ujson'],
+        'redis': ['redis'],
+        'server': ['gunicorn>=19.0', 'futures'],
+        'gevent': ['gevent'],
+    },
+
     # Tests
 
     tests_require=['pytest'],
@@ -24,6 +24,121 @@ parser.add_argument('-d',
                     action="store_true",
                     help="run flask in debug mode")
 
+parser.add_argument('-b',
+                    "--bind",
+                    metavar="[address]",
+                    default="127.0.0.1:5000",
+                    help="the address to listen on (default: %(default)s)")
+
+parser.add_argument("--deliver",
+                    action="store_true",
+                    help="run the delivery engine instead of a server "
+                         "(requires gevent)")
+
+parser.add_argument("--migrate",
+                    action="store_true",
+                    help="migrate the database to the current version and exit")
+
+parser.add_argument("--keypair",
+                    metavar="[entity]",
+                    help="print the credentials an entity's applications "
+                         "sign requests with and exit")
+
+# Production server arguments
+server = parser.add_argument_group(
+    "production server",
+    "run a multi-process server with gunicorn, which must be installed")
+
+server.add_argument('-p',
+                    "--production",
+                    action="store_true",
+                    help="run the production server instead of flask's "
+                         "development server")
+
+server.add_argument('-w',
+                    "--workers",
+                    metavar="[count]",
+                    type=int,
+                    help="the number of worker processes "
+                         "(default: twice the number of processors)")
+
+server.add_argument("--threads",
+                    metavar="[count]",
+                    type=int,
+                    help="the number of threads in each worker (default: 1)")
+
+server.add_argument("--backlog",
+                    metavar="[count]",
+                    type=int,
+                    help="the number of connections that can wait to be "
+                         "accepted (default: 2048)")
+
+server.add_argument("--keep-alive",
+                    metavar="[seconds]",
+                    type=int,
+                    help="how long to wait for another request on a "
+                         "keep-alive connection (default: 2)")
+
+server.add_argument("--graceful-timeout",
+                    metavar="[seconds]",
+                    type=int,
+                    help="how long workers have to finish their requests "
+                         "after being told to stop (default: 30)")
+
+server.add_argument("--preload",
+                    action="store_true",
+                    help="create the application and its indexes once, "
+                         "before forking the workers")
+
+
+def run_production(config, args):
+    """Run the application in several processes using gunicorn"""
+    from tentd.lib.gunicorn import Server
+    Server(config, {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'backlog': args.backlog,
+        'keepalive': args.keep_alive,
+        'graceful_timeout': args.graceful_timeout,
+        'preload_app': args.preload,
+    }).run()
+
+
+def run_engine(config):
+    """Send deliveries from the outbox concurrently using gevent"""
+    from gevent import monkey, signal as handle_signal
+    monkey.patch_all()
+
+    from signal import SIGINT, SIGTERM
+    from tentd.utils.engine import DeliveryEngine
+
+    # The engine serves no /metrics, and as metrics are recorded for each
+    # thread, they would be kept for every greenlet it runs
+    config['METRICS'] = False
+
+    engine = DeliveryEngine(create_app(config))
+    handle_signal(SIGTERM, engine.stop)
+    handle_signal(SIGINT, engine.stop)
+    engine.run()
+
+
+def print_keypair(app, name):
+    """Print the credentials of an entity's KeyPair, creating it if the
+    entity does not have one"""
+    from tentd.documents import Entity, KeyPair
+    with app.app_context():
+        try:
+            entity = Entity.objects.get(name=name)
+        except Entity.DoesNotExist:
+            print("No entity named {}".format(name))
+            return 1
+        KeyPair.owner_post_save(Entity, entity)
+        keypair = entity.keypair
+    print("mac_key_id: {}".format(keypair.mac_id))
+    print("mac_key: {}".format(keypair.mac_key))
+    print("mac_algorithm: {}".format(keypair.mac_algorithm))
+
 
 def run():
     """Parse command line arguments and run the application"""
@@ -33,8 +148,31 @@ def run():
     config = make_config(args.conf)
     config['DEBUG'] = args.debug
 
+    # Commands that exit run in this process, whatever server is chosen
+    command = args.migrate or args.keypair
+
+    # Each worker creates its own application
+    if args.production and not command:
+        return run_production(config, args)
+
+    # The engine patches the standard library before creating the app
+    if args.deliver and not command:
+        return run_engine(config)
+
     # Create the application and create the database
     app = create_app(config)
 
+    if args.migrate:
+        from tentd.documents.migrations import migrate
+        with app.app_context():
+            for name, count in migrate():
+                print("{}: migrated {} documents".format(name, count))
+        return
+
+    if args.keypair:
+        return print_keypair(app, args.keypair)
+
     # Run the application
-    app.run(threaded=app.config.get('THREADED', True))
+    host, _, port = args.bind.rpartition(':')
+    app.run(host=host, port=int(port),
+            threaded=app.config.get('THREADED', True))
@@ -7,10 +7,23 @@ from werkzeug.exceptions import ImATeapot, NotFound
 
 from tentd import __doc__ as description, __version__ as version
 from tentd.lib.flask import Request, Response, JSONEncoder, jsonify
-from tentd.blueprints import entity, followers, followings, posts, groups
+from tentd.lib.flask import JSONBackend, default_json_backend
+from tentd.lib.flask import entity_cache, link_cache
+from tentd.lib.requests import http
+from tentd.blueprints import (
+    entity, followers, followings, posts, groups, timeline)
+from tentd.blueprints.entity import profile_cache
 from tentd.documents import db, Entity
 from tentd.utils import make_config, manage_exception, deprecated
 from tentd.utils.exceptions import RequestDidNotValidate
+from tentd.utils.auth import keypair_cache, nonce_cache, require_admin
+from tentd.utils.cache import RedisCache
+from tentd.utils.follow import discovery_cache
+from tentd.utils.notifications import notifications
+from tentd.utils.outbox import outbox, stats as outbox_stats
+from tentd.utils.metrics import metrics
+from tentd.utils.monitor import monitor
+from tentd.utils.profiling import profiler
 
 
 class TentdFlask(Flask):
@@ -25,6 +38,9 @@ class TentdFlask(Flask):
     #: Not useful until Flask 0.10
     json_encoder = JSONEncoder
 
+    #: The backend used to encode and decode JSON, set from JSON_BACKEND
+    json_backend = default_json_backend
+
     @property
     def user_mode(self):
         """Return USER_MODE as lowercase"""
@@ -46,6 +62,44 @@ def create_app(config=None):
         'MONGODB_DB': 'tentd',
         'USER_MODE': 'multiple',
         'USER_NAME': None,
+        'JSON_BACKEND': 'simplejson',
+        'JSON_PRETTY': None,
+        'JSON_STREAM_CHUNK_SIZE': 100,
+        'ENTITY_CACHE_SIZE': 1000,
+        'ENTITY_CACHE_TTL': 60,
+        'PROFILE_CACHE_SIZE': 1000,
+        'PROFILE_CACHE_TTL': 300,
+        'PROFILE_CACHE_URL': None,
+        'MAC_TIMESTAMP_SKEW': 300,
+        'KEYPAIR_CACHE_TTL': 60,
+        'NONCE_CACHE_URL': None,
+        'ADMIN_TOKEN': None,
+        'PAGINATION_DEFAULT_LIMIT': 50,
+        'PAGINATION_MAX_LIMIT': 200,
+        'BULK_POSTS_BATCH_SIZE': 500,
+        'HTTP_TIMEOUT': 10,
+        'HTTP_POOL_HOSTS': 100,
+        'HTTP_MAX_HOST_CONNECTIONS': 10,
+        'DISCOVERY_CACHE_SIZE': 1000,
+        'DISCOVERY_CACHE_TTL': 300,
+        'DISCOVERY_CACHE_NEGATIVE_TTL': 30,
+        'OUTBOX_WORKERS': 4,
+        'OUTBOX_POLL_INTERVAL': 1.0,
+        'OUTBOX_LOCK_TIMEOUT': 300,
+        'OUTBOX_MAX_ATTEMPTS': 8,
+        'OUTBOX_RETRY_DELAY': 30,
+        'OUTBOX_RATE_WINDOW': 60,
+        'DELIVERY_CONCURRENCY': 1000,
+        'DELIVERY_HOST_CONCURRENCY': 10,
+        'DELIVERY_TIMEOUT': 30,
+        'NOTIFICATION_FLUSH_SIZE': 100,
+        'NOTIFICATION_FLUSH_LATENCY': 1.0,
+        'TIMELINE_WORKER': True,
+        'PROFILING': False,
+        'METRICS': True,
+        'SLOW_QUERY_THRESHOLD': None,
+        'SLOW_QUERY_EXPLAIN': False,
+        'SLOW_QUERY_LOG_SIZE': 100,
     })
     
     # Load the user configuration values
@@ -59,11 +113,23 @@ def create_app(config=None):
     if app.user_mode == 'single' and app.user_name is None:
         raise Exception("USER_NAME must be set in single user mode")
 
+    # Only indent JSON responses in debug mode, unless configured otherwise
+    if app.config['JSON_PRETTY'] is None:
+        app.config['JSON_PRETTY'] = app.debug
+
+    app.json_backend = JSONBackend(app.config['JSON_BACKEND'])
+
     @app.route('/')
     def home():
         """Returns information about the server"""
         return jsonify({'description': description, 'version': version})
 
+    @app.route('/outbox')
+    @require_admin
+    def outbox_status():
+        """Returns the depth and drain rate of the outbox"""
+        return jsonify(outbox_stats())
+
     @app.route('/coffee')
     def coffee():
         raise ImATeapot
@@ -77,11 +143,61 @@ def create_app(config=None):
     # Initialise the db for this app
     db.init_app(app)
 
+    # Remember the entities used by recent requests
+    entity_cache.configure(
+        maxsize=app.config['ENTITY_CACHE_SIZE'],
+        ttl=app.config['ENTITY_CACHE_TTL'])
+    link_cache.configure(maxsize=app.config['ENTITY_CACHE_SIZE'])
+
+    # Remember rendered profiles, optionally sharing them between processes
+    shared = None
+    if app.config['PROFILE_CACHE_URL'] is not None:
+        shared = RedisCache(
+            app.config['PROFILE_CACHE_URL'], prefix='tentd:profile:')
+    profile_cache.configure(
+        maxsize=app.config['PROFILE_CACHE_SIZE'],
+        ttl=app.config['PROFILE_CACHE_TTL'],
+        shared=shared)
+
+    # Remember keys briefly, as keys deleted by other processes are only
+    # forgotten when they expire
+    keypair_cache.configure(ttl=app.config['KEYPAIR_CACHE_TTL'])
+
+    # Remember the nonces of signed requests until their timestamps are stale
+    shared = None
+    if app.config['NONCE_CACHE_URL'] is not None:
+        shared = RedisCache(
+            app.config['NONCE_CACHE_URL'], prefix='tentd:nonce:')
+    nonce_cache.configure(
+        ttl=app.config['MAC_TIMESTAMP_SKEW'] * 2, shared=shared)
+
+    # Share a pool of connections between all outbound requests
+    http.init_app(app)
+
+    # Remember the entities that have been discovered
+    discovery_cache.configure(maxsize=app.config['DISCOVERY_CACHE_SIZE'])
+
+    # Send notifications to followers in the background
+    outbox.init_app(app)
+
+    # Store incoming notifications in batches
+    notifications.init_app(app)
+
+    # Count and time requests and deliveries for monitoring systems
+    metrics.init_app(app)
+
+    # Optionally record where the time spent on each request goes
+    profiler.init_app(app)
+
+    # Log slow database commands
+    monitor.init_app(app)
+
     # Register the blueprints
     app.register_blueprint(entity)
     app.register_blueprint(followers)
     app.register_blueprint(followings)
     app.register_blueprint(posts)
     app.register_blueprint(groups)
+    app.register_blueprint(timeline)
     
     return app
@@ -5,3 +5,4 @@ from tentd.blueprints.followers import followers
 from tentd.blueprints.followings import followings
 from tentd.blueprints.posts import posts
 from tentd.blueprints.groups import groups
+from tentd.blueprints.timeline import timeline
@@ -3,31 +3,69 @@
 from datetime import datetime
 
 
-from flask import json, request, g, make_response
+from flask import json, request, g, make_response, current_app
 from flask.views import MethodView
 
 from mongoengine import ValidationError
+from mongoengine.signals import post_save, post_delete
 
-from tentd.lib.flask import EntityBlueprint, jsonify
+from tentd.lib.flask import EntityBlueprint, jsonify, json_mimetype
+from tentd.lib.mongoengine import projected
+from tentd.utils.cache import Cache
 from tentd.utils.exceptions import APIBadRequest
-from tentd.utils.auth import require_authorization
-from tentd.documents import Notification
-from tentd.documents.profiles import Profile, CoreProfile
+from tentd.utils.auth import require_authorization, verify_request
+from tentd.utils.conditional import validators, not_modified, add_validators
+from tentd.utils.notifications import notifications
+from tentd.documents.profiles import (
+    Profile, CoreProfile, GenericProfile)
 
 entity = EntityBlueprint('entity', __name__)
 
+#: Rendered public profiles, keyed by entity id
+profile_cache = Cache()
+
+
+def _profile_changed(sender, document, **kwargs):
+    """Forget an entity's rendered profiles when one of its profiles is
+    saved or deleted"""
+    entity = document._data.get('entity')
+    profile_cache.delete(getattr(entity, 'id', entity))
+
+for cls in (CoreProfile, GenericProfile):
+    post_save.connect(_profile_changed, sender=cls)
+    post_delete.connect(_profile_changed, sender=cls)
+
 
 @entity.route_class('/profile', endpoint='profiles')
 class ProfilesView(MethodView):
     """The view for profile-based routes."""
 
     def get(self):
-        """Return the profiles belonging to the entity"""
-        # TODO: Use a proper query here
-        return jsonify({p.schema: p.to_json()
-                       for p in g.entity.profiles
-                       if 'public' in p.permissions
-                       and p.permissions['public']})
+        """Return the profiles belonging to the entity
+
+        The rendered profiles are cached until one of the entity's profiles
+        is saved or deleted."""
+        cached = profile_cache.get(g.entity.id)
+        if cached is None:
+            public = g.entity.profiles.public()
+
+            # Check the client's copy using only the ids and update times
+            etag, last_modified = validators(
+                public.only('id', 'updated_at').order_by('id'))
+            response = not_modified(etag, last_modified)
+            if response is not None:
+                return response
+
+            profiles = {p.schema: p.to_json() for p in projected(public)}
+            cached = profile_cache.set(
+                g.entity.id, (jsonify(profiles).data, etag, last_modified))
+
+        data, etag, last_modified = cached
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+        response = current_app.response_class(data, mimetype=json_mimetype())
+        return add_validators(response, etag, last_modified)
 
     @require_authorization
     def post(self):
@@ -46,10 +84,18 @@ class ProfilesView(MethodView):
 class ProfileView(MethodView):
     """The view for individual profile-based routes."""
 
-    @require_authorization
     def get(self, schema):
-        """Get a single profile."""
-        return jsonify(g.entity.profiles.get_or_404(schema=schema))
+        """Get a single profile.
+
+        Private profiles can only be fetched by authorized requests, and are
+        not found otherwise."""
+        profile = g.entity.profiles.visible(
+            verify_request(request)).get_or_404(schema=schema)
+        etag, last_modified = validators([profile])
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+        return add_validators(jsonify(profile), etag, last_modified)
 
     def put(self, schema):
         """Update a profile."""
@@ -87,14 +133,13 @@ class NotificationView(MethodView):
     def post(self):
         """Alerts of a notification.
 
-        This will create a new notification object in the database."""
+        The notification is buffered, and stored in the database with other
+        notifications received at around the same time."""
         post_data = request.json()
+        if not 'id' in post_data:
+            raise APIBadRequest("Notifications must include a post id")
 
-        notification = Notification()
-        notification.entity = g.entity
-        notification.post_id = post_data['id']
-        notification.received_at = datetime.utcnow()
-        notification.save()
+        notifications.add(g.entity, post_data['id'], post=post_data)
 
         # Return no data other than to say the request completed correctly.
         return make_response(), 200
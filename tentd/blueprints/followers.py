@@ -10,6 +10,7 @@ from tentd.utils import follow
 from tentd.lib.flask import EntityBlueprint, jsonify
 from tentd.utils.auth import require_authorization
 from tentd.utils.exceptions import APIBadRequest
+from tentd.utils.pagination import paginate
 from tentd.documents import Notification
 
 followers = EntityBlueprint('followers', __name__, url_prefix='/followers')
@@ -19,16 +20,35 @@ followers = EntityBlueprint('followers', __name__, url_prefix='/followers')
 class FollowersView(MethodView):
     """View for followers-based routes."""
 
+    @require_authorization
+    def get(self):
+        """Returns a page of followers, newest first
+
+        Followers include the servers notifications are sent to, so they are
+        only listed for authorized requests."""
+        return paginate(g.entity.followers)
+
     def post(self):
-        """Starts following a user, defined by the post data"""
-        return jsonify(follow.start_following(g.entity, request.json()))
+        """Starts following a user, defined by the post data
+
+        The response includes the credentials the follower signs its
+        requests with."""
+        follower = follow.start_following(g.entity, request.json())
+        keypair = follower.keypair
+        return jsonify(dict(
+            follower.to_json(),
+            mac_key_id=keypair.mac_id,
+            mac_key=keypair.mac_key,
+            mac_algorithm=keypair.mac_algorithm))
 
 
 @followers.route_class('/<string:follower_id>')
 class FollowerView(MethodView):
-    """View for follower-based routes."""
+    """View for follower-based routes.
+
+    Followers can read, update and delete their own relationship."""
 
-    decorators = [require_authorization]
+    decorators = [require_authorization(follower='follower_id')]
 
     def get(self, follower_id):
         """Returns the json representation of a follower"""
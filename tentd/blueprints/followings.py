@@ -6,36 +6,42 @@ from mongoengine import ValidationError
 
 from tentd.documents import Following
 from tentd.lib.flask import EntityBlueprint, jsonify
+from tentd.utils import follow
 from tentd.utils.auth import require_authorization
+from tentd.utils.conditional import (
+    conditional_request, validators, not_modified, add_validators)
 from tentd.utils.exceptions import APIBadRequest
+from tentd.utils.pagination import paginate
 
 followings = EntityBlueprint('followings', __name__, url_prefix='/followings')
 
 
 @followings.route('', methods=['GET'], endpoint='all')
 def get_all_followings():
-    # TODO: Queries - before_id, since_id, until_id, limit
-    return jsonify(g.entity.followings)
+    """Returns a page of followings, newest first"""
+    return paginate(g.entity.followings)
 
 
 @followings.route('', methods=['POST'], endpoint='new')
 @require_authorization
 def create_new_following():
-    # TODO: Discovery?
-    # TODO: Yes, discovery. This is currently almost useless.
-    new_following = Following(
-        entity=g.entity,
-        identity=request.json()['entity']
-    )
-    new_following.save()
-    return jsonify(new_following)
+    """Follows an entity, discovering it and sending it a follow request"""
+    return jsonify(follow.follow_entity(g.entity, request.json()['entity']))
 
 
 @followings.route('/<string:id>', methods=['GET'], endpoint='get')
 @require_authorization
 def get_following_by_id(id):
     """Returns the following"""
-    return jsonify(g.entity.followings.get_or_404(id=id))
+    # Check the client's copy without loading the whole following
+    if conditional_request():
+        response = not_modified(*validators([
+            g.entity.followings.only('updated_at').get_or_404(id=id)]))
+        if response is not None:
+            return response
+
+    following = g.entity.followings.get_or_404(id=id)
+    return add_validators(jsonify(following), *validators([following]))
 
 
 @followings.route(
@@ -4,6 +4,7 @@ from flask import json, request, g, abort, make_response
 from flask.views import MethodView
 
 from tentd.lib.flask import EntityBlueprint, jsonify
+from tentd.lib.mongoengine import projected
 from tentd.documents import Group
 
 groups = EntityBlueprint('groups', __name__, url_prefix='/groups')
@@ -12,7 +13,7 @@ groups = EntityBlueprint('groups', __name__, url_prefix='/groups')
 @groups.route_class('')
 class GroupsView(MethodView):
     def get(self):
-        return jsonify(g.entity.groups), 200
+        return jsonify(projected(g.entity.groups)), 200
 
     def post(self):
         return jsonify(Group(entity=g.entity, **request.json()).save())
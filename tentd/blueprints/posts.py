@@ -1,19 +1,38 @@
 """Post endpoints"""
 
-import requests
-
-from flask import json, request, g, abort, make_response
+from flask import json, request, g, abort, make_response, current_app
 from flask.views import MethodView
+from mongoengine import ValidationError
 
-from tentd.lib.flask import EntityBlueprint, jsonify
-from tentd.utils import follow
-from tentd.utils.exceptions import APIBadRequest
+from tentd.lib.flask import EntityBlueprint, jsonify, json_backend
+from tentd.lib.mongoengine import projected
+from tentd.utils import follow, batches
+from tentd.utils.exceptions import APIException, APIBadRequest
 from tentd.utils.auth import require_authorization
-from tentd.documents import Entity, Post, CoreProfile, Notification
+from tentd.utils.conditional import (
+    conditional_request, validators, not_modified, add_validators)
+from tentd.utils.outbox import enqueue, enqueue_many
+from tentd.utils.pagination import paginate
+from tentd.documents import Entity, Post, CoreProfile, Notification, Delivery
 
 posts = EntityBlueprint('posts', __name__, url_prefix='/posts')
 
 
+def new_post(data):
+    """Create a post from the JSON sent by an app, without saving it"""
+    if not isinstance(data, dict):
+        raise APIBadRequest("Posts must be JSON objects")
+    if not 'type' in data:
+        raise APIBadRequest("Posts must define a schema")
+    if 'received_at' in data:
+        raise APIBadRequest("You may not set received_at on a post")
+
+    data = dict(data)
+    post = Post(entity=g.entity, schema=data.pop('type'))
+    post.new_version(**data)
+    return post
+
+
 @posts.route_class('', endpoint='posts')
 class PostsView(MethodView):
     """ Routes relatings to posts. """
@@ -21,8 +40,8 @@ class PostsView(MethodView):
     decorators = [require_authorization]
 
     def get(self):
-        """Gets all posts"""
-        return jsonify(g.entity.posts)
+        """Gets a page of posts, newest first"""
+        return paginate(g.entity.posts)
 
     def post(self):
         """ Used by apps to create a new post.
@@ -33,32 +52,98 @@ class PostsView(MethodView):
         TODO: Separate between apps creating a new post and a notification
         from a non-followed entity.
         """
-        if not 'type' in request.json():
-            raise APIBadRequest("Posts must define a schema")
-        if 'received_at' in request.json():
-            raise APIBadRequest("You may not set received_at on a post")
-
-        post = Post(entity=g.entity, schema=request.json().pop('type'))
-        post.new_version(**request.json())
+        post = new_post(request.json())
         post.save()
 
-        # TODO: Do this asynchronously?
-        for to_notify in g.entity.followers:
-            notification_link = follow.get_notification_link(to_notify)
-            requests.post(notification_link, data=jsonify(post.to_json()))
-            # TODO: Handle failed notifications somehow
+        # Followers are notified by the outbox workers
+        enqueue(post)
 
         return jsonify(post)
 
 
-@posts.route_class('/<string:post_id>', endpoint='post')
-class PostsView(MethodView):
+@posts.route_class('/bulk', endpoint='bulk')
+class BulkPostsView(MethodView):
+    """Creates many posts at once, for importing posts from elsewhere"""
 
     decorators = [require_authorization]
 
+    #: The content type used to send one post per line
+    ndjson_mimetype = 'application/x-ndjson'
+
+    def post(self):
+        """Creates posts from a JSON array, or from one JSON post per line
+
+        Posts are inserted in batches of ``BULK_POSTS_BATCH_SIZE``, and the
+        followers are notified once for each batch, unless the ``notify``
+        query parameter is ``false``. Returns a list with the created post,
+        or an error, for each post in the request."""
+        results = []
+        batch_size = current_app.config['BULK_POSTS_BATCH_SIZE']
+        notify = request.args.get('notify', 'true').lower() != 'false'
+        for batch in batches(self.items(), batch_size):
+            results.extend(self.create(batch, notify))
+        return jsonify(results)
+
+    def items(self):
+        """Yield each post in the request, or the error raised decoding it"""
+        if request.mimetype == self.ndjson_mimetype:
+            backend = json_backend()
+            charset = request.mimetype_params.get('charset')
+            for line in request.stream:
+                if not line.strip():
+                    continue
+                try:
+                    yield backend.loads(line, charset)
+                except ValueError as error:
+                    yield APIBadRequest("Invalid JSON: {}".format(error))
+        else:
+            data = request.json()
+            if not isinstance(data, list):
+                raise APIBadRequest("Expected a JSON array of posts")
+            for item in data:
+                yield item
+
+    def create(self, batch, notify=True):
+        """Validate and insert a batch of posts, and notify the followers of
+        the new posts if ``notify`` is set"""
+        results, valid = [], []
+        for item in batch:
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                post = new_post(item)
+                post.validate()
+            except (APIException, ValidationError, TypeError) as error:
+                results.append({'error': getattr(
+                    error, 'description', None) or str(error)})
+            else:
+                results.append(post)
+                valid.append(post)
+
+        if valid:
+            Post.insert_many(valid)
+            if notify:
+                enqueue_many(valid)
+        return results
+
+
+@posts.route_class('/<string:post_id>', endpoint='post')
+class PostsView(MethodView):
+
+    @require_authorization(followers=True)
     def get(self, post_id):
-        return jsonify(g.entity.posts.get_or_404(id=post_id))
+        """Returns a post, which the entity's followers may also fetch"""
+        # Check the client's copy without loading the whole post
+        if conditional_request():
+            response = not_modified(*validators([
+                g.entity.posts.only('updated_at').get_or_404(id=post_id)]))
+            if response is not None:
+                return response
 
+        post = g.entity.posts.get_or_404(id=post_id)
+        return add_validators(jsonify(post), *validators([post]))
+
+    @require_authorization
     def put(self, post_id):
         post = g.entity.posts.get_or_404(id=post_id)
 
@@ -71,15 +156,19 @@ class PostsView(MethodView):
         # TODO: Versioning.
         return jsonify(post.save())
 
+    @require_authorization
     def delete(self, post_id):
         # TODO: Create a deleted post notification post(!)
         post = g.entity.posts.get_or_404(id=post_id)
         version_number = request.args.get('version', None)
         if version_number:
-            if len(post.versions) == 1:
+            if post.version_count == 1:
                 raise APIBadRequest("Cannot delete a posts last version")
-            del post.versions[int(version_number)]
-            post.save()
+            try:
+                post.delete_version(int(version_number))
+            except (ValueError, IndexError):
+                raise APIBadRequest(
+                    "Post has no version {}".format(version_number))
         else:
             post.delete()
         return make_response(), 200
@@ -90,11 +179,22 @@ class VersionsView(MethodView):
     decorators = [require_authorization]
 
     def get(self, post_id):
-        return jsonify(g.entity.posts.get_or_404(id=post_id).versions)
+        post = g.entity.posts.get_or_404(id=post_id)
+        return jsonify(post.stored_versions())
+
+
+@posts.route_class('/<string:post_id>/deliveries', endpoint='deliveries')
+class DeliveriesView(MethodView):
+    decorators = [require_authorization]
+
+    def get(self, post_id):
+        """Returns the delivery status of the post for each follower"""
+        post = g.entity.posts.get_or_404(id=post_id)
+        return jsonify(projected(Delivery.objects(post=post)))
 
 
 @posts.route_class('/<string:post_id>/mentions', endpoint='mentions')
 class MentionsView(MethodView):
     def get(self, post_id):
         return jsonify(
-            g.entity.posts.get_or_404(id=post_id).versions[0].mentions)
+            g.entity.posts.get_or_404(id=post_id).latest.mentions)
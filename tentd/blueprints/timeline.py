@@ -0,0 +1,18 @@
+"""Timeline endpoints"""
+
+from flask import g
+
+from tentd.lib.flask import EntityBlueprint
+from tentd.utils.auth import require_authorization
+from tentd.utils.pagination import paginate
+
+timeline = EntityBlueprint('timeline', __name__, url_prefix='/timeline')
+
+
+@timeline.route('', methods=['GET'], endpoint='timeline')
+@require_authorization
+def get_timeline():
+    """Returns a page of posts by followed entities, newest first
+
+    This is specific to pytentd."""
+    return paginate(g.entity.timeline)
@@ -3,6 +3,8 @@
 from flask.ext.mongoengine import MongoEngine
 from mongoengine import CASCADE, ReferenceField
 
+from tentd.utils import request_cache
+
 
 class EntityMixin(object):
     """A document mixin which attaches each document to an entity"""
@@ -10,32 +12,58 @@ class EntityMixin(object):
     #: The entity that owns the document
     entity = ReferenceField('Entity', required=True, dbref=False)
 
+    @property
+    def entity_identity(self):
+        """The identity of the entity that owns the document
+
+        Identities are remembered for the rest of the request, so that
+        serializing many documents owned by the same entity does not fetch
+        the entity and its core profile for each document."""
+        # Use the reference's id, to avoid dereferencing the entity
+        key = getattr(self._data.get('entity'), 'id', None)
+        identities = request_cache('identities')
+        if key is None or key not in identities:
+            return self.entity.identity
+        return identities[key]
+
 db = MongoEngine()
 
 # Ensure all models are loaded and imported into the current namespace
 from tentd.documents.auth import KeyPair
-from tentd.documents.post import Post
+from tentd.documents.post import Post, PostVersion
 from tentd.documents.profiles import Profile, CoreProfile, GenericProfile
 from tentd.documents.relationship import Follower, Following
 from tentd.documents.notification import Notification
 from tentd.documents.groups import Group
+from tentd.documents.outbox import Delivery
+from tentd.documents.timeline import TimelinePost
 
 # Some document types import others, and should be loaded last
 from tentd.documents.entity import Entity
 
 #: A tuple of all documents that provide a mongodb collection
 collections = (
-    KeyPair, Follower, Following, Post, Profile, Notification, Group, Entity)
+    KeyPair, Follower, Following, Post, PostVersion, Profile, Notification,
+    Group, Delivery, TimelinePost, Entity)
 
 # Create the deletion rules
 # CASCADE is used so that documents owned by an entity are deleted with it
 
 # Most documents are deleted with their entity
-for collection in (Follower, Following, Post, Profile):
+for collection in (
+        Follower, Following, Post, Profile, Delivery, TimelinePost):
     Entity.register_delete_rule(collection, 'entity', CASCADE)
 
 # KeyPairs are deleted with their owner
 Follower.register_delete_rule(KeyPair, 'owner', CASCADE)
+Entity.register_delete_rule(KeyPair, 'owner', CASCADE)
+
+# Versions are deleted with their post
+Post.register_delete_rule(PostVersion, 'post', CASCADE)
+
+# Pending deliveries are abandoned when the post or follower is deleted
+Post.register_delete_rule(Delivery, 'post', CASCADE)
+Follower.register_delete_rule(Delivery, 'follower', CASCADE)
 
 # Clean the namespace, as defining __all__ leads to problems
 del MongoEngine, ReferenceField, CASCADE
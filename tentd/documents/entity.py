@@ -6,10 +6,11 @@ from warnings import warn
 
 from mongoengine import *
 from mongoengine.queryset import DoesNotExist
-from mongoengine.signals import post_save
+from mongoengine.signals import post_save, post_delete
 
 from tentd.documents import *
-from tentd.utils import json_attributes, set_attributes
+from tentd.lib.mongoengine import projected
+from tentd.utils import json_attributes, set_attributes, request_cache
 
 class QuerySetProperty(object):
     """A set of documents belonging to an entity from another collection
@@ -40,14 +41,39 @@ class Entity(db.Document):
     followings = QuerySetProperty(Following)
     notifications = QuerySetProperty(Notification)
     groups = QuerySetProperty(Group)
+    timeline = QuerySetProperty(TimelinePost)
 
     @property
     def core(self):
-        """Fetch the core profile for the entity"""
-        try:
-            return Profile.objects.get(schema=CoreProfile.__schema__)
-        except DoesNotExist:
-            raise Exception("Entity has no core profile.")
+        """Fetch the core profile for the entity
+
+        This is remembered for the rest of the request."""
+        profiles = request_cache('core_profiles')
+        if self.id is None or self.id not in profiles:
+            try:
+                profile = Profile.objects.get(
+                    entity=self, schema=CoreProfile.__schema__)
+            except DoesNotExist:
+                raise Exception("Entity has no core profile.")
+            if self.id is None:
+                return profile
+            profiles[self.id] = profile
+        return profiles[self.id]
+
+    @property
+    def keypair(self):
+        """The KeyPair the entity's own applications sign requests with"""
+        return KeyPair.objects.get(owner=self)
+
+    @property
+    def identity(self):
+        """The canonical identity of the entity
+
+        This is remembered for the rest of the request."""
+        identities = request_cache('identities')
+        if self.id not in identities:
+            identities[self.id] = self.core.identity
+        return identities[self.id]
 
     @classmethod
     def new(cls, **kwargs):
@@ -77,10 +103,10 @@ class Entity(db.Document):
     def to_json(self):
         return json_attributes(self,
             'name',
-            'profiles',
-            'followers',
-            'followings',
-            'notifications')
+            ('profiles', projected),
+            ('followers', projected),
+            ('followings', projected),
+            ('notifications', projected))
 
     @staticmethod
     def post_save(sender, document, **kwargs):
@@ -90,4 +116,15 @@ class Entity(db.Document):
         except CoreProfile.DoesNotExist:
             CoreProfile(entity=document).save()
 
+    @staticmethod
+    def core_changed(sender, document, **kwargs):
+        """Signal function to forget a core profile remembered by the
+        current request when it is saved or deleted"""
+        entity = getattr(document._data.get('entity'), 'id', None)
+        request_cache('core_profiles').pop(entity, None)
+        request_cache('identities').pop(entity, None)
+
 post_save.connect(Entity.post_save, sender=Entity)
+post_save.connect(KeyPair.owner_post_save, sender=Entity)
+post_save.connect(Entity.core_changed, sender=CoreProfile)
+post_delete.connect(Entity.core_changed, sender=CoreProfile)
@@ -19,6 +19,9 @@ class Group(EntityMixin, db.Document):
         'indexes': ['name'],
     }
 
+    #: The fields used by to_json()
+    __json_fields__ = ('name', 'created_at')
+
     name = StringField(unique_with='entity')
     created_at = DateTimeField(default=datetime.now)
 
@@ -0,0 +1,98 @@
+"""Migrations of data stored by earlier versions of pytentd
+
+Each migration can be run more than once, and does nothing if there is no
+data left to migrate. Migrations are run with ``tentd --migrate``."""
+
+__all__ = [
+    'migrate', 'migrate_post_versions', 'remove_duplicate_notifications',
+    'create_entity_keypairs']
+
+from tentd.documents import Entity, KeyPair, Notification, Post, PostVersion
+from tentd.utils import batches
+
+
+def migrate_post_versions():
+    """Move the versions embedded in post documents into their own collection
+
+    Returns the number of posts migrated."""
+    posts = Post._get_collection()
+    versions = PostVersion._get_collection()
+
+    count = 0
+    for son in posts.find({'versions': {'$exists': True}}):
+        embedded = sorted(
+            son['versions'], key=lambda v: v['published_at'], reverse=True)
+
+        # Remove any versions left by an interrupted migration of this post
+        versions.remove({'post': son['_id']})
+        if embedded:
+            # Insert the oldest version first, so ties are ordered by id
+            versions.insert([{'post': son['_id'], 'version': version}
+                             for version in reversed(embedded)])
+
+        update = {
+            '$set': {'version_count': len(embedded)},
+            '$unset': {'versions': 1},
+        }
+        if embedded:
+            update['$set']['latest'] = embedded[0]
+        posts.update({'_id': son['_id']}, update)
+        count += 1
+    return count
+
+def remove_duplicate_notifications():
+    """Remove all but one notification of each post for each entity, so that
+    the unique index on entity and post id can be built
+
+    Returns the number of notifications removed."""
+    notifications = Notification._get_collection()
+    keys = [('entity', 1), ('post_id', 1)]
+
+    # There can't be any duplicates once the unique index exists
+    for info in notifications.index_information().itervalues():
+        if info['key'] == keys and info.get('unique'):
+            return 0
+
+    # A temporary index lets the notifications be sorted without holding
+    # them all in memory. It is dropped so that the unique index with
+    # the same keys can be built.
+    index = notifications.create_index(keys, name='migrate_duplicates')
+    try:
+        duplicates = []
+        previous = None
+        for son in notifications.find(
+                {}, fields=['entity', 'post_id']).sort(keys):
+            key = (son.get('entity'), son.get('post_id'))
+            if key == previous:
+                duplicates.append(son['_id'])
+            previous = key
+    finally:
+        notifications.drop_index(index)
+
+    for batch in batches(duplicates, 1000):
+        notifications.remove({'_id': {'$in': batch}})
+    return len(duplicates)
+
+def create_entity_keypairs():
+    """Create a KeyPair for each entity created before entities were given
+    one when saved
+
+    Returns the number of KeyPairs created."""
+    count = 0
+    for entity in Entity.objects.only('id'):
+        if not KeyPair.objects(owner=entity).count():
+            KeyPair(owner=entity).save()
+            count += 1
+    return count
+
+#: All migrations, in the order they are run
+migrations = (
+    migrate_post_versions, remove_duplicate_notifications,
+    create_entity_keypairs)
+
+
+def migrate():
+    """Run all migrations, yielding the name of each migration and the number
+    of documents it migrated"""
+    for migration in migrations:
+        yield migration.__name__, migration()
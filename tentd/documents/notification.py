@@ -10,5 +10,16 @@ from tentd.utils import time_to_string, json_attributes
 
 class Notification(EntityMixin, db.Document):
     """ A notification belonging to an Entity. """
+
+    #: The fields used by to_json()
+    __json_fields__ = ('post_id', 'received_at')
+
     received_at = DateTimeField(required=True)
-    post_id = StringField(required=True)
+
+    #: The id of the post, which is only stored once for each entity
+    post_id = StringField(required=True, unique_with='entity')
+
+    def to_json(self):
+        return json_attributes(self,
+            'post_id',
+            ('received_at', time_to_string))
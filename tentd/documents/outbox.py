@@ -0,0 +1,91 @@
+"""The outbox, holding notifications waiting to be sent to followers"""
+
+__all__ = ['Delivery']
+
+from datetime import datetime
+
+from mongoengine import *
+
+from tentd.documents import db, EntityMixin
+from tentd.utils import json_attributes, time_to_string
+
+
+class Delivery(EntityMixin, db.Document):
+    """A notification of a post that should be sent to a single follower
+
+    Deliveries are created when a post is published, and are sent by the
+    background workers in :mod:`tentd.utils.outbox`.
+    """
+
+    meta = {
+        'allow_inheritance': False,
+        'indexes': [
+            ('status', 'next_attempt_at'),
+            ('status', 'completed_at'),
+            ('post', 'follower'),
+        ],
+    }
+
+    #: The fields used by to_json()
+    __json_fields__ = (
+        'id', 'identity', 'status', 'attempts', 'last_error', 'created_at',
+        'next_attempt_at', 'completed_at')
+
+    #: The delivery has not yet been sent
+    PENDING = 'pending'
+
+    #: The delivery has been claimed by a worker
+    SENDING = 'sending'
+
+    #: The follower accepted the notification
+    DELIVERED = 'delivered'
+
+    #: The delivery was abandoned after too many attempts
+    FAILED = 'failed'
+
+    STATUSES = (PENDING, SENDING, DELIVERED, FAILED)
+
+    #: The post being sent
+    post = ReferenceField('Post', required=True, dbref=False)
+
+    #: The follower the post is being sent to
+    follower = ReferenceField('Follower', required=True, dbref=False)
+
+    #: The identity of the follower at the time the post was published
+    identity = StringField(required=True)
+
+    #: The host the notification is sent to, when the post was published
+    host = StringField()
+
+    status = StringField(required=True, default=PENDING, choices=STATUSES)
+
+    #: The number of times sending the notification has been attempted
+    attempts = IntField(required=True, default=0)
+
+    #: The error returned by the last failed attempt
+    last_error = StringField()
+
+    created_at = DateTimeField(required=True, default=datetime.now)
+
+    #: The earliest time the next attempt can be made
+    next_attempt_at = DateTimeField(required=True, default=datetime.now)
+
+    #: The time a worker claimed the delivery
+    locked_at = DateTimeField()
+
+    #: The time the delivery was delivered or abandoned
+    completed_at = DateTimeField()
+
+    def __repr__(self):
+        return "<Delivery: {} ({})>".format(self.identity, self.status)
+
+    def to_json(self):
+        return json_attributes(self,
+            'identity',
+            'status',
+            'attempts',
+            'last_error',
+            ('created_at', time_to_string),
+            ('next_attempt_at', time_to_string),
+            ('completed_at', time_to_string),
+            id=str(self.id))
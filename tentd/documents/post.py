@@ -1,10 +1,11 @@
 """Tentd post types"""
 
-__all__ = ['Post']
+__all__ = ['Post', 'PostVersion']
 
 from datetime import datetime
 
 from mongoengine import *
+from mongoengine.signals import pre_save, post_save
 
 from tentd.documents import db, EntityMixin
 from tentd.utils import time_to_string, json_attributes
@@ -70,6 +71,29 @@ class Version(db.EmbeddedDocument):
         }
 
 
+class PostVersion(db.Document):
+    """A version of a post, stored in its own collection
+
+    Only the latest version of a post is stored in the post document, so that
+    posts do not grow with each new version and listing posts does not load
+    their history."""
+
+    meta = {
+        'allow_inheritance': False,
+        'collection': 'post_version',
+        'indexes': [('post', '-version.published_at', '-id')],
+    }
+
+    #: The post this is a version of
+    post = ReferenceField('Post', required=True, dbref=False)
+
+    #: The version
+    version = EmbeddedDocumentField(Version, required=True)
+
+    def to_json(self):
+        return self.version.to_json()
+
+
 class Post(EntityMixin, db.Document):
     """A post belonging to an entity.
 
@@ -81,19 +105,29 @@ class Post(EntityMixin, db.Document):
 
     meta = {
         'allow_inheritance': False,
-        'indexes': ['schema'],
+        'indexes': ['schema', ('entity', '-id')],
     }
 
+    #: The fields used by to_json()
+    __json_fields__ = (
+        'id', 'entity', 'schema', 'latest', 'version_count', 'updated_at')
+
     #: The post type
     schema = URIField(required=True)
 
-    #: The versions of the post
-    versions = SortedListField(
-        EmbeddedDocumentField(Version),
-        ordering='published_at', reverse=True, required=True)
+    #: The latest version of the post
+    latest = EmbeddedDocumentField(Version, required=True)
+
+    #: The number of versions of the post
+    version_count = IntField(required=True, default=0)
+
+    #: The time the post was last changed
+    updated_at = DateTimeField(default=datetime.now)
 
     def __init__(self, **kwargs):
         super(Post, self).__init__(**kwargs)
+        #: Versions that will be stored when the post is next saved
+        self._new_versions = []
 
     @classmethod
     def new(cls, **k):
@@ -107,22 +141,86 @@ class Post(EntityMixin, db.Document):
         return post
 
     def new_version(self, **kwargs):
-        """Add a new version of the post"""
+        """Add a new version of the post
+
+        The version is stored when the post is saved."""
         version = Version(**kwargs)
-        self.versions.insert(0, version)
+        self._new_versions.append(version)
+        self.version_count += 1
+        if self.latest is None or \
+                version.published_at >= self.latest.published_at:
+            self.latest = version
         return version
 
+    def stored_versions(self):
+        """Return a queryset of the stored versions, newest first"""
+        return PostVersion.objects(post=self).order_by(
+            '-version.published_at', '-id')
+
     @property
-    def latest(self):
-        return self.versions[0]
+    def versions(self):
+        """All versions of the post, newest first"""
+        versions = [v.version for v in self.stored_versions()] \
+            if self.pk is not None else []
+        versions.extend(reversed(self._new_versions))
+        versions.sort(key=lambda v: v.published_at, reverse=True)
+        return versions
+
+    def delete_version(self, index):
+        """Delete a stored version, counting from the newest version"""
+        version = self.stored_versions().skip(index).first()
+        if version is None:
+            raise IndexError("Post has no version {}".format(index))
+        version.delete()
+
+        self.version_count -= 1
+        if index == 0:
+            self.latest = self.stored_versions().first().version
+        return self.save()
 
     def to_json(self):
         """Returns the post as a python dictonary"""
         json = {
             'id': self.id,
             'type': self.schema,
-            'entity': self.entity.core.identity,
-            'version': len(self.versions),
+            'entity': self.entity_identity,
+            'version': self.version_count,
         }
         json.update(self.latest.to_json())
         return json
+
+    @classmethod
+    def insert_many(cls, posts):
+        """Insert new posts and their versions using one insert for the posts
+        and one for the versions
+
+        Signals are not sent for the inserted posts, and the posts are not
+        validated. Returns the posts."""
+        ids = cls.objects.insert(posts, load_bulk=False)
+        for post, id in zip(posts, ids):
+            post.id = id
+        cls.store_versions(posts)
+        return posts
+
+    @staticmethod
+    def store_versions(posts):
+        """Store the versions created since each post was last saved"""
+        versions = [PostVersion(post=post, version=version)
+                    for post in posts for version in post._new_versions]
+        if versions:
+            PostVersion.objects.insert(versions, load_bulk=False)
+        for post in posts:
+            post._new_versions = []
+
+    @staticmethod
+    def pre_save(sender, document, **kwargs):
+        document.updated_at = datetime.now()
+
+    @staticmethod
+    def post_save(sender, document, **kwargs):
+        """Signal function to store the versions created since the post was
+        last saved"""
+        Post.store_versions([document])
+
+pre_save.connect(Post.pre_save, sender=Post)
+post_save.connect(Post.post_save, sender=Post)
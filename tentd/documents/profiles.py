@@ -2,8 +2,12 @@
 
 __all__ = ['Profile', 'CoreProfile', 'GenericProfile']
 
+from datetime import datetime
+
 from flask import current_app, url_for
+from flask.ext.mongoengine import BaseQuerySet
 from mongoengine import *
+from mongoengine.signals import pre_save
 
 from tentd import __tent_version__ as tent_version
 from tentd.documents import db, EntityMixin
@@ -11,6 +15,21 @@ from tentd.utils import json_attributes
 from tentd.lib.mongoengine import URIField
 
 
+class ProfileQuerySet(BaseQuerySet):
+    """Adds permission-aware queries to profile querysets"""
+
+    def public(self):
+        """Only select profiles that are visible to everyone"""
+        return self.filter(permissions__public=True)
+
+    def visible(self, authorized):
+        """Select the profiles a request can see
+
+        Authorized requests can see every profile, other requests can only
+        see public profiles."""
+        return self if authorized else self.public()
+
+
 class Profile(EntityMixin, db.Document):
     """A profile information type belonging to an entity
 
@@ -22,13 +41,24 @@ class Profile(EntityMixin, db.Document):
     meta = {
         'collection': 'profile',
         'allow_inheritance': True,
-        'indexes': ['schema'],
+        'queryset_class': ProfileQuerySet,
+        'indexes': [
+            'schema',
+            ('entity', 'schema'),
+            ('entity', 'permissions.public', 'schema'),
+        ],
     }
 
+    #: The fields that are never used by to_json()
+    __json_exclude__ = ('permissions',)
+
     #: The info type schema
     schema = URIField(unique_with='entity', required=True)
     permissions = DictField()
 
+    #: The time the profile was last changed
+    updated_at = DateTimeField(default=datetime.now)
+
     def __new__(cls, *args, **kwargs):
         """If ``schema`` is included in the argument list, return a profile
         object using the correct class."""
@@ -55,6 +85,10 @@ class Profile(EntityMixin, db.Document):
     def update_values(self, values):
         raise NotImplementedError("This class is abstract.")
 
+    @staticmethod
+    def pre_save(sender, document, **kwargs):
+        document.updated_at = datetime.now()
+
 
 class CoreProfile(Profile):
     """This model provides the Core profile info type.
@@ -110,3 +144,7 @@ class GenericProfile(db.DynamicDocument, Profile):
     def update_values(self, values):
         #TODO write this
         pass
+
+
+for cls in (CoreProfile, GenericProfile):
+    pre_save.connect(Profile.pre_save, sender=cls)
@@ -17,9 +17,12 @@ class Relationship(EntityMixin, db.Document):
     meta = {
         'abstract': True,
         'allow_inheritance': False,
-        'indexes': ['identity'],
+        'indexes': ['identity', ('entity', '-id')],
     }
 
+    #: The fields used by to_json()
+    __json_fields__ = ('id', 'identity', 'created_at', 'updated_at')
+
     #: The identity of the related entity
     identity = URIField(required=True, unique_with='entity')
 
@@ -55,6 +58,9 @@ class Relationship(EntityMixin, db.Document):
 class Follower(Relationship):
     """An entity following an Entity"""
 
+    __json_fields__ = Relationship.__json_fields__ + (
+        'servers', 'notification_path')
+
     #: The Server/API root of the follower
     servers = ListField(URIField(), required=True)
 
@@ -82,7 +88,12 @@ class Follower(Relationship):
 class Following(Relationship):
     """An entity being followed by an Entity"""
 
-    pass
+    #: The credentials the followed entity's server gave when the Entity
+    #: started following it, which are used to fetch its posts
+    mac_key_id = StringField()
+    mac_key = StringField()
+    mac_algorithm = StringField()
 
 post_save.connect(KeyPair.owner_post_save, sender=Follower)
 pre_save.connect(Relationship.pre_save, sender=Follower)
+pre_save.connect(Relationship.pre_save, sender=Following)
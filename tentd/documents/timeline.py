@@ -0,0 +1,88 @@
+"""The timeline of posts by entities an entity is following"""
+
+__all__ = ['TimelinePost']
+
+from datetime import datetime
+
+from mongoengine import *
+
+from tentd.documents import db, EntityMixin
+from tentd.lib.mongoengine import URIField
+from tentd.utils import json_attributes, time_to_string
+
+
+class TimelinePost(EntityMixin, db.Document):
+    """A post by a followed entity, stored in the timeline of the entity
+    following it
+
+    Posts are added to the timeline when a notification of the post is
+    received, so reading the timeline never requires fetching posts from
+    other servers.
+    """
+
+    meta = {
+        'allow_inheritance': False,
+        'collection': 'timeline',
+        'indexes': [('entity', '-id')],
+    }
+
+    #: The fields used by to_json()
+    __json_fields__ = (
+        'post_id', 'author', 'schema', 'version', 'content', 'mentions',
+        'published_at', 'received_at')
+
+    #: The id of the post on the author's server
+    post_id = StringField(required=True, unique_with=('entity', 'author'))
+
+    #: The identity of the entity that published the post
+    author = URIField(required=True)
+
+    #: The post type
+    schema = URIField(required=True)
+
+    #: The version of the post
+    version = IntField()
+
+    #: The content of the post
+    content = DictField()
+
+    #: The mentions of the post
+    mentions = ListField(DictField())
+
+    #: The time the post was published
+    published_at = DateTimeField()
+
+    #: The time the notification of the post was received
+    received_at = DateTimeField(required=True, default=datetime.utcnow)
+
+    @classmethod
+    def from_json(cls, entity, json, received_at=None):
+        """Create a timeline post from a post's JSON representation"""
+        published_at = json.get('published_at')
+        if published_at is not None:
+            published_at = datetime.fromtimestamp(published_at)
+
+        return cls(
+            entity=entity,
+            post_id=str(json['id']),
+            author=json['entity'],
+            schema=json['type'],
+            version=json.get('version'),
+            content=json.get('content', {}),
+            mentions=json.get('mentions', []),
+            published_at=published_at,
+            received_at=received_at or datetime.utcnow())
+
+    def __repr__(self):
+        return "<TimelinePost: {} {}>".format(self.author, self.post_id)
+
+    def to_json(self):
+        return json_attributes(self,
+            'version',
+            'content',
+            'mentions',
+            ('published_at', time_to_string),
+            ('received_at', time_to_string),
+            id=self.post_id,
+            entity=self.author,
+            type=self.schema)
@@ -3,15 +3,21 @@
 from __future__ import absolute_import
 
 from functools import wraps
+from importlib import import_module
+from types import GeneratorType
 
 from bson import ObjectId
 from flask import json, current_app, Request, Response, Blueprint, request
+from flask import has_app_context, stream_with_context
 from mongoengine.queryset import QuerySet
 from werkzeug.utils import cached_property
 
+from tentd.utils.auth import parse_authstring
 from tentd.utils.exceptions import APIBadRequest
 
-__all__ = ['Request', 'Response', 'Blueprint', 'JSONEncoder', 'jsonify']
+__all__ = [
+    'Request', 'Response', 'Blueprint', 'JSONEncoder', 'JSONBackend',
+    'jsonify']
 
 
 def cached_method(func):
@@ -40,10 +46,8 @@ class JSONMixin(object):
     def json(self):
         try:
             if self.mimetype in self.accepted_json_mimetypes:
-                request_charset = self.mimetype_params.get('charset')
-                if request_charset is not None:
-                    return json.loads(self.data, encoding=request_charset)
-                return json.loads(self.data)
+                return json_backend().loads(
+                    self.data, self.mimetype_params.get('charset'))
             else:
                 raise Exception("Response is not JSON")
         except Exception as error:
@@ -57,6 +61,16 @@ class JSONMixin(object):
 
 
 class Request(JSONMixin, Request):
+    @cached_property
+    def mac_authorization(self):
+        """The parsed MAC Authorization header, or None if there isn't one
+
+        This is only parsed once for each request"""
+        try:
+            return parse_authstring(self.headers.get('Authorization'))
+        except Exception:
+            return None
+
     def on_json_loading_failed(self, e):
         raise APIBadRequest(
             "The request data could not be parsed as JSON ({})".format(e))
@@ -94,9 +108,36 @@ class Blueprint(Blueprint):
         return decorator
 
 from flask import current_app, g, url_for
+from mongoengine.signals import pre_save, post_save, post_delete
 from tentd.documents import Entity
+from tentd.utils.cache import Cache
 from werkzeug.exceptions import NotFound
 
+#: The documents of entities used by EntityBlueprint, keyed by name. Each
+#: request builds its own Entity from the document, so that entities are not
+#: shared between threads.
+entity_cache = Cache()
+
+#: Entity profile Link headers, keyed by entity name and host
+link_cache = Cache()
+
+
+def _entity_renamed(sender, document, **kwargs):
+    """Forget all cached entities when an entity changes its name, as the
+    previous name is not known"""
+    if document.pk and 'name' in document._get_changed_fields():
+        entity_cache.clear()
+
+
+def _entity_changed(sender, document, **kwargs):
+    """Forget a cached entity when it is saved or deleted"""
+    entity_cache.delete(document.name)
+
+pre_save.connect(_entity_renamed, sender=Entity)
+post_save.connect(_entity_changed, sender=Entity)
+post_delete.connect(_entity_changed, sender=Entity)
+
+
 class EntityBlueprint(Blueprint):
     """A blueprint that provides g.entity, either using SINGLE_USER_MODE or
     an url prefix of ``/<entity>``
@@ -113,11 +154,14 @@ class EntityBlueprint(Blueprint):
     def _assign_global_entity(self, endpoint, values):
         """Assign the current entity to g.entity"""
         if endpoint:
-            try:
-                name = current_app.user_name or values.pop('entity')
-                g.entity = Entity.objects.get(name=name)
-            except Entity.DoesNotExist:
-                raise NotFound("The reqested entity was not found")
+            name = current_app.user_name or values.pop('entity')
+            son = entity_cache.get(name)
+            if son is None:
+                son = Entity._get_collection().find_one({'name': name})
+                if son is None:
+                    raise NotFound("The reqested entity was not found")
+                entity_cache.set(name, son)
+            g.entity = Entity._from_son(son)
 
     def _use_global_entity(self, endpoint, values):
         """Use g.entity as a default value in url_for calls"""
@@ -131,11 +175,20 @@ class EntityBlueprint(Blueprint):
             values.pop('entity', None)
 
     def _link_header(self, response):
-        """Add the entity link header to responses"""
+        """Add the entity link header to responses
+
+        The profile link is placed before any links added by the view"""
         if hasattr(g, 'entity'):
-            link = '<{}>; rel="https://tent.io/rels/profile"'.format(
-                url_for('entity.profiles', _external=True))
+            key = (g.entity.name, request.host_url)
+            link = link_cache.get(key)
+            if link is None:
+                link = link_cache.set(key,
+                    '<{}>; rel="https://tent.io/rels/profile"'.format(
+                        url_for('entity.profiles', _external=True)))
+            links = response.headers.getlist('Link')
             response.headers['Link'] = link
+            for other in links:
+                response.headers.add('Link', other)
         return response
 
     def register(self, app, options, *args):
@@ -166,19 +219,135 @@ class JSONEncoder(json.JSONEncoder):
         return super(JSONEncoder, self).default(obj)
 
 
-def jsonify(obj):
+class JSONBackend(object):
+    """Encodes and decodes JSON using one of several json modules
+
+    JSONEncoder.default() is used to encode objects with every module. For
+    modules that have no ``default`` hook, objects are converted to plain
+    dicts and lists before they are encoded.
+    """
+
+    #: The modules that can be used, and whether they have a default hook
+    modules = {
+        'json': True,
+        'simplejson': True,
+        'ujson': False,
+    }
+
+    def __init__(self, name='simplejson'):
+        if name not in self.modules:
+            raise ValueError("Unknown JSON backend '{}'".format(name))
+        self.name = name
+        self.module = import_module(name)
+        self.has_default_hook = self.modules[name]
+        self.encoder = JSONEncoder()
+
+    def __repr__(self):
+        return "<JSONBackend '{}'>".format(self.name)
+
+    def to_primitive(self, obj):
+        """Convert an object to dicts, lists and primitive values"""
+        if isinstance(obj, dict):
+            return {k: self.to_primitive(v) for k, v in obj.iteritems()}
+        if isinstance(obj, (list, tuple)):
+            return [self.to_primitive(v) for v in obj]
+        if obj is None or isinstance(obj, (basestring, int, long, float)):
+            return obj
+        return self.to_primitive(self.encoder.default(obj))
+
+    def dumps(self, obj, pretty=False):
+        """Encode an object, indented if ``pretty`` is set"""
+        if self.has_default_hook:
+            if pretty:
+                return self.module.dumps(obj, default=self.encoder.default,
+                    indent=2, separators=(',', ': '))
+            return self.module.dumps(obj, default=self.encoder.default,
+                separators=(',', ':'))
+
+        obj = self.to_primitive(obj)
+        if pretty:
+            return self.module.dumps(obj, indent=2)
+        return self.module.dumps(obj)
+
+    def loads(self, data, encoding=None):
+        """Decode a JSON document"""
+        if isinstance(data, str):
+            data = data.decode(encoding or 'utf-8')
+        return self.module.loads(data)
+
+
+def json_backend():
+    """Return the JSON backend used by the current application"""
+    if has_app_context():
+        return getattr(current_app, 'json_backend', default_json_backend)
+    return default_json_backend
+
+default_json_backend = JSONBackend()
+
+
+def iterencode_array(iterable, backend=None, pretty=False, chunk_size=100):
+    """Encode an iterable as a JSON array, yielding the output in chunks
+
+    Each chunk contains up to ``chunk_size`` items, so the whole array is
+    never held in memory at once."""
+    backend = backend or default_json_backend
+    if pretty:
+        padding = '  '
+        start, separator, end = '[\n', ',\n', '\n]'
+    else:
+        padding = ''
+        start, separator, end = '[', ',', ']'
+
+    chunk, empty = [start], True
+    for item in iterable:
+        if not empty:
+            chunk.append(separator)
+        chunk.append(padding + backend.dumps(item, pretty).replace(
+            '\n', '\n' + padding))
+        empty = False
+
+        if len(chunk) >= chunk_size * 2:
+            yield ''.join(chunk)
+            chunk = []
+
+    yield '[]' if empty else ''.join(chunk) + end
+
+
+def jsonify(obj, stream=None):
     """Similar to Flask's jsonify() function, but uses a single argument
     and doesn't coerce the arguments into a dictionary.
 
     Uses the mimetype of the request if possible, otherwise uses ``application/vnd.tent.v0+json``.
 
+    The output is encoded with ``current_app.json_backend``, and is only
+    indented if ``JSON_PRETTY`` is set.
+
+    QuerySets and generators are streamed, encoding each document as the
+    response is sent, unless ``stream`` is False. Other objects are only
+    streamed if ``stream`` is True.
+
     .. todo: Use current_app.json_encoder once Flask 0.10 is availible
     """
-    data = json.dumps(obj, cls=JSONEncoder, indent=2)
+    backend = json_backend()
+    pretty = current_app.config['JSON_PRETTY']
 
-    if request.mimetype in ['application/json', 'text/json']:
-        mimetype = request.mimetype
+    if stream is None:
+        stream = isinstance(obj, (QuerySet, GeneratorType))
+
+    if stream:
+        data = stream_with_context(iterencode_array(obj, backend, pretty,
+            chunk_size=current_app.config['JSON_STREAM_CHUNK_SIZE']))
     else:
-        mimetype = 'application/vnd.tent.v0+json'
-    
-    return current_app.response_class(data, mimetype=mimetype)
+        data = backend.dumps(obj, pretty)
+
+    return current_app.response_class(data, mimetype=json_mimetype())
+
+
+def json_mimetype():
+    """Return the mimetype used for JSON responses to the current request
+
+    Uses the mimetype of the request if possible, otherwise uses
+    ``application/vnd.tent.v0+json``."""
+    if request.mimetype in ['application/json', 'text/json']:
+        return request.mimetype
+    return 'application/vnd.tent.v0+json'
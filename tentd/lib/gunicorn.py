@@ -0,0 +1,64 @@
+"""Running tentd with gunicorn, a pre-forking WSGI server
+
+This requires the ``gunicorn`` package. Each worker process creates its own
+application, unless the application is preloaded, in which case it is
+created once by the master process before the workers are forked. pymongo
+discards the connections it inherits from the master process, and the
+outbox and notification threads are only started by the first request a
+worker handles, so preloading is safe.
+"""
+
+from __future__ import absolute_import
+
+from multiprocessing import cpu_count
+
+from gunicorn.app.base import BaseApplication
+
+from tentd.app import create_app
+from tentd.utils.notifications import notifications
+from tentd.utils.outbox import outbox
+
+__all__ = ['Server']
+
+
+def worker_exit(server, worker):
+    """Finish sending deliveries and store buffered notifications before a
+    worker exits"""
+    with worker.wsgi.app_context():
+        outbox.stop(worker.cfg.graceful_timeout)
+        notifications.stop(worker.cfg.graceful_timeout)
+
+
+class Server(BaseApplication):
+    """Serves tentd from several worker processes
+
+    ``options`` are gunicorn settings, such as ``workers``, ``threads``,
+    ``backlog``, ``keepalive`` and ``graceful_timeout``. Options that are
+    None are left at gunicorn's defaults, except for ``workers``, which
+    defaults to two for each processor."""
+
+    def __init__(self, config=None, options=None):
+        self.app_config = config
+        self.options = options or {}
+        super(Server, self).__init__()
+
+    def load_config(self):
+        options = dict(self.options)
+        if options.get('workers') is None:
+            options['workers'] = cpu_count() * 2
+        options['worker_exit'] = worker_exit
+
+        for key, value in options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        app = create_app(self.app_config)
+        if self.cfg.preload_app:
+            # Create the indexes once, rather than in every worker, by
+            # accessing each queryset's collection
+            from tentd.documents import collections
+            with app.app_context():
+                for document in collections:
+                    document.objects._collection
+        return app
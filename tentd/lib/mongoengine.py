@@ -5,10 +5,28 @@ from __future__ import absolute_import
 from rfc3987 import get_compiled_pattern
 from mongoengine import URLField
 
-__all__ = ['URIField']
+__all__ = ['URIField', 'projected']
 
 
 class URIField(URLField):
     """An inproved version of mongoengine.URLField"""
 
     _URL_REGEX = get_compiled_pattern('^%(URI)s$')
+
+
+def projected(queryset):
+    """Restrict a queryset to the fields its documents are serialized from
+
+    Documents can declare the fields their ``to_json()`` method reads with
+    ``__json_fields__``, or the fields it never reads with
+    ``__json_exclude__``. Other fields are not fetched from the database, so
+    serializing many documents does not load fields that are thrown away.
+    Querysets of documents that declare neither are returned unchanged."""
+    document = queryset._document
+    fields = getattr(document, '__json_fields__', None)
+    if fields is not None:
+        return queryset.only(*fields)
+    exclude = getattr(document, '__json_exclude__', None)
+    if exclude is not None:
+        return queryset.exclude(*exclude)
+    return queryset
@@ -0,0 +1,144 @@
+"""Monitoring of the commands sent to MongoDB
+
+pymongo 2.x has no command monitoring API, so the methods that send
+queries, getmores, writes and commands to the server are wrapped. The
+wrappers are only installed once a listener is added, and do nothing but
+call the original method while there are no listeners.
+"""
+
+from __future__ import absolute_import
+
+from functools import wraps
+from threading import Lock
+from time import time
+
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+from pymongo.database import Database
+
+__all__ = ['CommandEvent', 'add_listener', 'remove_listener']
+
+#: Functions called with a CommandEvent after each command
+listeners = []
+
+_installed = False
+_lock = Lock()
+
+
+class CommandEvent(object):
+    """A command that was sent to the database
+
+    ``name`` is one of query, getmore, insert, update, remove, or the name
+    of a database command such as count. ``spec`` is the query or command
+    document, ``sort`` is the sort order of a query, and ``duration`` the
+    number of seconds the command took."""
+
+    __slots__ = ('name', 'database', 'collection', 'spec', 'sort',
+                 'duration', 'failed')
+
+    def __init__(self, name, database, collection, spec, duration, failed,
+                 sort=None):
+        self.name = name
+        self.database = database
+        self.collection = collection
+        self.spec = spec
+        self.sort = sort
+        self.duration = duration
+        self.failed = failed
+
+    def __repr__(self):
+        return "<CommandEvent {} {}.{} ({:.1f}ms)>".format(
+            self.name, self.database, self.collection, self.duration * 1000)
+
+
+def add_listener(listener):
+    """Call a function after each command sent to the database"""
+    install()
+    if listener not in listeners:
+        listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in listeners:
+        listeners.remove(listener)
+
+
+def _notify(start, failed, name, database, collection, spec, sort=None):
+    event = CommandEvent(
+        name, database, collection, spec, time() - start, failed, sort)
+    for listener in listeners:
+        listener(event)
+
+
+def _monitor(method, describe):
+    """Wrap a method so that listeners are told about each call
+
+    ``describe`` is called with the method's arguments, and returns the
+    command name, database, collection and spec, and optionally the sort
+    order, or None if the call does not send a command."""
+    @wraps(method)
+    def monitored(self, *args, **kwargs):
+        if not listeners:
+            return method(self, *args, **kwargs)
+        command = describe(self, *args, **kwargs)
+        if command is None:
+            return method(self, *args, **kwargs)
+
+        start, failed = time(), True
+        try:
+            result = method(self, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _notify(start, failed, *command)
+    monitored.original = method
+    return monitored
+
+
+def _describe_refresh(cursor):
+    """Describe a cursor's query, or the getmore fetching its next batch"""
+    # Cursors only send a command when their buffer is empty, and the
+    # server has not said the cursor is exhausted
+    id = cursor._Cursor__id
+    if len(cursor._Cursor__data) or cursor._Cursor__killed or id == 0:
+        return None
+    collection = cursor.collection
+    return ('query' if id is None else 'getmore', collection.database.name,
+            collection.name, cursor._Cursor__spec, cursor._Cursor__ordering)
+
+
+def _describe_insert(collection, documents, *args, **kwargs):
+    # Only count the documents, as large inserts are not worth keeping
+    count = len(documents) if isinstance(documents, list) else 1
+    return ('insert', collection.database.name, collection.name,
+            {'documents': count})
+
+
+def _describe_write(name):
+    def describe(collection, spec=None, *args, **kwargs):
+        return name, collection.database.name, collection.name, spec
+    return describe
+
+
+def _describe_command(database, command, *args, **kwargs):
+    if isinstance(command, basestring):
+        return command, database.name, None, {command: 1}
+    name = next(iter(command))
+    collection = command[name] if isinstance(
+        command[name], basestring) else None
+    return name, database.name, collection, command
+
+
+def install():
+    """Wrap the pymongo methods that send commands, if not already done"""
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        Cursor._refresh = _monitor(Cursor._refresh, _describe_refresh)
+        Collection.insert = _monitor(Collection.insert, _describe_insert)
+        for name in ('update', 'remove'):
+            setattr(Collection, name, _monitor(
+                getattr(Collection, name), _describe_write(name)))
+        Database.command = _monitor(Database.command, _describe_command)
+        _installed = True
@@ -0,0 +1,99 @@
+"""A shared HTTP client for outbound federation requests"""
+
+from __future__ import absolute_import
+
+from threading import BoundedSemaphore, Lock
+from time import time
+from urlparse import urlparse
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from tentd import __version__ as version
+
+__all__ = ['HTTPClient', 'http']
+
+
+class HTTPClient(object):
+    """Sends requests to other tent servers using a single session
+
+    The session keeps a pool of keep-alive connections for each host, so
+    that the TCP and TLS handshakes are not repeated for every request. The
+    number of requests made to a host at the same time is limited by
+    ``HTTP_MAX_HOST_CONNECTIONS``, and ``HTTP_TIMEOUT`` applies to both
+    connecting and waiting for a response.
+
+    Functions in ``listeners`` are called after each request with the
+    method, the url, the number of seconds the request took and the response,
+    which is None if the request failed.
+    """
+
+    def __init__(self, app=None):
+        self.listeners = []
+        self.session = None
+        self.timeout = None
+        self.max_host_connections = None
+        self._semaphores = {}
+        self._lock = Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+
+        adapter = HTTPAdapter(
+            pool_connections=config['HTTP_POOL_HOSTS'],
+            pool_maxsize=config['HTTP_MAX_HOST_CONNECTIONS'])
+
+        session = Session()
+        session.headers['User-Agent'] = 'pytentd/{}'.format(version)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        self.session = session
+        self.timeout = config['HTTP_TIMEOUT']
+        self.max_host_connections = config['HTTP_MAX_HOST_CONNECTIONS']
+        self._semaphores = {}
+
+    def _semaphore(self, url):
+        """Return the semaphore limiting connections to the url's host"""
+        host = urlparse(url).netloc
+        try:
+            return self._semaphores[host]
+        except KeyError:
+            with self._lock:
+                return self._semaphores.setdefault(
+                    host, BoundedSemaphore(self.max_host_connections))
+
+    def request(self, method, url, **kwargs):
+        """Send a request, waiting for a free connection to the host"""
+        if self.session is None:
+            raise RuntimeError("The HTTP client has not been initialised")
+
+        kwargs.setdefault('timeout', self.timeout)
+        if not self.listeners:
+            with self._semaphore(url):
+                return self.session.request(method, url, **kwargs)
+
+        start, response = time(), None
+        try:
+            with self._semaphore(url):
+                response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            duration = time() - start
+            for listener in self.listeners:
+                listener(method, url, duration, response)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+http = HTTPClient()
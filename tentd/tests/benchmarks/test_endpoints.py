@@ -0,0 +1,181 @@
+"""Throughput and latency benchmarks for the API endpoints
+
+These are skipped unless py.test is run with ``--benchmark``, and use the
+``--mode`` option like the other tests, so ``--mode=all`` benchmarks each
+USER_MODE. Results are written as JSON to ``--benchmark-output``, and
+compared with the results in ``--benchmark-baseline`` if it is given.
+"""
+
+from datetime import datetime
+from json import dump, load
+from time import time
+
+from py.test import fixture, skip
+
+from tentd import __version__
+from tentd.documents import Follower, Following, Post, TimelinePost
+from tentd.tests.http import GET, SGET, POST, SPOST
+
+#: The number of documents to seed the database with
+POSTS = 10000
+FOLLOWERS = 5000
+FOLLOWINGS = 100
+TIMELINE = 1000
+
+#: The number of documents inserted at once when seeding
+BATCH_SIZE = 1000
+
+SCHEMA = 'https://tent.io/types/post/status/v0.1.0'
+
+
+@fixture(scope='session')
+def results(request):
+    """Collects the results of each benchmark, and writes them to a file at
+    the end of the session"""
+    if not request.config.getoption('benchmark'):
+        skip("Benchmarks are only run with --benchmark")
+
+    results = {'version': __version__, 'time': None, 'modes': {}}
+
+    @request.addfinalizer
+    def write_results():
+        results['time'] = datetime.utcnow().isoformat()
+        with open(request.config.getoption('benchmark_output'), 'w') as f:
+            dump(results, f, indent=2, sort_keys=True)
+
+    return results
+
+
+@fixture
+def baseline(request):
+    """The results of a previous run, or None"""
+    path = request.config.getoption('benchmark_baseline')
+    if path is None:
+        return None
+    with open(path) as f:
+        return load(f)
+
+
+def insert_batches(cls, documents):
+    """Insert documents in batches, without loading them back"""
+    for i in range(0, len(documents), BATCH_SIZE):
+        cls.objects.insert(documents[i:i + BATCH_SIZE], load_bulk=False)
+
+
+@fixture
+def seeded(results, app, entity, post, monkeypatch):
+    """Fill the database with a realistic volume of documents"""
+    monkeypatch.setitem(app.config, 'JSON_PRETTY', False)
+
+    posts = []
+    for i in range(POSTS):
+        posts.append(Post.new(
+            entity=entity, schema=SCHEMA,
+            content={'text': "Post number {}".format(i)}))
+        if len(posts) == BATCH_SIZE:
+            Post.insert_many(posts)
+            posts = []
+    if posts:
+        Post.insert_many(posts)
+
+    insert_batches(Follower, [Follower(
+        entity=entity,
+        identity='http://follower{}.example.com'.format(i),
+        servers=['http://follower{}.example.com/tentd'.format(i)],
+        notification_path='notification') for i in range(FOLLOWERS)])
+
+    insert_batches(Following, [Following(
+        entity=entity,
+        identity='http://following{}.example.com'.format(i))
+        for i in range(FOLLOWINGS)])
+
+    insert_batches(TimelinePost, [TimelinePost(
+        entity=entity,
+        post_id=str(i),
+        author='http://following{}.example.com'.format(i % FOLLOWINGS),
+        schema=SCHEMA,
+        content={'text': "Timeline post {}".format(i)})
+        for i in range(TIMELINE)])
+
+    return entity
+
+
+def notification(i):
+    return {
+        'id': 'notification-{}'.format(i),
+        'entity': 'http://following0.example.com',
+        'type': SCHEMA,
+        'content': {'text': "Notification {}".format(i)},
+    }
+
+
+def endpoints(post):
+    """The endpoints to benchmark
+
+    Each is a name, the number of requests to make, and a function making
+    the i'th request."""
+    return [
+        ('GET /profile', 500, lambda i: GET('entity.profiles')),
+        ('GET /posts', 200, lambda i: SGET('posts.posts')),
+        ('GET /posts/<id>', 500,
+            lambda i: SGET('posts.post', post_id=post.id)),
+        ('GET /followers', 200, lambda i: SGET('followers.followers')),
+        ('GET /followings', 200, lambda i: GET('followings.all')),
+        ('GET /timeline', 200, lambda i: SGET('timeline.timeline')),
+        ('POST /notification', 500,
+            lambda i: POST('entity.notification', notification(i))),
+        ('POST /posts', 20, lambda i: SPOST('posts.posts', {
+            'type': SCHEMA, 'content': {'text': "New post {}".format(i)}})),
+    ]
+
+
+def percentile(values, fraction):
+    """Return a percentile of a sorted list"""
+    return values[int(round((len(values) - 1) * fraction))]
+
+
+def measure(count, make_request):
+    """Make requests, returning the throughput and latency percentiles"""
+    latencies = []
+    start = time()
+    for i in range(count):
+        before = time()
+        response = make_request(i)
+        latencies.append(time() - before)
+        assert response.status_code == 200
+    elapsed = time() - start
+
+    latencies.sort()
+    return {
+        'requests': count,
+        'rps': count / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def regressions(mode, results, baseline, threshold):
+    """Describe each endpoint that is slower than the baseline"""
+    previous = baseline.get('modes', {}).get(mode, {})
+    for name, result in sorted(results.items()):
+        if name not in previous:
+            continue
+        before = previous[name]
+        if result['rps'] < before['rps'] * (1 - threshold):
+            yield "{} {}: {:.1f} requests/s, was {:.1f}".format(
+                mode, name, result['rps'], before['rps'])
+        if result['p99_ms'] > before['p99_ms'] * (1 + threshold):
+            yield "{} {}: p99 {:.1f}ms, was {:.1f}ms".format(
+                mode, name, result['p99_ms'], before['p99_ms'])
+
+
+def test_endpoints(request, results, baseline, app, seeded, post):
+    """Benchmark each endpoint in the current USER_MODE"""
+    mode = results['modes'].setdefault(app.user_mode, {})
+    for name, count, make_request in endpoints(post):
+        mode[name] = measure(count, make_request)
+
+    if baseline is not None:
+        threshold = request.config.getoption('benchmark_threshold')
+        slower = list(regressions(app.user_mode, mode, baseline, threshold))
+        assert not slower, "Benchmarks regressed:\n" + "\n".join(slower)
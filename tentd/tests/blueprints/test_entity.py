@@ -1,18 +1,20 @@
 """Tests for the entity blueprint"""
 
-import requests
-
 from flask import current_app, g
 from mongoengine import ValidationError
 from py.test import fixture, mark, raises
 from werkzeug.exceptions import NotFound
 
+from tentd.blueprints.entity import profile_cache
 from tentd.documents.entity import Entity, Follower
 from tentd.documents.profiles import CoreProfile, GenericProfile
+from tentd.lib.requests import http
 from tentd.tests import profile_url_for, response_has_link_header
-from tentd.tests.http import DELETE, GET, HEAD, PUT, POST, SPOST
+from tentd.tests.http import (
+    DELETE, GET, HEAD, PUT, POST, SPOST, signed_with)
 from tentd.tests.mock import MockFunction, MockResponse
 from tentd.utils.exceptions import APIBadRequest, RequestDidNotValidate
+from tentd.utils.outbox import drain
 
 def test_404_on_absent_entity(app):
     """Test that profile pages for entities that don't exist 404"""
@@ -38,12 +40,55 @@ class TestProfileBlueprint:
         assert core_profile['servers'] == entity.core.servers
         assert core_profile['tent_version'] == '0.2'
 
+    def test_profile_not_modified(self, entity):
+        """Test that /profile is not sent again if the client has it"""
+        etag = GET('entity.profiles').headers['ETag']
+        response = GET('entity.profiles', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        # Changing a profile changes the ETag
+        entity.core.save()
+        response = GET('entity.profiles', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+    def test_profile_cached(self, entity):
+        """Test that rendered profiles are cached until a profile changes"""
+        response = GET('entity.profiles')
+        assert profile_cache.get(entity.id)[0] == response.data
+
+        PUT('entity.profile', {'data': 'test'}, secure=True,
+            schema='https://testprofile.example.com/')
+        assert profile_cache.get(entity.id) is None
+
     def test_single_profile(self, entity):
         """Test that getting a single profile works"""
         core_profile = GET(
             'entity.profile', secure=True, schema=CoreProfile.__schema__)
         assert core_profile.json() == entity.core.to_json()
 
+    def test_private_profile(self, entity):
+        """Test that private profiles are only visible when authorized"""
+        schema = 'https://tent.io/types/info/example/v0.0.0'
+        GenericProfile(entity=entity, schema=schema, a='b').save()
+
+        assert schema not in GET('entity.profiles').json()
+        assert GET('entity.profile', schema=CoreProfile.__schema__).json()
+        with raises(NotFound):
+            GET('entity.profile', schema=schema)
+        assert GET('entity.profile', secure=True, schema=schema).json()
+
+    def test_private_profile_foreign_key(self, entity, follower):
+        """Test that keys owned by others only see public profiles"""
+        schema = 'https://tent.io/types/info/example/v0.0.0'
+        GenericProfile(entity=entity, schema=schema, a='b').save()
+
+        other = Entity.new(name='other', identity='http://other.example.com')
+        other.save()
+        for keypair in (follower.keypair, other.keypair):
+            headers = signed_with(keypair, 'entity.profile', schema=schema)
+            with raises(NotFound):
+                GET('entity.profile', schema=schema, headers=headers)
+
     def test_missing_single_profile(self, entity):
         """Test that getting a non-existant profile fails."""
         with raises(NotFound):
@@ -124,16 +169,16 @@ class TestProfileBlueprint:
 def notification_mocks(request, follower, monkeypatch):
     follower_api_root = follower.identity + '/tentd'
     
-    monkeypatch.setattr(requests, 'head', MockFunction())
+    monkeypatch.setattr(http, 'head', MockFunction())
 
-    requests.head[follower.identity] = MockResponse(
+    http.head[follower.identity] = MockResponse(
         headers={'Link':
             '<{}/profile>; rel="https://tent.io/rels/profile"'\
             .format(follower_api_root)})
 
-    monkeypatch.setattr(requests, 'get', MockFunction())
+    monkeypatch.setattr(http, 'get', MockFunction())
 
-    requests.get[follower_api_root + '/profile'] = MockResponse(
+    http.get[follower_api_root + '/profile'] = MockResponse(
         json={
             "https://tent.io/types/info/core/v0.1.0": {
                 "entity": follower.identity,
@@ -141,19 +186,13 @@ def notification_mocks(request, follower, monkeypatch):
                 "licences": [],
                 "tent_version": "0.2"}})
 
-    monkeypatch.setattr(requests, 'post', MockFunction())
+    monkeypatch.setattr(http, 'post', MockFunction())
     
-    requests.post[follower_api_root + '/notification'] = MockResponse()
-
-    assert isinstance(requests.head, MockFunction)
-    assert isinstance(requests.post, MockFunction)
-    assert isinstance(requests.get, MockFunction)
+    http.post[follower_api_root + '/notification'] = MockResponse()
 
-    @request.addfinalizer
-    def teardown_notification_mocks():
-        monkeypatch.delattr(requests, 'head')
-        monkeypatch.delattr(requests, 'post')
-        monkeypatch.delattr(requests, 'get')
+    assert isinstance(http.head, MockFunction)
+    assert isinstance(http.post, MockFunction)
+    assert isinstance(http.get, MockFunction)
 
 def test_entity_header_notification(entity, notification_mocks):
     """Test the entity header is returned from the notifications route."""
@@ -167,9 +206,14 @@ def test_notified_of_new_post(follower, notification_mocks):
             'text': 'test',
             'location': None}})
 
+    # Notifications are sent by the outbox
+    assert http.post.was_not_called(
+        follower.identity + '/tentd/notification')
+    drain()
+
     # TODO: Actually store the follower's servers
     follower_notification_path = follower.identity + '/tentd/notification'
-    assert requests.post.was_called(follower_notification_path)
+    assert http.post.was_called(follower_notification_path)
 
 def test_notification_created(entity):
     """Test that a notification is raised correctly."""
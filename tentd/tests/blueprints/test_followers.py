@@ -1,13 +1,14 @@
 """Tests for the followers blueprint"""
 
-import requests
-
 from flask import json
 from py.test import raises, fixture
 
 from tentd.documents.entity import Follower
-from tentd.tests.http import POST, SPUT, SDELETE
+from tentd.lib.requests import http
+from tentd.tests.http import (
+    DELETE, GET, POST, PUT, SGET, SPUT, SDELETE, signed_with)
 from tentd.tests.mock import MockFunction, MockResponse
+from tentd.utils.auth import InvalidAuthentication
 from tentd.utils.exceptions import APIBadRequest
 
 PROFILE_FORMAT = '<{}/profile>; rel="https://tent.io/rels/profile"'
@@ -17,15 +18,15 @@ def follower_mocks(request, monkeypatch):
     follower_identity = 'http://follower.example.com'
     follower_api_root = 'http://follower.example.com/tentd'
 
-    monkeypatch.setattr(requests, 'head', MockFunction())
+    monkeypatch.setattr(http, 'head', MockFunction())
 
-    requests.head[follower_identity] = MockResponse(
+    http.head[follower_identity] = MockResponse(
         headers={'Link': PROFILE_FORMAT.format(follower_api_root)})
 
-    monkeypatch.setattr(requests, 'get', MockFunction())
+    monkeypatch.setattr(http, 'get', MockFunction())
 
-    requests.get[follower_api_root + '/notification'] = MockResponse()
-    requests.get[follower_api_root + '/profile'] = MockResponse(
+    http.get[follower_api_root + '/notification'] = MockResponse()
+    http.get[follower_api_root + '/profile'] = MockResponse(
         json={
             "https://tent.io/types/info/core/v0.1.0": {
                 "entity": follower_identity,
@@ -34,13 +35,8 @@ def follower_mocks(request, monkeypatch):
                 "tent_version": "0.2",
             }})
 
-    assert isinstance(requests.head, MockFunction)
-    assert isinstance(requests.get, MockFunction)
-
-    @request.addfinalizer
-    def teardown_mocks():
-        monkeypatch.delattr(requests, 'head')
-        monkeypatch.delattr(requests, 'get')
+    assert isinstance(http.head, MockFunction)
+    assert isinstance(http.get, MockFunction)
 
     return {
         'identity': follower_identity,
@@ -53,11 +49,11 @@ def new_follower_mocks(request, follower_mocks):
     new_follower_identity = 'http://changed.follower.example.com'
     new_follower_api_root = 'http://changed.follower.example.com/tentd'
 
-    requests.head[new_follower_identity] = MockResponse(
+    http.head[new_follower_identity] = MockResponse(
         headers={'Link': PROFILE_FORMAT.format(new_follower_api_root)})
 
-    requests.get[new_follower_api_root + '/notification'] = MockResponse()
-    requests.get[new_follower_api_root + '/profile'] = MockResponse(
+    http.get[new_follower_api_root + '/notification'] = MockResponse()
+    http.get[new_follower_api_root + '/profile'] = MockResponse(
         json={
             "https://tent.io/types/info/core/v0.1.0": {
                 "entity": 'http://changed.follower.example.com',
@@ -83,16 +79,20 @@ def test_create_follower(entity, follower_mocks):
     })
 
     # Ensure the follower was created in the DB.
-    Follower.objects.get(id=response.json()['id'])
+    follower = Follower.objects.get(id=response.json()['id'])
+
+    # The follower is given the credentials to sign its requests with
+    assert response.json()['mac_key_id'] == follower.keypair.mac_id
+    assert response.json()['mac_key'] == follower.keypair.mac_key
 
     # Ensure the notification path was called
-    assert requests.get.was_called(follower_mocks['notification_path'])
+    assert http.get.was_called(follower_mocks['notification_path'])
 
 def test_create_invalid_follower(entity, follower_mocks):
     """Test that trying to follow an invalid entity will fail."""
     with raises(APIBadRequest):
         POST('followers.followers', '<invalid>')
-    assert requests.get.was_not_called(follower_mocks['notification_path'])
+    assert http.get.was_not_called(follower_mocks['notification_path'])
 
 def test_update_follower(entity, follower, new_follower_mocks):
     """Test that the following relationship can be edited correctly."""
@@ -106,10 +106,53 @@ def test_update_follower(entity, follower, new_follower_mocks):
     assert new_follower_mocks['new_identity'] == response.json()['entity']
     assert new_follower_mocks['new_identity'] == updated_follower.identity
 
+def test_get_followers(follower):
+    """Test that followers can be listed"""
+    response = SGET('followers.followers')
+    assert response.json()[0]['entity'] == follower.identity
+
+def test_get_followers_unauthorized(follower):
+    """Test that followers' servers aren't listed for unsigned requests"""
+    with raises(InvalidAuthentication):
+        GET('followers.followers')
+
+def test_get_followers_limit(entity, follower):
+    Follower(
+        entity=entity,
+        identity='http://another.follower.example.com',
+        servers=['http://another.follower.example.com/tentd'],
+        notification_path='notification').save()
+    assert len(SGET('followers.followers', limit=1).json()) == 1
+
 def test_delete_follower(follower):
     SDELETE('followers.follower', follower_id=follower.id)
     assert Follower.objects.count() == 0
 
+def test_follower_updates_itself(follower):
+    """Test that a follower can use its own KeyPair on its relationship"""
+    headers = signed_with(
+        follower.keypair, 'followers.follower', 'PUT', follower_id=follower.id)
+    response = PUT('followers.follower', follower_id=follower.id,
+                   data={'licenses': []}, headers=headers)
+    assert response.json()['id'] == str(follower.id)
+
+    headers = signed_with(follower.keypair, 'followers.follower', 'DELETE',
+                          follower_id=follower.id)
+    DELETE('followers.follower', follower_id=follower.id, headers=headers)
+    assert Follower.objects.count() == 0
+
+def test_follower_key_other_follower(entity, follower):
+    """Test that a follower's KeyPair can't be used on other followers"""
+    other = Follower(
+        entity=entity,
+        identity='http://another.follower.example.com',
+        servers=['http://another.follower.example.com/tentd'],
+        notification_path='notification').save()
+    headers = signed_with(
+        follower.keypair, 'followers.follower', follower_id=other.id)
+    with raises(InvalidAuthentication):
+        GET('followers.follower', follower_id=other.id, headers=headers)
+
 def test_delete_missing_follower(entity):
     """Test that trying to stop following a non-existent user fails."""
     with raises(APIBadRequest):
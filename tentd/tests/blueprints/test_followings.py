@@ -6,6 +6,7 @@ from flask import json
 from py.test import raises, fixture, mark
 
 from tentd.documents.entity import Following
+from tentd.lib.requests import http
 from tentd.tests.http import GET, SGET, POST, SPOST, SDELETE
 from tentd.tests.mock import MockFunction, MockResponse
 from tentd.utils.exceptions import APIBadRequest
@@ -21,13 +22,50 @@ def test_get_following_by_identity(following):
     response = SGET('followings.get_identity', identity=following.identity)
     assert response.json()['entity'] == following.identity
 
-@mark.xfail(reason="No discovery is attempted")
-def test_create_following(entity):
+def test_create_following(entity, monkeypatch):
+    """Test that following an entity stores the credentials it gives"""
     identity = 'http://following.example.com'
-    SPOST('followings.new', data={'entity': identity})
+    api_root = identity + '/tentd'
+    for method in ('head', 'get', 'post'):
+        monkeypatch.setattr(http, method, MockFunction())
+    http.head[identity] = MockResponse(headers={
+        'Link': '<{}/profile>; rel="https://tent.io/rels/profile"'.format(
+            api_root)})
+    http.get[api_root + '/profile'] = MockResponse(json={
+        'https://tent.io/types/info/core/v0.1.0': {
+            'entity': identity,
+            'servers': [api_root]}})
+    http.post[api_root + '/followers'] = MockResponse(json={
+        'id': 'abc',
+        'mac_key_id': 'a:1234',
+        'mac_key': 'secret',
+        'mac_algorithm': 'hmac-sha-256'})
+
+    response = SPOST('followings.new', data={'entity': identity})
     following = Following.objects.get(identity=identity)
+    assert response.json()['id'] == str(following.id)
+    assert 'mac_key' not in response.json()
+    assert (following.mac_key_id, following.mac_key) == ('a:1234', 'secret')
 
 def test_delete_following(following):
     SDELETE('followings.delete', id=following.id)
     assert following not in Following.objects.all()
-    
\ No newline at end of file
+
+def test_get_followings_page(entity):
+    followings = [Following(
+        entity=entity,
+        identity='http://following{}.example.com'.format(i)).save()
+        for i in range(5)]
+
+    response = GET('followings.all', limit=2, before_id=followings[4].id)
+    assert [f['entity'] for f in response.json()] == [
+        followings[3].identity, followings[2].identity]
+    assert 'rel="next"' in response.headers.getlist('Link')[-1]
+
+
+def test_get_following_not_modified(following):
+    """Test that a following is not sent again if the client has it"""
+    response = SGET('followings.get', id=following.id)
+    response = SGET('followings.get', id=following.id, headers={
+        'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
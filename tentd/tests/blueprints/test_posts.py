@@ -1,10 +1,12 @@
 """Tests for the entity blueprint"""
 
+from urlparse import parse_qs, urlparse
+
 from flask import url_for, json, current_app
-from py.test import mark, raises
+from py.test import fixture, mark, raises
 from werkzeug.exceptions import NotFound
 
-from tentd.documents.entity import Post
+from tentd.documents import Post, Delivery
 from tentd.lib.flask import jsonify
 from tentd.tests import response_has_link_header
 from tentd.tests.http import *
@@ -103,7 +105,169 @@ def test_delete_post_version(entity, post):
     with raises(APIBadRequest):
         SDELETE('posts.post', post_id=post.id, version=0)
 
+def test_delete_missing_post_version(post):
+    """Test that deleting a version that does not exist fails"""
+    with raises(APIBadRequest):
+        SDELETE('posts.post', post_id=post.id, version=5)
+
+def test_bulk_create_posts(entity, follower):
+    """Test that posts can be created from a JSON array"""
+    data = [{
+        'type': 'https://tent.io/types/post/status/v0.1.0',
+        'content': {'text': "Post {}".format(i)},
+    } for i in range(3)]
+    response = SPOST('posts.bulk', data=data)
+
+    assert [p['content']['text'] for p in response.json()] == \
+        ["Post 0", "Post 1", "Post 2"]
+    assert entity.posts.count() == 3
+    assert Delivery.objects(follower=follower).count() == 3
+
+def test_bulk_create_posts_without_notifying(entity, follower):
+    """Test that imported posts can be created without notifying followers"""
+    data = [{
+        'type': 'https://tent.io/types/post/status/v0.1.0',
+        'content': {'text': "Post {}".format(i)},
+    } for i in range(3)]
+    SPOST('posts.bulk', data=data, notify='false')
+
+    assert entity.posts.count() == 3
+    assert Delivery.objects(follower=follower).count() == 0
+
+def test_bulk_create_posts_errors(entity):
+    """Test that invalid posts are reported without stopping the import"""
+    data = [
+        {'content': {'text': "No type"}},
+        {'type': 'https://tent.io/types/post/status/v0.1.0',
+         'content': {'text': "Valid"}},
+    ]
+    results = SPOST('posts.bulk', data=data).json()
+
+    assert 'error' in results[0]
+    assert results[1]['content']['text'] == "Valid"
+    assert entity.posts.count() == 1
+
+def test_bulk_create_posts_ndjson(app, entity, monkeypatch):
+    """Test that posts can be sent one per line, in batches"""
+    monkeypatch.setitem(app.config, 'BULK_POSTS_BATCH_SIZE', 2)
+    lines = [json.dumps({
+        'type': 'https://tent.io/types/post/status/v0.1.0',
+        'content': {'text': "Post {}".format(i)},
+    }) for i in range(3)]
+    lines.insert(1, "not json")
+    response = SPOST('posts.bulk', data="\n".join(lines),
+                     content_type='application/x-ndjson')
+
+    results = response.json()
+    assert len(results) == 4
+    assert 'error' in results[1]
+    assert entity.posts.count() == 3
+    for post in entity.posts:
+        assert len(post.versions) == 1
+
+def test_bulk_create_posts_not_array(entity):
+    with raises(APIBadRequest):
+        SPOST('posts.bulk', data={'type': 'https://tent.io/types/post/'})
+
 def test_delete_invalid_post(entity):
     """Test that attempting to delete a non-existant post fails."""
     with raises(NotFound):
         SDELETE('posts.post', post_id='invalid')
+
+@fixture
+def many_posts(request, entity):
+    """Ten posts, newest first"""
+    posts = [Post.new(
+        entity=entity,
+        schema='https://tent.io/types/post/status/v0.1.0',
+        content={'text': "Post {}".format(i)}).save() for i in range(10)]
+    posts.reverse()
+    return posts
+
+def ids(response):
+    return [post['id'] for post in response.json()]
+
+def test_get_posts_newest_first(many_posts):
+    expected = [str(p.id) for p in many_posts]
+    assert ids(SGET('posts.posts')) == expected
+
+def test_get_posts_limit(many_posts):
+    response = SGET('posts.posts', limit=3)
+    assert ids(response) == [str(p.id) for p in many_posts[:3]]
+    assert 'rel="next"' in response.headers.getlist('Link')[1]
+
+def test_get_posts_max_limit(app, many_posts, monkeypatch):
+    monkeypatch.setitem(app.config, 'PAGINATION_MAX_LIMIT', 2)
+    assert len(SGET('posts.posts', limit=5).json()) == 2
+
+def test_get_posts_before_id(many_posts):
+    response = SGET('posts.posts', before_id=many_posts[2].id, limit=3)
+    assert ids(response) == [str(p.id) for p in many_posts[3:6]]
+
+def test_get_posts_since_id(many_posts):
+    """Test that since_id returns the posts closest to the id"""
+    response = SGET('posts.posts', since_id=many_posts[5].id, limit=3)
+    assert ids(response) == [str(p.id) for p in many_posts[2:5]]
+
+def test_get_posts_until_id(many_posts):
+    """Test that until_id returns the newest posts after the id"""
+    response = SGET('posts.posts', until_id=many_posts[5].id, limit=3)
+    assert ids(response) == [str(p.id) for p in many_posts[:3]]
+
+def follow_link(response, rel):
+    """Fetch the page a response's Link header points to, if it has one"""
+    for link in response.headers.getlist('Link'):
+        url, _, params = link.partition('; ')
+        if params == 'rel="{}"'.format(rel):
+            args = parse_qs(urlparse(url[1:-1]).query)
+            return SGET('posts.posts', **{k: v[0] for k, v in args.items()})
+
+def test_get_posts_pages(many_posts):
+    """Test paging through the posts in both directions"""
+    pages = [SGET('posts.posts', limit=3)]
+    while True:
+        response = follow_link(pages[-1], 'next')
+        if response is None:
+            break
+        pages.append(response)
+    assert sum((ids(page) for page in pages), []) == [
+        str(p.id) for p in many_posts]
+
+    response = pages[-1]
+    for page in reversed(pages[:-1]):
+        response = follow_link(response, 'prev')
+        assert ids(response) == ids(page)
+    assert ids(follow_link(response, 'prev')) == []
+
+def test_get_posts_invalid_id(entity):
+    with raises(APIBadRequest):
+        SGET('posts.posts', before_id='invalid')
+
+def test_get_posts_link_header(many_posts):
+    """Test the profile link is still the first Link header"""
+    response = SGET('posts.posts', before_id=many_posts[0].id, limit=3)
+    assert response_has_link_header(response)
+    links = response.headers.getlist('Link')
+    assert 'rel="prev"' in links[1]
+    assert 'rel="next"' in links[2]
+
+def test_get_post_not_modified(post):
+    """Test that a post is not sent again if the client has it"""
+    response = SGET('posts.post', post_id=post.id)
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+
+    response = SGET('posts.post', post_id=post.id,
+                    headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == ''
+
+    post.save()
+    response = SGET('posts.post', post_id=post.id,
+                    headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_get_posts_not_modified(post):
+    etag = SGET('posts.posts').headers['ETag']
+    response = SGET('posts.posts', headers={'If-None-Match': etag})
+    assert response.status_code == 304
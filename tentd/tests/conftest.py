@@ -5,7 +5,17 @@ from mongoengine.connection import ConnectionError
 from py.test import fixture, exit
 
 from tentd import create_app
-from tentd.documents import collections, Entity, Post, Follower, Following
+from tentd.documents import (
+    collections, Entity, KeyPair, Post, Follower, Following)
+from tentd.blueprints.entity import profile_cache
+from tentd.lib.flask import entity_cache, link_cache
+from tentd.tests.http import ADMIN_TOKEN, MAC_ID, MAC_KEY
+from tentd.utils.auth import keypair_cache, nonce_cache
+from tentd.utils.follow import discovery_cache
+from tentd.utils.metrics import metrics
+from tentd.utils.monitor import monitor
+from tentd.utils.notifications import notifications
+from tentd.utils.profiling import profiler
 
 def pytest_report_header(config):
     from tentd import __version__
@@ -17,6 +27,15 @@ def pytest_addoption(parser):
         help="the mode to run in (multiple, single, subdomain, all)")
     parser.addoption('--nowarnings', action='store_true',
         help="don't turn warnings into errors")
+    parser.addoption('--benchmark', action='store_true',
+        help="run the endpoint benchmarks")
+    parser.addoption('--benchmark-output', action='store',
+        default='benchmark.json',
+        help="the file benchmark results are written to")
+    parser.addoption('--benchmark-baseline', action='store', default=None,
+        help="a results file to compare the benchmark results with")
+    parser.addoption('--benchmark-threshold', action='store', type=float,
+        default=0.2, help="the slowdown allowed before a benchmark fails")
 
 def pytest_configure(config):
     """Apply the --warnings option"""
@@ -35,10 +54,17 @@ def pytest_generate_tests(metafunc):
         }[metafunc.config.getoption('mode')], indirect=True, scope="module")
 
 def pytest_runtest_teardown(item, nextitem):
-    """If the app fixture was used, clear the database after the test"""
+    """If the app fixture was used, clear the database and any caches after
+    the test"""
     if 'app' in item.fixturenames:
         for collection in collections:
             collection.drop_collection()
+        for cache in (
+                discovery_cache, entity_cache, link_cache, keypair_cache,
+                nonce_cache, profile_cache):
+            cache.clear()
+        notifications.pending.clear()
+        del notifications.unfiled[:]
 
 def pytest_runtest_makereport(item, call):
     """Stop the tests early when we can't connect to the database"""
@@ -63,6 +89,10 @@ def app(request):
         },
         'USER_MODE': request.param,
         'USER_NAME': 'neo',
+        'OUTBOX_WORKERS': 0,
+        'NOTIFICATION_FLUSH_LATENCY': 0,
+        'TIMELINE_WORKER': False,
+        'ADMIN_TOKEN': ADMIN_TOKEN,
     }
         
     app = create_app(config)
@@ -78,6 +108,10 @@ def app(request):
     ctx.push()
     request.addfinalizer(ctx.pop)
 
+    # Stop the extensions listening to commands for the next application
+    for extension in (metrics, monitor, profiler):
+        request.addfinalizer(extension.remove_listeners)
+
     return app
 
 @fixture
@@ -89,6 +123,10 @@ def entity(request, app):
         identity= "http://example.com",
         servers=["http://tent.example.com"]).save()
 
+    # The KeyPair used to sign secure requests
+    KeyPair.objects(owner=g.entity).update_one(
+        set__mac_id=MAC_ID, set__mac_key=MAC_KEY)
+
     @request.addfinalizer
     def delete_entity():
         if hasattr(g, 'entity'):
@@ -2,7 +2,8 @@
 
 from py.test import raises, mark
 
-from tentd.documents import db, Follower
+from tentd.documents import db, Entity, Follower
+from tentd.documents.migrations import create_entity_keypairs
 from tentd.documents.auth import generate_id, generate_key, KeyPair
 
 def test_generate():
@@ -28,3 +29,19 @@ def test_follower_cascading_delete(follower):
 
     with raises(KeyPair.DoesNotExist):
         KeyPair.objects.get(owner=follower)
+
+def test_entity_keypair_property(entity):
+    """Test that a KeyPair is generated when an entity is saved"""
+    assert isinstance(entity.keypair, KeyPair)
+
+def test_entity_cascading_delete(entity):
+    keypair = entity.keypair
+    entity.delete()
+    assert not KeyPair.objects(id=keypair.id).count()
+
+def test_create_entity_keypairs(entity):
+    """Test that entities created without a KeyPair are given one"""
+    entity.keypair.delete()
+    assert create_entity_keypairs() == 1
+    assert create_entity_keypairs() == 0
+    assert isinstance(entity.keypair, KeyPair)
@@ -26,3 +26,20 @@ def test_cascading_deletion(app):
 
     assert post not in Post.objects
     assert post not in entity.posts
+
+def test_core_profile_scoped(entity):
+    """Test that each entity has its own core profile"""
+    other = Entity(name="other").save()
+    assert other.core.entity == other
+    assert entity.core.entity == entity
+    assert other.core.id != entity.core.id
+
+def test_core_profile_remembered(app, entity):
+    """Test that the core profile is only fetched once per request"""
+    with app.test_request_context():
+        core = entity.core
+        assert entity.core is core
+
+        # Saving the profile forgets it
+        core.save()
+        assert entity.core is not core
@@ -1,7 +1,10 @@
 # coding=utf-8
 """Test cases for posts"""
 
-from tentd.documents import Post
+from datetime import datetime
+
+from tentd.documents import Post, PostVersion, CoreProfile
+from tentd.documents.migrations import migrate_post_versions
 from py.test import raises, mark
 
 def test_post_owner(entity, post):
@@ -41,3 +44,72 @@ def test_unicode_post(entity):
 
     assert u"⛺" in post.latest.content['title']
     assert u"⛺" in post.latest.content['body']
+
+def test_post_json_entity(entity, post):
+    """Test that posts are serialized with their entity's identity"""
+    assert post.to_json()['entity'] == entity.core.identity
+
+def test_post_identity_is_remembered(app, entity, post):
+    """Test that the entity identity is only looked up once per request"""
+    identity = entity.core.identity
+    with app.test_request_context():
+        assert post.to_json()['entity'] == identity
+        CoreProfile.objects(entity=entity).update(
+            set__identity='http://changed.example.com')
+        assert Post.objects.get(id=post.id).to_json()['entity'] == identity
+
+def test_post_versions_stored_separately(post):
+    """Test that only the latest version is stored in the post document"""
+    son = Post._get_collection().find_one({'_id': post.id})
+    assert 'versions' not in son
+    assert son['latest']['content']['text'] == "Goodbye world"
+    assert PostVersion.objects(post=post).count() == 3
+
+def test_post_versions_order(post):
+    """Test that versions are returned newest first"""
+    texts = [v.content['text'] for v in post.versions]
+    assert texts == ["Goodbye world", "How are you, world?", "Hello world"]
+
+def test_post_new_version_saved(post):
+    """Test that new versions are stored when the post is saved"""
+    post.new_version(content={'text': "Hello again"})
+    assert post.versions[0].content['text'] == "Hello again"
+    post.save()
+    post = Post.objects.get(id=post.id)
+    assert post.version_count == 4
+    assert post.latest.content['text'] == "Hello again"
+    assert PostVersion.objects(post=post).count() == 4
+
+def test_post_delete_version(post):
+    """Test that deleting the latest version replaces it"""
+    post.delete_version(0)
+    post = Post.objects.get(id=post.id)
+    assert post.version_count == 2
+    assert post.latest.content['text'] == "How are you, world?"
+    with raises(IndexError):
+        post.delete_version(2)
+
+def test_post_versions_deleted_with_post(post):
+    post.delete()
+    assert PostVersion.objects(post=post).count() == 0
+
+def test_migrate_post_versions(entity):
+    """Test that embedded versions are moved into their own collection"""
+    collection = Post._get_collection()
+    post_id = collection.insert({
+        'entity': entity.id,
+        'schema': 'https://tent.io/types/post/status/v0.1.0',
+        'versions': [
+            {'published_at': datetime(2013, 1, 2), 'received_at':
+             datetime(2013, 1, 2), 'content': {'text': "Second"}},
+            {'published_at': datetime(2013, 1, 1), 'received_at':
+             datetime(2013, 1, 1), 'content': {'text': "First"}},
+        ]})
+
+    assert migrate_post_versions() == 1
+    assert migrate_post_versions() == 0
+
+    post = Post.objects.get(id=post_id)
+    assert post.version_count == 2
+    assert post.latest.content['text'] == "Second"
+    assert [v.content['text'] for v in post.versions] == ["Second", "First"]
@@ -46,3 +46,9 @@ def test_json_attributes(generic_profile):
 def test_unique_schema(entity, generic_profile):
     with raises((NotUniqueError, OperationError)):
         GenericProfile(entity=entity, schema=generic_profile.schema).save()
+
+def test_public_profiles(entity, generic_profile):
+    """Test that only public profiles are selected"""
+    assert list(entity.profiles.public()) == [entity.core]
+    assert entity.profiles.visible(True).count() == 2
+    assert entity.profiles.visible(False).count() == 1
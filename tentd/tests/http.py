@@ -1,25 +1,51 @@
 """HTTP methods"""
 
 __all__ = [
-    'HTTP', 'DELETE', 'GET', 'HEAD', 'PUT', 'POST',
+    'HTTP', 'signed_with', 'ADMIN_HEADERS', 'DELETE', 'GET', 'HEAD', 'PUT', 'POST',
     'SDELETE', 'SGET', 'SHEAD', 'SPUT', 'SPOST']
 
+import base64
+import hmac
+from hashlib import sha256
+from random import getrandbits
 from re import match
+from time import time
+from urllib import unquote
+from urlparse import urlparse
 
 from flask import current_app, json, url_for, g
 from werkzeug.datastructures import Headers
 
 from tentd.lib.flask import JSONEncoder
 
-def authorization_header():
-    """Generates an Authorization header for secure requests"""
-    macid  = "s:f5949a1d"
-    tstamp = 1355181298
-    nonce  = "b07235"
-    mac    = "swgy4RpdIBaFpA1hmAbZrph24VVg9FwmJgMm9GkgiLE="
+#: The credentials used to sign secure requests
+MAC_ID = "s:f5949a1d"
+MAC_KEY = "a5fe0dcd5ba88e5d5b3bf1a4ab4fc3c7cc5c0d08b4b43e3c4a0c1b3a0c4e24bd"
+
+#: The ADMIN_TOKEN of the test application
+ADMIN_TOKEN = "e0c5a9d1b2f4"
+
+#: Headers authorizing a request to an administrator's endpoint
+ADMIN_HEADERS = {'Authorization': 'Bearer {}'.format(ADMIN_TOKEN)}
+
+def authorization_header(method, url, base_url=None,
+                         mac_id=MAC_ID, mac_key=MAC_KEY):
+    """Generates a signed Authorization header for secure requests"""
+    tstamp = int(time())
+    nonce = '{:x}'.format(getrandbits(32))
+
+    path, _, query = url.partition('?')
+    location = urlparse(
+        base_url or 'http://' + current_app.config['SERVER_NAME'])
+
+    normalized = "\n".join([
+        str(tstamp), nonce, method.upper(), unquote(path) + "?" + query,
+        location.hostname, str(location.port or 80), ""])
+    mac = base64.b64encode(hmac.new(
+        str(mac_key), normalized, sha256).digest())
 
     return 'MAC id="{0}",ts="{1}",nonce="{2}",mac="{3}"'.format(
-        macid, tstamp, nonce, mac)
+        mac_id, tstamp, nonce, mac)
 
 def build_url(endpoint, base_url=None, **kwargs):
     if endpoint[0] == '/':
@@ -36,6 +62,13 @@ def build_url(endpoint, base_url=None, **kwargs):
 
     return url, base_url
 
+def signed_with(keypair, endpoint, method='GET', **kwargs):
+    """Return headers signing a request with a KeyPair other than the test
+    KeyPair"""
+    url, base_url = build_url(endpoint, **kwargs)
+    return {'Authorization': authorization_header(
+        method, url, base_url, keypair.mac_id, keypair.mac_key)}
+
 def HTTP(type, endpoint, data=None, secure=False,
     headers=None, content_type='text/html', **kwargs):
     """A HTTP convenience function that takes a method type, an endpoint
@@ -62,9 +95,9 @@ def HTTP(type, endpoint, data=None, secure=False,
     if not isinstance(headers, Headers):
         headers = Headers(headers or {})
 
-    # Emulate a HMAC request if needed
+    # Sign the request with the test KeyPair if needed
     if secure:
-        headers.set('Authorization', authorization_header())
+        headers.set('Authorization', authorization_header(type, url, base_url))
 
     # Fetch and call the function from the client
     return getattr(current_app.client, type)(
@@ -3,10 +3,14 @@
 from random import random
 
 from bson import ObjectId
-from flask import json
+from flask import g, json
 from mongoengine.queryset import QuerySet
+from py.test import raises
+from tentd.documents import Post
 from tentd.lib.flask import (
-    cached_method, Request, Blueprint, JSONEncoder, jsonify)
+    cached_method, Request, Blueprint, JSONEncoder, JSONBackend, jsonify,
+    entity_cache, iterencode_array)
+from tentd.tests.http import GET, build_url
 
 from tentd.utils.exceptions import APIBadRequest
 
@@ -48,6 +52,61 @@ class TestJSONEncoder(object):
         objectid = ObjectId()
         assert self.dumps(objectid) == '"{}"'.format(objectid)
 
+class TestJSONBackend(object):
+    def backends(self):
+        backends = [JSONBackend('json'), JSONBackend('simplejson')]
+        try:
+            backends.append(JSONBackend('ujson'))
+        except ImportError:
+            pass
+        return backends
+
+    def test_unknown_backend(self):
+        with raises(ValueError):
+            JSONBackend('notjson')
+
+    def test_default_hooks(self):
+        """Test that every backend uses JSONEncoder.default()"""
+        objectid = ObjectId()
+        obj = {'a': JSONEncodable(), 'b': [AlternateJSONEncodable()],
+               'c': objectid}
+        expected = {
+            'a': {'attribute': 'value'},
+            'b': [{'attribute': 'value'}],
+            'c': str(objectid)}
+        for backend in self.backends():
+            for pretty in (True, False):
+                assert backend.loads(backend.dumps(obj, pretty)) == expected
+
+    def test_compact(self):
+        backend = JSONBackend('simplejson')
+        assert backend.dumps({'a': [1, 2]}) == '{"a":[1,2]}'
+        assert '\n' in backend.dumps({'a': [1, 2]}, pretty=True)
+
+def test_json_pretty(app):
+    """Test that JSON is indented in debug mode"""
+    assert app.config['JSON_PRETTY'] == app.debug
+
+class TestIterencodeArray(object):
+    def encode(self, iterable, **kwargs):
+        return ''.join(iterencode_array(iterable, **kwargs))
+
+    def test_empty(self):
+        assert self.encode([]) == '[]'
+
+    def test_equivalent(self):
+        """Test that the output is the same as json.dumps()"""
+        items = [{'a': [1, 2]}, JSONEncodable(), ObjectId(), 'b']
+        for pretty in (True, False):
+            assert json.loads(self.encode(items, pretty=pretty)) == \
+                json.loads(json.dumps(items, cls=JSONEncoder))
+
+    def test_chunks(self):
+        """Test that the output is split into chunks"""
+        chunks = list(iterencode_array(range(10), chunk_size=3))
+        assert len(chunks) == 4
+        assert json.loads(''.join(chunks)) == range(10)
+
 def test_jsonify_types(app):
     """Test that jsonify works with all of our custom types"""
     with app.test_request_context():
@@ -69,3 +128,36 @@ def test_jsonify_default_mimetype(app):
     """Test that jsonify() uses the correct default mimetype"""
     with app.test_request_context():
         assert jsonify([]).mimetype == 'application/vnd.tent.v0+json'
+
+def test_jsonify_stream(app, post):
+    """Test that QuerySets are streamed"""
+    response = jsonify(Post.objects)
+    assert response.is_streamed
+    assert json.loads(response.data) == [post.to_json()]
+    assert not jsonify([post]).is_streamed
+
+def test_entity_cache(app, entity):
+    """Test that entities are cached, and forgotten when they change"""
+    GET('entity.profiles')
+    assert entity_cache.get(entity.name)['_id'] == entity.id
+
+    entity.save()
+    assert entity.name not in entity_cache
+
+def test_entity_cache_copies(app, entity):
+    """Test that each request builds its own Entity from the cache"""
+    url, base_url = build_url('entity.profiles')
+    entities = []
+    for i in range(2):
+        with app.test_request_context(url, base_url=base_url):
+            app.preprocess_request()
+            entities.append(g.entity)
+    assert entities[0] == entities[1] == entity
+    assert entities[0] is not entities[1]
+
+def test_entity_cache_rename(app, entity):
+    """Test that renaming an entity forgets the previous name"""
+    entity_cache.set('previous', entity)
+    entity.name = 'renamed'
+    entity.save()
+    assert 'previous' not in entity_cache
@@ -0,0 +1,29 @@
+"""Test the production server"""
+
+from py.test import importorskip
+
+importorskip('gunicorn')
+
+from tentd.lib.gunicorn import Server, worker_exit
+
+def test_options(app):
+    """Test that options are passed to gunicorn"""
+    server = Server(app.config, {
+        'bind': '127.0.0.1:8000',
+        'workers': 3,
+        'threads': None,
+        'keepalive': 5,
+    })
+    assert server.cfg.bind == ['127.0.0.1:8000']
+    assert server.cfg.workers == 3
+    assert server.cfg.threads == 1
+    assert server.cfg.keepalive == 5
+    assert server.cfg.worker_exit is worker_exit
+
+def test_default_workers(app):
+    assert Server(app.config).cfg.workers >= 2
+
+def test_load(app):
+    """Test that each worker creates an application"""
+    assert Server(dict(app.config)).load().config['USER_MODE'] == \
+        app.config['USER_MODE']
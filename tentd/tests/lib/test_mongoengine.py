@@ -0,0 +1,27 @@
+"""Tests for the additions to mongoengine"""
+
+from tentd.documents import Follower, Post
+from tentd.lib.mongoengine import projected
+
+def test_projected_only(post):
+    """Test that only the serialized fields of a post are loaded"""
+    queryset = projected(Post.objects(id=post.id))
+    assert 'latest' in queryset._loaded_fields.fields
+    assert 'schema' in queryset._loaded_fields.fields
+    assert queryset.first().to_json() == post.to_json()
+
+def test_projected_exclude(entity):
+    """Test that profiles are loaded without their permissions"""
+    queryset = projected(entity.profiles)
+    assert queryset._loaded_fields.fields == set(['permissions'])
+    assert queryset.first().to_json() == entity.core.to_json()
+
+def test_projected_follower(follower):
+    queryset = projected(Follower.objects(id=follower.id))
+    assert queryset.first().to_json() == follower.to_json()
+
+def test_entity_json(entity, follower):
+    """Test that an entity is serialized with its relationships"""
+    json = entity.to_json()
+    assert json['name'] == entity.name
+    assert [f.to_json() for f in json['followers']] == [follower.to_json()]
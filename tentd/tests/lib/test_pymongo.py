@@ -0,0 +1,25 @@
+"""Tests for the MongoDB command monitor"""
+
+from tentd.documents import Post
+from tentd.lib.pymongo import add_listener, remove_listener
+
+def test_command_events(request, entity, post):
+    """Test that listeners are told about each command"""
+    events = []
+    add_listener(events.append)
+    request.addfinalizer(lambda: remove_listener(events.append))
+
+    list(Post.objects(entity=entity))
+    Post.objects(entity=entity).count()
+
+    names = [event.name for event in events]
+    assert 'query' in names
+    assert 'count' in names
+    query = events[names.index('query')]
+    assert query.collection == 'post'
+    assert query.duration >= 0
+    assert not query.failed
+
+def test_no_listeners(entity, post):
+    """Test that queries work when no listener is registered"""
+    assert list(Post.objects(entity=entity)) == [post]
@@ -0,0 +1,27 @@
+"""Test the shared HTTP client"""
+
+from tentd.lib.requests import HTTPClient, http
+
+def test_client_configured(app):
+    """Test that the client is configured from the application"""
+    assert http.session is not None
+    assert http.timeout == app.config['HTTP_TIMEOUT']
+
+def test_default_timeout(app, monkeypatch):
+    """Test that requests are sent with a timeout"""
+    calls = []
+    monkeypatch.setattr(http.session, 'request',
+        lambda method, url, **kwargs: calls.append((method, url, kwargs)))
+
+    http.get('http://example.com/profile')
+
+    method, url, kwargs = calls[0]
+    assert method == 'GET'
+    assert kwargs['timeout'] == app.config['HTTP_TIMEOUT']
+
+def test_host_semaphores(app):
+    """Test that connections are limited per host"""
+    client = HTTPClient(app)
+    first = client._semaphore('http://example.com/a')
+    assert first is client._semaphore('https://example.com/b')
+    assert first is not client._semaphore('http://other.example.com/')
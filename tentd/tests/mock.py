@@ -5,25 +5,23 @@ from __future__ import absolute_import
 from collections import defaultdict
 from weakref import proxy
 
-class CallableAttribute(object):
-    def __call__(self):
-        return self.value
-
-    def __set__(self, instance, value):
-        self.value = value
-
 class MockResponse(object):
     """A mock response, for use with MockFunction"""
 
-    def __init__(self, **kwargs):
+    def __init__(self, json=None, **kwargs):
+        self._json = json
         for key, value in kwargs.items():
             setattr(self, key, value)
 
     #: Use a default status code
     status_code = 200
 
-    #: The JSON method
-    json = CallableAttribute()
+    #: Responses have no headers by default
+    headers = {}
+
+    def json(self):
+        """Return the JSON the response was created with"""
+        return self._json
 
 class MockFunction(dict):
     """A callable argument->value dictionary for patching over a function"""
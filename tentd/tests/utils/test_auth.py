@@ -4,10 +4,15 @@ import base64
 import hmac
 from hashlib import sha256
 
-from flask import request, current_app
+from flask import request, current_app, url_for
+from py.test import raises
 
-from tentd.utils.auth import parse_authstring, check_request
-from tentd.tests.http import GET
+from tentd.documents import Entity, KeyPair
+from tentd.utils import auth
+from tentd.utils.auth import (
+    parse_authstring, check_request, verify_request, keypair_cache,
+    nonce_cache, sign_request, InvalidAuthentication)
+from tentd.tests.http import DELETE, GET, SGET, MAC_ID, signed_with
 
 class TestAuth(object):
     mac_id = "s:f5949a1d"
@@ -36,9 +41,102 @@ class TestAuth(object):
             str(self.mac_ts), self.mac_nonce, "GET", "/?apple=2",
             app.config['SERVER_NAME'], str(80), ""])
         
-        self.mac = base64.encodestring(hmac.new(key, norm, sha256).digest())
+        self.mac = base64.b64encode(hmac.new(key, norm, sha256).digest())
 
         headers = [("Authorization", self.authstring())]
 
         with app.test_request_context("/?apple=2", headers=headers) as rc:
             assert check_request(rc.request, key) == True
+
+    def test_check_request_with_wrong_key(self, app):
+        headers = [("Authorization", self.authstring())]
+        with app.test_request_context("/?apple=2", headers=headers) as rc:
+            assert check_request(rc.request, "wrong") == False
+
+def test_signed_request(entity):
+    """Test that requests signed with a KeyPair are accepted"""
+    assert SGET('posts.posts').status_code == 200
+
+def test_unsigned_request(entity):
+    """Test that requests without a MAC are rejected"""
+    with raises(InvalidAuthentication):
+        GET('posts.posts')
+
+def test_unknown_mac_id(app, entity):
+    """Test that requests signed by an unknown KeyPair are rejected"""
+    KeyPair.objects.get(mac_id=MAC_ID).delete()
+    with raises(InvalidAuthentication):
+        SGET('posts.posts')
+
+def test_keypair_cache(entity):
+    """Test that keys are cached until the KeyPair changes"""
+    SGET('posts.posts')
+    assert MAC_ID in keypair_cache
+
+    KeyPair.objects.get(mac_id=MAC_ID).save()
+    assert MAC_ID not in keypair_cache
+
+def test_entity_key(entity):
+    """Test that the KeyPair created when an entity is saved is accepted"""
+    entity.keypair.delete()
+    entity.save()
+    headers = signed_with(entity.keypair, 'posts.posts')
+    assert GET('posts.posts', headers=headers).status_code == 200
+
+def test_follower_key(entity, follower):
+    """Test that a follower's key can't be used to act as the entity"""
+    with raises(InvalidAuthentication):
+        GET('posts.posts',
+            headers=signed_with(follower.keypair, 'posts.posts'))
+
+def test_other_entity_key(entity):
+    """Test that a key owned by another entity is rejected"""
+    other = Entity.new(name='other', identity='http://other.example.com')
+    other.save()
+    with raises(InvalidAuthentication):
+        GET('posts.posts', headers=signed_with(other.keypair, 'posts.posts'))
+
+def test_stale_timestamp(entity, monkeypatch):
+    """Test that requests signed long ago are rejected"""
+    monkeypatch.setattr('tentd.tests.http.time', lambda: 1355181298)
+    with raises(InvalidAuthentication):
+        SGET('posts.posts')
+
+def test_replayed_request(entity):
+    """Test that a signed request can only be sent once"""
+    headers = signed_with(
+        KeyPair.objects.get(mac_id=MAC_ID), 'posts.posts')
+    assert GET('posts.posts', headers=headers).status_code == 200
+    with raises(InvalidAuthentication):
+        GET('posts.posts', headers=headers)
+
+def test_evicted_nonce(entity, monkeypatch):
+    """Test that a request can't be replayed once its nonce is discarded"""
+    monkeypatch.setattr(nonce_cache, 'maxsize', 1)
+    monkeypatch.setattr(auth, '_nonce_horizon', 0)
+    keypair = KeyPair.objects.get(mac_id=MAC_ID)
+    first = signed_with(keypair, 'posts.posts')
+    assert GET('posts.posts', headers=first).status_code == 200
+    assert GET('posts.posts', headers=signed_with(
+        keypair, 'posts.posts')).status_code == 200
+    with raises(InvalidAuthentication):
+        GET('posts.posts', headers=first)
+
+def test_keypair_cache_ttl(app):
+    """Test that keys deleted by other processes expire"""
+    assert keypair_cache.ttl == app.config['KEYPAIR_CACHE_TTL']
+
+def test_follower_fetches_post(entity, follower, post):
+    """Test that followers can fetch posts with requests signed by
+    sign_request, but can't change them"""
+    keypair = follower.keypair
+    url = url_for('posts.post', post_id=post.id, _external=True)
+    headers = {'Authorization': sign_request(
+        'GET', url, keypair.mac_id, keypair.mac_key)}
+    assert GET('posts.post', post_id=post.id,
+               headers=headers).status_code == 200
+
+    headers = {'Authorization': sign_request(
+        'DELETE', url, keypair.mac_id, keypair.mac_key)}
+    with raises(InvalidAuthentication):
+        DELETE('posts.post', post_id=post.id, headers=headers)
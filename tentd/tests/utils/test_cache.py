@@ -0,0 +1,77 @@
+"""Test the in-process cache"""
+
+from time import sleep
+
+from tentd.utils.cache import Cache
+
+def test_get_and_set():
+    cache = Cache()
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert 'a' in cache
+
+def test_expiry():
+    cache = Cache(ttl=0.01)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=60)
+    sleep(0.02)
+    assert 'a' not in cache
+    assert cache.get('b') == 2
+
+def test_bounded_size():
+    """Test that the least recently used entry is discarded"""
+    cache = Cache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+
+def test_delete_and_clear():
+    cache = Cache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.delete('a')
+    assert 'a' not in cache
+    cache.clear()
+    assert len(cache) == 0
+
+def test_shared_cache():
+    """Test that entries are shared through the shared cache"""
+    shared = Cache()
+    first, second = Cache(shared=shared), Cache(shared=shared)
+    first.set('a', 1)
+    assert second.get('a') == 1
+
+    first.delete('a')
+    assert 'a' not in shared
+    assert second.get('a') is None
+    assert len(first) == len(second) == 0
+
+def test_add():
+    """Test that values are only added for missing or expired keys"""
+    cache = Cache(ttl=0.01)
+    assert cache.add('a', 1)
+    assert not cache.add('a', 2)
+    assert cache.get('a') == 1
+    sleep(0.02)
+    assert cache.add('a', 3)
+
+def test_add_shared():
+    """Test that a key added by one process can't be added by another"""
+    shared = Cache()
+    first, second = Cache(shared=shared), Cache(shared=shared)
+    assert first.add('a', 1)
+    assert not second.add('a', 2)
+    assert second.get('a') == 1
+
+def test_evicted():
+    """Test that entries discarded because the cache is full are reported"""
+    evicted = []
+    cache = Cache(maxsize=1, evicted=lambda *entry: evicted.append(entry))
+    cache.set('a', 1)
+    cache.add('b', 2)
+    assert evicted == [('a', 1)]
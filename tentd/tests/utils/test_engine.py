@@ -0,0 +1,56 @@
+"""Tests for the delivery engine"""
+
+from py.test import fixture, importorskip
+
+importorskip('gevent')
+
+from tentd.documents import Delivery
+from tentd.lib.requests import http
+from tentd.tests.mock import MockFunction, MockResponse
+from tentd.utils.engine import DeliveryEngine
+from tentd.utils.outbox import claim, enqueue
+
+@fixture
+def engine(app):
+    return DeliveryEngine(app)
+
+def test_deliver(engine, post, follower, monkeypatch):
+    """Test that deliveries are sent to the notification link"""
+    monkeypatch.setattr(http, 'post', MockFunction())
+    http.post['http://follower.example.com/tentd/notification'] = \
+        MockResponse()
+
+    enqueue(post)
+    assert engine.deliver(claim()) is True
+    assert Delivery.objects.get(post=post).status == Delivery.DELIVERED
+    assert engine.active == {}
+    assert engine.semaphores == {}
+
+def test_busy_host(engine, post, follower):
+    """Test that deliveries to a busy host are left in the outbox"""
+    engine.active['follower.example.com'] = engine.host_limit
+    assert engine.busy_hosts() == ['follower.example.com']
+
+    enqueue(post)
+    assert claim(exclude_hosts=engine.busy_hosts()) is None
+    assert Delivery.objects.get(post=post).status == Delivery.PENDING
+
+def test_timeout(engine, post, follower, monkeypatch):
+    """Test that deliveries that take too long are retried"""
+    from gevent import sleep
+    monkeypatch.setattr(engine, 'timeout', 0.01)
+    monkeypatch.setattr(http, 'post', lambda *args, **kwargs: sleep(1))
+
+    enqueue(post)
+    assert engine.deliver(claim()) is False
+
+    delivery = Delivery.objects.get(post=post)
+    assert delivery.status == Delivery.PENDING
+    assert delivery.attempts == 1
+    assert 'No response' in delivery.last_error
+
+def test_post_data(engine, post, follower):
+    """Test that each post is only serialized once"""
+    enqueue(post)
+    delivery = claim()
+    assert engine.post_data(delivery) is engine.post_data(delivery)
@@ -0,0 +1,55 @@
+"""Test entity discovery"""
+
+from py.test import fixture, raises
+
+from tentd.lib.requests import http
+from tentd.tests.mock import MockFunction, MockResponse
+from tentd.utils.exceptions import APIBadRequest
+from tentd.utils.follow import discover_entity, cache_lifetime
+
+IDENTITY = 'http://discovered.example.com'
+PROFILE = IDENTITY + '/tentd/profile'
+
+@fixture
+def discovery_mocks(app, monkeypatch):
+    monkeypatch.setattr(http, 'head', MockFunction())
+    monkeypatch.setattr(http, 'get', MockFunction())
+
+    http.head[IDENTITY] = MockResponse(headers={
+        'Link': '<{}>; rel="https://tent.io/rels/profile"'.format(PROFILE)})
+    http.get[PROFILE] = MockResponse(json={
+        "https://tent.io/types/info/core/v0.1.0": {
+            "entity": IDENTITY,
+            "servers": [IDENTITY + '/tentd'],
+        }})
+
+def test_discovery_is_cached(discovery_mocks):
+    """Test that repeated discovery is answered from the cache"""
+    assert discover_entity(IDENTITY) == discover_entity(IDENTITY)
+    assert http.head.history[IDENTITY] == 1
+    assert http.get.history[PROFILE] == 1
+
+def test_failed_discovery_is_cached(app, monkeypatch):
+    """Test that failures are cached"""
+    monkeypatch.setattr(http, 'head', MockFunction())
+    http.head[IDENTITY] = MockResponse()
+    for i in range(2):
+        with raises(APIBadRequest):
+            discover_entity(IDENTITY)
+    assert http.head.history[IDENTITY] == 1
+
+def test_uncacheable_discovery(discovery_mocks):
+    """Test that responses with Cache-Control: no-cache are not cached"""
+    http.get[PROFILE].headers = {'Cache-Control': 'no-cache'}
+    discover_entity(IDENTITY)
+    discover_entity(IDENTITY)
+    assert http.head.history[IDENTITY] == 2
+
+def test_cache_lifetime():
+    assert cache_lifetime(MockResponse()) == float('inf')
+    assert cache_lifetime(MockResponse(
+        headers={'Cache-Control': 'max-age=60'})) == 60
+    assert cache_lifetime(MockResponse(
+        headers={'Cache-Control': 'no-store'})) == 0
+    assert cache_lifetime(MockResponse(
+        headers={'Expires': 'Thu, 01 Jan 1970 00:00:00 GMT'})) == 0
@@ -0,0 +1,70 @@
+"""Tests for the metrics endpoint"""
+
+from threading import Thread
+
+from py.test import fixture
+
+from tentd.lib.requests import http
+from tentd.tests.http import ADMIN_HEADERS
+from tentd.tests.mock import MockFunction, MockResponse
+from tentd.utils.metrics import Metrics, metrics
+from tentd.utils.outbox import claim, deliver, enqueue
+
+@fixture
+def recorder(app):
+    """A separate set of metrics"""
+    recorder = Metrics()
+    recorder.app, recorder.enabled = app, True
+    return recorder
+
+def test_counter(recorder):
+    recorder.increment('requests', (('endpoint', 'home'),))
+    recorder.increment('requests', (('endpoint', 'home'),), 2)
+    assert 'requests{endpoint="home"} 3\n' in recorder.render()
+
+def test_histogram(recorder):
+    recorder.observe('latency', 0.02)
+    recorder.observe('latency', 20)
+    output = recorder.render()
+    assert 'latency_bucket{le="0.01"} 0\n' in output
+    assert 'latency_bucket{le="0.025"} 1\n' in output
+    assert 'latency_bucket{le="+Inf"} 2\n' in output
+    assert 'latency_count 2\n' in output
+
+def test_threads(recorder):
+    """Test that metrics recorded by finished threads are kept"""
+    threads = [Thread(target=recorder.increment, args=('count',))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    recorder.increment('count')
+
+    assert recorder.collect().counters[('count', ())] == 5
+    assert len(recorder._shards) == 1
+    assert recorder.collect().counters[('count', ())] == 5
+
+def test_metrics_route(app):
+    """Test that requests are counted"""
+    metrics.reset()
+    app.client.get('/', base_url='http://example.com')
+    output = app.client.get('/metrics', base_url='http://example.com',
+        headers=ADMIN_HEADERS).data
+    assert 'tentd_http_requests_total{endpoint="home",method="GET",' \
+        'status="200"} 1' in output
+    assert 'tentd_http_request_duration_seconds_count{endpoint="home"} 1' \
+        in output
+
+def test_delivery_metrics(post, follower, monkeypatch):
+    """Test that deliveries are counted for each host"""
+    metrics.reset()
+    monkeypatch.setattr(http, 'post', MockFunction())
+    http.post['http://follower.example.com/tentd/notification'] = \
+        MockResponse()
+
+    enqueue(post)
+    deliver(claim())
+
+    counters = metrics.collect().counters
+    assert counters[('tentd_deliveries_total', (
+        ('host', 'follower.example.com'), ('outcome', 'success')))] == 1
@@ -0,0 +1,47 @@
+"""Tests for the slow query monitor"""
+
+from py.test import fixture
+
+from tentd.documents import Post
+from tentd.lib.pymongo import add_listener, remove_listener
+from tentd.utils.monitor import monitor, query_shape, redact
+
+@fixture
+def slow(request, monkeypatch):
+    """Treat every command as slow"""
+    monkeypatch.setattr(monitor, 'threshold', 0)
+    monkeypatch.setattr(monitor, 'explain', True)
+    monitor.recent.clear()
+    add_listener(monitor.command)
+    request.addfinalizer(lambda: remove_listener(monitor.command))
+
+def test_query_shape():
+    """Test that queries with different values have the same shape"""
+    assert query_shape({'a': 1, 'b': {'$in': [1, 2]}}) == \
+        query_shape({'b': {'$in': [3]}, 'a': 2})
+    assert query_shape({'a': 1}) != query_shape({'b': 1})
+
+def test_redact():
+    assert redact({'a': 1, 'b': {'$in': [1, 2]}}) == \
+        {'a': '?', 'b': {'$in': ['?']}}
+
+def test_slow_query(app, entity, post, slow):
+    """Test that slow queries are recorded with their query plan"""
+    with app.test_request_context():
+        list(Post.objects(entity=entity))
+
+    slow = [q for q in monitor.slow_queries() if q['command'] == 'query']
+    assert slow[0]['collection'].endswith('.post')
+    assert slow[0]['source'] is None
+    assert slow[0]['explain'] is not None
+    assert slow[0]['query']['entity'] == '?'
+
+    # Queries of the same shape are only explained once
+    list(Post.objects(entity=entity))
+    slow = [q for q in monitor.slow_queries() if q['command'] == 'query']
+    assert slow[-1]['explain'] is None
+
+def test_fast_query(entity, post):
+    monitor.recent.clear()
+    list(Post.objects(entity=entity))
+    assert monitor.slow_queries() == []
@@ -0,0 +1,88 @@
+"""Tests for the notification buffer"""
+
+from datetime import datetime
+
+from mongoengine import OperationError
+from mongoengine.queryset import QuerySet
+from py.test import raises
+
+from tentd.documents import Notification
+from tentd.documents.migrations import remove_duplicate_notifications
+from tentd.tests.http import POST
+from tentd.utils.notifications import notifications
+
+def test_notification_stored(entity):
+    """Test that notifications are stored immediately with no latency"""
+    notifications.add(entity, 'abc')
+    assert Notification.objects.get(entity=entity).post_id == 'abc'
+
+def test_notification_buffered(app, entity, monkeypatch):
+    """Test that notifications are buffered until the buffer is full, which
+    wakes the buffer's thread"""
+    monkeypatch.setitem(app.config, 'NOTIFICATION_FLUSH_LATENCY', 60)
+    monkeypatch.setitem(app.config, 'NOTIFICATION_FLUSH_SIZE', 3)
+
+    notifications.add(entity, 'a')
+    notifications.add(entity, 'b')
+    notifications.add(entity, 'a')
+    assert Notification.objects.count() == 0
+
+    assert not notifications.wake.is_set()
+
+    notifications.add(entity, 'c')
+    assert notifications.wake.is_set()
+    assert Notification.objects.count() == 0
+    assert notifications.flush() == 3
+    notifications.wake.clear()
+
+def test_notification_duplicates(app, entity, monkeypatch):
+    """Test that notifications of posts already stored are ignored"""
+    monkeypatch.setitem(app.config, 'NOTIFICATION_FLUSH_LATENCY', 60)
+    notifications.add(entity, 'a')
+    notifications.flush()
+
+    notifications.add(entity, 'a')
+    notifications.add(entity, 'b')
+    assert notifications.flush() == 2
+    assert sorted(n.post_id for n in Notification.objects) == ['a', 'b']
+
+def test_notification_timelines_queued(entity, monkeypatch):
+    """Test that posts are added to timelines outside of the request"""
+    filed = []
+    monkeypatch.setattr(
+        'tentd.utils.notifications.add_to_timelines',
+        lambda unfiled, logger: filed.extend(unfiled) or len(unfiled))
+
+    POST('entity.notification', {'id': 'abc'})
+    assert Notification.objects(entity=entity).count() == 1
+    assert filed == []
+
+    assert notifications.file_timelines() == 1
+    assert [post_id for _, post_id, _, _ in filed] == ['abc']
+    assert notifications.file_timelines() == 0
+
+def test_notification_route(entity):
+    POST('entity.notification', {'id': 'abc'})
+    POST('entity.notification', {'id': 'abc'})
+    assert Notification.objects(entity=entity).count() == 1
+
+def test_notification_insert_failed(entity, monkeypatch):
+    """Test that notifications are kept if they can't be stored"""
+    def insert(*args, **kwargs):
+        raise OperationError("Could not connect")
+    monkeypatch.setattr(QuerySet, 'insert', insert)
+
+    with raises(OperationError):
+        notifications.add(entity, 'a')
+    assert (entity.id, 'a') in notifications.pending
+
+def test_remove_duplicate_notifications(entity):
+    """Test that only one notification of each post is kept"""
+    collection = Notification._get_collection()
+    for post_id in ('a', 'a', 'a', 'b'):
+        collection.insert({'entity': entity.id, 'post_id': post_id,
+                           'received_at': datetime.utcnow()})
+
+    assert remove_duplicate_notifications() == 2
+    assert remove_duplicate_notifications() == 0
+    assert sorted(n.post_id for n in Notification.objects) == ['a', 'b']
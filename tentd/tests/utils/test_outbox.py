@@ -0,0 +1,120 @@
+"""Tests for the outbox"""
+
+from py.test import fixture, raises
+from werkzeug.exceptions import NotFound, Unauthorized
+
+from tentd.documents import Delivery, Post
+from tentd.lib.requests import http
+from tentd.tests.http import ADMIN_HEADERS, GET, SGET
+from tentd.tests.mock import MockFunction, MockResponse
+from tentd.utils.outbox import (
+    enqueue, enqueue_many, claim, deliver, drain, stats)
+
+@fixture
+def post_mock(request, monkeypatch, follower):
+    monkeypatch.setattr(http, 'post', MockFunction())
+    http.post['http://follower.example.com/tentd/notification'] = \
+        MockResponse()
+    return http.post
+
+def test_enqueue(post, follower):
+    """Test that a delivery is created for each follower"""
+    assert enqueue(post) == 1
+    delivery = Delivery.objects.get(post=post)
+    assert delivery.follower == follower
+    assert delivery.host == 'follower.example.com'
+    assert delivery.status == Delivery.PENDING
+
+def test_enqueue_many(entity, post, follower):
+    """Test that deliveries are created for several posts at once"""
+    other = Post.new(entity=entity, schema=post.schema, content={}).save()
+    assert enqueue_many([post, other]) == 2
+    assert Delivery.objects(follower=follower).count() == 2
+    assert enqueue_many([]) == 0
+
+def test_claim(post, follower):
+    """Test that a delivery can only be claimed once"""
+    enqueue(post)
+    assert claim().status == Delivery.SENDING
+    assert claim() is None
+
+def test_deliver(post, follower, post_mock):
+    """Test that a delivery is sent to the follower"""
+    enqueue(post)
+    assert drain() == 1
+    assert post_mock.was_called(
+        'http://follower.example.com/tentd/notification')
+    assert Delivery.objects.get(post=post).status == Delivery.DELIVERED
+
+def test_failed_delivery(post, follower, monkeypatch):
+    """Test that failed deliveries are rescheduled"""
+    monkeypatch.setattr(http, 'post', MockFunction())
+    enqueue(post)
+    assert deliver(claim()) is False
+
+    delivery = Delivery.objects.get(post=post)
+    assert delivery.status == Delivery.PENDING
+    assert delivery.attempts == 1
+    assert delivery.next_attempt_at > delivery.created_at
+
+    # The delivery is not ready to be retried yet
+    assert claim() is None
+
+def test_abandoned_delivery(app, post, follower, monkeypatch):
+    """Test that deliveries are abandoned after too many attempts"""
+    monkeypatch.setattr(http, 'post', MockFunction())
+    monkeypatch.setitem(app.config, 'OUTBOX_MAX_ATTEMPTS', 1)
+    enqueue(post)
+    deliver(claim())
+    assert Delivery.objects.get(post=post).status == Delivery.FAILED
+
+def test_stats(post, follower, post_mock):
+    enqueue(post)
+    assert stats()['depth'] == 1
+    drain()
+    assert stats()['depth'] == 0
+    assert stats()['drain_rate'] > 0
+
+def test_outbox_route(post, follower):
+    enqueue(post)
+    assert GET('outbox_status', headers=ADMIN_HEADERS).json()['depth'] == 1
+
+def test_outbox_route_requires_token(app, post, follower):
+    """Test that the outbox's status is only shown to administrators"""
+    with raises(Unauthorized):
+        GET('outbox_status')
+    with raises(Unauthorized):
+        GET('outbox_status', headers={'Authorization': 'Bearer wrong'})
+
+def test_outbox_route_disabled(app, post, follower, monkeypatch):
+    """Test that the outbox's status is not served without a token"""
+    monkeypatch.setitem(app.config, 'ADMIN_TOKEN', None)
+    with raises(NotFound):
+        GET('outbox_status', headers=ADMIN_HEADERS)
+
+def test_deliveries_route(post, follower):
+    enqueue(post)
+    response = SGET('posts.deliveries', post_id=post.id)
+    assert response.json()[0]['identity'] == follower.identity
+    assert response.json()[0]['status'] == Delivery.PENDING
+
+def test_claim_exclude_hosts(post, follower):
+    """Test that deliveries to excluded hosts are not claimed"""
+    enqueue(post)
+    assert claim(exclude_hosts=['follower.example.com']) is None
+    assert claim(exclude_hosts=['other.example.com']) is not None
+
+def test_worker_survives_errors(app, post, follower, monkeypatch):
+    """Test that a worker keeps running when a delivery raises an error"""
+    from tentd.utils import outbox as module
+
+    def deliver(delivery):
+        outbox.stopping.set()
+        raise RuntimeError("Could not update the delivery")
+    monkeypatch.setattr(module, 'deliver', deliver)
+
+    outbox = module.Outbox()
+    outbox.app = app
+    enqueue(post)
+    outbox.work()
+    assert outbox.stopping.is_set()
@@ -0,0 +1,52 @@
+"""Tests for the request profiler"""
+
+from py.test import fixture
+
+from tentd import create_app
+from tentd.lib.pymongo import listeners
+from tentd.lib.requests import http
+from tentd.tests.http import ADMIN_HEADERS
+from tentd.utils.profiling import profiler
+
+@fixture
+def client(request, app):
+    """A test client for a copy of the app with profiling enabled"""
+    profiled = create_app(dict(app.config, PROFILING=True))
+    request.addfinalizer(profiler.reset)
+    request.addfinalizer(profiler.remove_listeners)
+    return profiled.test_client()
+
+def test_profiling_disabled(app):
+    assert 'Server-Timing' not in app.client.get(
+        '/', base_url='http://example.com').headers
+
+def test_server_timing(client):
+    """Test that the time spent on a request is returned"""
+    response = client.get('/outbox', base_url='http://example.com',
+        headers=ADMIN_HEADERS)
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'mongo;dur=' in timing
+
+def test_endpoint_totals(client):
+    """Test that the totals for each endpoint are recorded"""
+    client.get('/outbox', base_url='http://example.com',
+        headers=ADMIN_HEADERS)
+    client.get('/outbox', base_url='http://example.com',
+        headers=ADMIN_HEADERS)
+
+    totals = profiler.stats()['outbox_status']
+    assert totals['requests'] == 2
+    assert totals['mongo_count'] > 0
+    assert 'outbox_status' in client.get(
+        '/profiling', base_url='http://example.com',
+        headers=ADMIN_HEADERS).data
+
+def test_listeners_removed(app):
+    """Test that an application without profiling stops the listeners added
+    for a profiled application"""
+    create_app(dict(app.config, PROFILING=True))
+    assert profiler.mongo_command in listeners
+    create_app(app.config)
+    assert profiler.mongo_command not in listeners
+    assert profiler.http_request not in http.listeners
@@ -0,0 +1,129 @@
+"""Tests for the timeline"""
+
+from datetime import datetime
+from time import sleep
+
+from py.test import fixture
+
+from tentd.documents import TimelinePost
+from tentd.lib.requests import http
+from tentd.tests.http import POST, SGET
+from tentd.tests.mock import MockFunction, MockResponse
+from tentd.utils.notifications import notifications
+from tentd.utils.timeline import add_to_timelines
+
+def status(id, entity='http://following.example.com', **kwargs):
+    json = {
+        'id': id,
+        'entity': entity,
+        'type': 'https://tent.io/types/post/status/v0.1.0',
+    }
+    json.update(kwargs)
+    return json
+
+@fixture
+def following_mocks(monkeypatch, following):
+    """Mock discovery and fetching posts from the followed entity"""
+    api_root = following.identity + '/tentd'
+    monkeypatch.setattr(http, 'head', MockFunction())
+    monkeypatch.setattr(http, 'get', MockFunction())
+
+    http.head[following.identity] = MockResponse(headers={
+        'Link': '<{}/profile>; rel="https://tent.io/rels/profile"'.format(
+            api_root)})
+    http.get[api_root + '/profile'] = MockResponse(json={
+        'https://tent.io/types/info/core/v0.1.0': {
+            'entity': following.identity,
+            'servers': [api_root]}})
+    for id in ('a', 'fetched'):
+        http.get['{}/posts/{}'.format(api_root, id)] = MockResponse(
+            json=status(id, content={'text': "Fetched"}))
+    return http.get
+
+def test_add_to_timelines(entity, following, following_mocks):
+    """Test that posts by followed entities are added to the timeline"""
+    now = datetime.utcnow()
+    assert add_to_timelines([
+        (entity, 'a', now, status('a')),
+        (entity, 'b', now, status('b', 'http://stranger.example.com')),
+        (entity, 'c', now, None),
+    ]) == 1
+
+    post = entity.timeline.get()
+    assert post.post_id == 'a'
+    assert post.author == following.identity
+    assert post.to_json()['content'] == {'text': "Fetched"}
+
+def test_add_to_timelines_once(entity, following_mocks):
+    """Test that a post is only added to a timeline once"""
+    notification = (entity, 'a', datetime.utcnow(), status('a'))
+    add_to_timelines([notification, notification])
+    assert add_to_timelines([notification]) == 0
+    assert entity.timeline.count() == 1
+
+def test_timeline_post_fetched(entity, following_mocks):
+    """Test that posts are fetched from the author's server"""
+    add_to_timelines([(entity, 'fetched', datetime.utcnow(),
+                       status('fetched'))])
+    assert following_mocks.was_called(
+        'http://following.example.com/tentd/posts/fetched')
+    assert entity.timeline.get().content == {'text': "Fetched"}
+
+def test_timeline_post_signed(entity, following, following_mocks,
+                              monkeypatch):
+    """Test that posts are fetched with the following's credentials"""
+    following.mac_key_id, following.mac_key = 'a:1234', 'secret'
+    following.save()
+    headers = {}
+    def get(url, **kwargs):
+        headers[url] = kwargs.get('headers', {})
+        return following_mocks(url)
+    monkeypatch.setattr(http, 'get', get)
+
+    add_to_timelines([(entity, 'a', datetime.utcnow(), status('a'))])
+    assert headers['http://following.example.com/tentd/posts/a'][
+        'Authorization'].startswith('MAC id="a:1234"')
+
+def test_timeline_post_spoofed(entity, following_mocks):
+    """Test that the content of a notification is not trusted"""
+    add_to_timelines([(entity, 'a', datetime.utcnow(),
+                       status('a', content={'text': "Spoofed"}))])
+    assert entity.timeline.get().content == {'text': "Fetched"}
+
+def test_timeline_post_missing(entity, following_mocks):
+    """Test that posts the author's server doesn't have are ignored"""
+    assert add_to_timelines([(entity, 'missing', datetime.utcnow(),
+                              status('missing', content={}))]) == 0
+
+def test_timeline_post_invalid(entity, following_mocks):
+    """Test that an invalid post doesn't stop the rest of the batch"""
+    following_mocks['http://following.example.com/tentd/posts/fetched'] = \
+        MockResponse(json=status('fetched', published_at='yesterday'))
+    now = datetime.utcnow()
+    assert add_to_timelines([
+        (entity, 'fetched', now, status('fetched')),
+        (entity, 'a', now, status('a')),
+    ]) == 1
+    assert entity.timeline.get().post_id == 'a'
+
+def test_timeline_from_buffer(app, entity, following_mocks, monkeypatch):
+    """Test that the buffer's threads add posts to the timeline"""
+    monkeypatch.setitem(app.config, 'NOTIFICATION_FLUSH_LATENCY', 0.01)
+    monkeypatch.setitem(app.config, 'TIMELINE_WORKER', True)
+    notifications.start()
+    try:
+        notifications.add(entity, 'a', post=status('a'))
+        for _ in range(200):
+            if entity.timeline.count():
+                break
+            sleep(0.01)
+    finally:
+        notifications.stop()
+    assert entity.timeline.get().post_id == 'a'
+
+def test_timeline_route(entity, following_mocks):
+    POST('entity.notification', status('a', content={'text': "Hello"}))
+    assert notifications.file_timelines() == 1
+    response = SGET('timeline.timeline')
+    assert [p['id'] for p in response.json()] == ['a']
+    assert isinstance(entity.timeline.get(), TimelinePost)
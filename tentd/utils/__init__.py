@@ -6,7 +6,7 @@ from functools import wraps
 from time import mktime
 from warnings import warn
 
-from flask import Config, current_app
+from flask import Config, current_app, g, has_request_context
 
 
 def deprecated(func):
@@ -42,6 +42,30 @@ def make_config(config):
     return configuration
 
 
+def batches(iterable, size):
+    """Split an iterable into lists of at most ``size`` items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def request_cache(name):
+    """Return a named dictionary that lasts for the current request
+
+    Outside of a request a new, empty dictionary is returned, so values are
+    never shared between requests."""
+    if not has_request_context():
+        return {}
+    if not hasattr(g, 'request_caches'):
+        g.request_caches = {}
+    return g.request_caches.setdefault(name, {})
+
+
 def json_attributes(obj, *names, **kwargs):
     """Takes an object and a list of attribute names, and returns a dict
     mapping those attribute names to the objects attribute's of the same name.
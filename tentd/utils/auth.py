@@ -6,18 +6,61 @@ specification and as required by the tent protocol.
 
 """
 
-__all__ = ['check_request', 'parse_authstring', 'normalize_request']
+__all__ = [
+    'check_request', 'parse_authstring', 'normalize_request',
+    'sign_request', 'verify_request', 'require_authorization', 'require_admin']
 
 import base64
 import hmac
-from hashlib import sha256, md5
-from functools import wraps
-from random import getrandbits
+from hashlib import sha1, sha256
+from functools import partial, wraps
+from os import urandom
+from time import time
+from urllib import unquote
+from urlparse import urlparse
 
-from flask import request, Response
-from werkzeug.exceptions import Unauthorized
+from flask import current_app, g, request, Response
+from mongoengine.signals import pre_save, post_save, post_delete
+from werkzeug.exceptions import NotFound, Unauthorized
 
 from tentd.documents.auth import KeyPair
+from tentd.documents.relationship import Follower
+from tentd.utils.cache import Cache
+
+#: The digest used by each MAC algorithm
+ALGORITHMS = {
+    'hmac-sha-1': sha1,
+    'hmac-sha-256': sha256,
+}
+
+#: The key, algorithm and owner of each KeyPair, keyed by mac_id. Entries
+#: expire after ``KEYPAIR_CACHE_TTL``, so that keys deleted by another process
+#: are not accepted for long.
+keypair_cache = Cache()
+
+#: The newest timestamp of a nonce discarded because the nonce cache was
+#: full. Requests signed at or before it could be replayed, so are rejected.
+_nonce_horizon = 0
+
+def _nonce_evicted(key, ts):
+    global _nonce_horizon
+    _nonce_horizon = max(_nonce_horizon, ts)
+
+#: The timestamps of recently verified requests, keyed by mac_id and nonce
+nonce_cache = Cache(maxsize=100000, evicted=_nonce_evicted)
+
+
+def constant_time_compare(a, b):
+    """Compare two strings in a time independent of where they differ"""
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+#: Use the standard library's implementation where it is availible
+compare_digest = getattr(hmac, 'compare_digest', constant_time_compare)
 
 
 def parse_authstring(authstring):
@@ -40,7 +83,7 @@ def parse_authstring(authstring):
 
     return avars
 
-def normalize_request(request_object):
+def normalize_request(request_object, auth=None):
     """Build a normalized request string from a request
 
     Take the flask request object and build a normalized request string
@@ -49,24 +92,148 @@ def normalize_request(request_object):
     http://tools.ietf.org/html/draft-ietf-oauth-v2-http-mac-01
     """
 
-    auth = parse_authstring(request_object.headers.get('Authorization'))
+    if auth is None:
+        auth = parse_authstring(request_object.headers.get('Authorization'))
     full_path = request_object.path + "?" + request_object.query_string
     ext = auth['ext'] if 'ext' in auth else ""
 
+    host, _, port = request_object.host.partition(':')
+    if not port:
+        port = 443 if request_object.is_secure else 80
+
     return "\n".join([
         str(auth['ts']), auth['nonce'], request_object.method,
-        full_path, request_object.host, str(80), ext])
+        full_path, host, str(port), ext])
 
-def check_request(request_object, key):
+def check_request(request_object, key, auth=None, algorithm='hmac-sha-256'):
     """Return true if the given request object matches its signature
     
-    This is the main test method that verifies that request
+    This is the main test method that verifies that request. The parsed
+    Authorization header can be given to avoid parsing it again.
     """
-    mac = hmac.new(key, normalize_request(request_object), sha256)
-    macstr = base64.encodestring(mac.digest())
-    
-    auth = parse_authstring(request_object.headers.get('Authorization'))
-    return auth['mac'] == macstr
+    if auth is None:
+        auth = parse_authstring(request_object.headers.get('Authorization'))
+
+    mac = hmac.new(
+        key, normalize_request(request_object, auth), ALGORITHMS[algorithm])
+    macstr = base64.b64encode(mac.digest())
+
+    return compare_digest(str(auth['mac']), macstr)
+
+def sign_request(method, url, mac_id, mac_key, algorithm='hmac-sha-256'):
+    """Return an Authorization header signing a request to another server"""
+    location = urlparse(url)
+    port = location.port or (443 if location.scheme == 'https' else 80)
+    ts, nonce = str(int(time())), urandom(6).encode('hex')
+
+    normalized = "\n".join([
+        ts, nonce, method.upper(),
+        unquote(location.path) + "?" + location.query,
+        location.hostname, str(port), ""])
+    mac = base64.b64encode(hmac.new(
+        str(mac_key), normalized, ALGORITHMS[algorithm]).digest())
+
+    return 'MAC id="{}",ts="{}",nonce="{}",mac="{}"'.format(
+        mac_id, ts, nonce, mac)
+
+def get_keypair(mac_id):
+    """Return the key, algorithm, owner and owner's entity for a mac id, or
+    None if there is no KeyPair with that id
+
+    The owner is a ``(class name, id)`` tuple, read without dereferencing
+    the owner. The entity is the id of the entity the owner belongs to, or
+    of the owner itself. KeyPairs are cached until they are saved or
+    deleted."""
+    credentials = keypair_cache.get(mac_id)
+    if credentials is None:
+        son = KeyPair._get_collection().find_one(
+            {'mac_id': mac_id}, fields=['mac_key', 'mac_algorithm', 'owner'])
+        if son is None:
+            return None
+        owner = (son['owner']['_cls'], son['owner']['_ref'].id)
+        entity = owner[1]
+        if owner[0] == Follower._class_name:
+            follower = Follower._get_collection().find_one(
+                {'_id': owner[1]}, fields=['entity'])
+            entity = follower and follower.get('entity')
+        credentials = keypair_cache.set(mac_id, (
+            str(son['mac_key']), son['mac_algorithm'], owner, entity))
+    return credentials
+
+def timestamp_is_fresh(ts):
+    """Return true if a request's timestamp is within ``MAC_TIMESTAMP_SKEW``
+    seconds of the current time"""
+    try:
+        ts = int(ts)
+    except (TypeError, ValueError):
+        return False
+    return abs(time() - ts) <= current_app.config['MAC_TIMESTAMP_SKEW']
+
+def use_nonce(mac_id, nonce, ts):
+    """Remember a request's nonce, returning false if it has already been
+    used
+
+    Nonces are remembered for twice ``MAC_TIMESTAMP_SKEW``, after which a
+    request using them has a stale timestamp. If nonces are discarded
+    sooner because there are too many to remember, requests as old as the
+    discarded nonces are rejected. Nonces shared with other processes are
+    never discarded early."""
+    ts = int(ts)
+    if nonce_cache.shared is None and ts <= _nonce_horizon:
+        return False
+    return nonce_cache.add('{}:{}'.format(mac_id, nonce), ts)
+
+def verify_request(request_object, entity=None, follower_id=None,
+                   followers=False):
+    """Return true if the request is signed with a KeyPair owned by the
+    entity, which defaults to ``g.entity``, or by the entity's follower with
+    the id ``follower_id``, or by any of its followers if ``followers`` is
+    set
+
+    Requests with a stale timestamp, or a nonce that has already been used,
+    are rejected so that signed requests can't be replayed."""
+    auth = request_object.mac_authorization
+    if auth is None:
+        return False
+    if not all(key in auth for key in ('id', 'ts', 'nonce', 'mac')):
+        return False
+    if not timestamp_is_fresh(auth['ts']):
+        return False
+
+    if entity is None:
+        entity = getattr(g, 'entity', None)
+    if entity is None:
+        return False
+
+    credentials = get_keypair(auth['id'])
+    if credentials is None:
+        return False
+
+    key, algorithm, owner, owner_entity = credentials
+    if owner != (entity._class_name, entity.id):
+        if owner[0] != Follower._class_name or owner_entity != entity.id:
+            return False
+        if not followers and str(owner[1]) != follower_id:
+            return False
+    if algorithm not in ALGORITHMS:
+        return False
+
+    if not check_request(request_object, key, auth, algorithm):
+        return False
+    return use_nonce(auth['id'], auth['nonce'], auth['ts'])
+
+def _keypair_renamed(sender, document, **kwargs):
+    """Forget all cached keys when a KeyPair's mac id is changed"""
+    if document.pk and 'mac_id' in document._get_changed_fields():
+        keypair_cache.clear()
+
+def _keypair_changed(sender, document, **kwargs):
+    """Forget a cached key when the KeyPair is saved or deleted"""
+    keypair_cache.delete(document.mac_id)
+
+pre_save.connect(_keypair_renamed, sender=KeyPair)
+post_save.connect(_keypair_changed, sender=KeyPair)
+post_delete.connect(_keypair_changed, sender=KeyPair)
 
 def authenticate_response():
     """Sends a 401 response that enables basic auth"""
@@ -82,7 +249,7 @@ class InvalidAuthentication(Unauthorized):
         return [('Content-Type', 'text/html'), ('WWW-Authenticate', 'MAC')]
 
 
-def require_authorization(route):
+def require_authorization(route=None, follower=None, followers=False):
     """Annotation that forces the view to do HMAC auth
 
 
@@ -90,24 +257,38 @@ def require_authorization(route):
     authenticated. If they are not, they'll get a HTTP 401 and a
     WWW-Authenticate header.
 
+    Views of a single follower can also accept the follower's own KeyPair,
+    by giving the name of the url argument holding its id as ``follower``,
+    e.g. ``@require_authorization(follower='follower_id')``. Views that
+    all of the entity's followers may use set ``followers``.
     """
+    if route is None:
+        return partial(
+            require_authorization, follower=follower, followers=followers)
+
     @wraps(route)
     def require_authorization_for_route(*args, **kwargs):
-            """Wrapped decorator function
-
-            TODO: actual implementation of this decorator.
-            """
-
-            auth = parse_authstring(request.headers.get('Authorization'))
-
-            if not auth:
+            """Verify the request's MAC before calling the route"""
+            follower_id = kwargs.get(follower) if follower else None
+            if not verify_request(
+                    request, follower_id=follower_id, followers=followers):
                 raise InvalidAuthentication
-
-            #try and find a keypair for the given mac id
-            try:
-                keypair = KeyPair.objects.filter(mac_id=auth['id'])
-            except KeyPair.DoesNotExist:
-                raise InvalidAuthentication
-            
             return route(*args, **kwargs)
     return require_authorization_for_route
+
+def require_admin(route):
+    """Annotation that restricts a view to the server's administrators
+
+    Requests must send ``ADMIN_TOKEN`` as a bearer token. If no token is
+    configured, the view is not found."""
+    @wraps(route)
+    def require_admin_for_route(*args, **kwargs):
+        """Check the request's token before calling the route"""
+        token = current_app.config['ADMIN_TOKEN']
+        if token is None:
+            raise NotFound
+        header = request.headers.get('Authorization', '')
+        if not compare_digest(str(header), 'Bearer {}'.format(token)):
+            raise Unauthorized("An administrator token is required")
+        return route(*args, **kwargs)
+    return require_admin_for_route
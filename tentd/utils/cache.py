@@ -0,0 +1,184 @@
+"""A simple in-process cache, optionally backed by a shared cache"""
+
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+__all__ = ['Cache', 'RedisCache']
+
+
+class Cache(object):
+    """A thread safe, size bounded cache with expiring entries
+
+    When the cache is full the least recently used entry is discarded. Each
+    entry expires ``ttl`` seconds after it was set, unless a different ttl
+    is given when setting it. A ttl of None means the entry never expires.
+
+    A ``shared`` cache, such as a :class:`RedisCache`, can be used by several
+    processes. Entries are then only kept in the shared cache, so that an
+    entry set or deleted by one process is seen by the others immediately.
+
+    ``evicted`` is called with the key and value of each entry discarded
+    because the cache is full.
+    """
+
+    def __init__(self, maxsize=1000, ttl=None, shared=None, evicted=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.evicted = evicted
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, maxsize=None, ttl=None, shared=None):
+        """Change the size, default ttl and shared cache, discarding all
+        entries"""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            self.ttl = ttl
+            self.shared = shared
+            self._entries.clear()
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is missing or expired"""
+        if self.shared is not None:
+            return self.shared.get(key, default)
+
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                expires, value = None, self
+            if expires is not None and expires <= time():
+                value = self
+            if value is not self:
+                # Reinsert the entry to mark it as the most recently used
+                self._entries[key] = (expires, value)
+                return value
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store a value, discarding the least recently used entries if the
+        cache is full"""
+        if ttl is None:
+            ttl = self.ttl
+        if self.shared is not None:
+            return self.shared.set(key, value, ttl)
+        expires = time() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._entries.pop(key, None)
+            discarded = self._store(key, value, expires)
+        self._discarded(discarded)
+        return value
+
+    def add(self, key, value, ttl=None):
+        """Store a value only if the key is missing or expired, returning
+        true if it was stored
+
+        With a shared cache the key is checked and set atomically, so only
+        one process can add it."""
+        if ttl is None:
+            ttl = self.ttl
+        if self.shared is not None:
+            return self.shared.add(key, value, ttl)
+        now = time()
+        expires = now + ttl if ttl is not None else None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                return False
+            self._entries.pop(key, None)
+            discarded = self._store(key, value, expires)
+        self._discarded(discarded)
+        return True
+
+    def _store(self, key, value, expires):
+        """Insert an entry, returning the entries discarded to make room for
+        it. Must be called with the lock held."""
+        self._entries[key] = (expires, value)
+        discarded = []
+        while len(self._entries) > self.maxsize:
+            discarded.append(self._entries.popitem(last=False))
+        return discarded
+
+    def _discarded(self, entries):
+        if self.evicted is not None:
+            for key, (expires, value) in entries:
+                self.evicted(key, value)
+
+    def delete(self, key):
+        """Remove an entry, if it exists"""
+        if self.shared is not None:
+            return self.shared.delete(key)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(object):
+    """A cache stored in redis, which can be shared between processes
+
+    Values are pickled, and keys are prefixed with ``prefix`` so that
+    several caches can use the same database. This requires the ``redis``
+    package."""
+
+    def __init__(self, url, prefix='tentd:', ttl=None):
+        from redis import StrictRedis
+        self.client = StrictRedis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key):
+        return '{}{}'.format(self.prefix, key)
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is missing"""
+        value = self.client.get(self._key(key))
+        return default if value is None else loads(value)
+
+    def set(self, key, value, ttl=None):
+        """Store a value, which expires after ``ttl`` seconds"""
+        ttl = ttl if ttl is not None else self.ttl
+        data = dumps(value, HIGHEST_PROTOCOL)
+        if ttl is None:
+            self.client.set(self._key(key), data)
+        else:
+            self.client.setex(self._key(key), max(1, int(ttl)), data)
+        return value
+
+    def add(self, key, value, ttl=None):
+        """Store a value only if the key is missing, returning true if it
+        was stored"""
+        ttl = ttl if ttl is not None else self.ttl
+        data = dumps(value, HIGHEST_PROTOCOL)
+        return bool(self.client.set(self._key(key), data, nx=True,
+                                    ex=max(1, int(ttl)) if ttl else None))
+
+    def delete(self, key):
+        """Remove an entry, if it exists"""
+        self.client.delete(self._key(key))
+
+    def clear(self):
+        """Remove all entries with this cache's prefix"""
+        keys = self.client.keys(self.prefix + '*')
+        if keys:
+            self.client.delete(*keys)
+
+    def __contains__(self, key):
+        return self.client.exists(self._key(key))
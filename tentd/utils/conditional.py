@@ -0,0 +1,70 @@
+"""Conditional GET support, using ETag and Last-Modified validators
+
+Validators are computed from the ids and update times of the documents a
+response is rendered from. When the client already has the current version
+of a response, a ``304 Not Modified`` response is returned before the
+documents are serialized.
+"""
+
+from datetime import datetime
+from hashlib import md5
+from time import mktime
+
+from flask import current_app, request
+
+__all__ = [
+    'conditional_request', 'validators', 'not_modified', 'add_validators']
+
+
+def conditional_request():
+    """Check if the request has If-None-Match or If-Modified-Since headers"""
+    return bool(request.if_none_match) or \
+        request.if_modified_since is not None
+
+
+def validators(documents):
+    """Return an ETag and a last modified time for a list of documents
+
+    Documents without an ``updated_at`` time only contribute their id."""
+    digest = md5()
+    last_modified = None
+    for document in documents:
+        updated_at = getattr(document, 'updated_at', None)
+        digest.update('{}:{};'.format(
+            document.id, updated_at.isoformat() if updated_at else ''))
+        if updated_at is not None and \
+                (last_modified is None or updated_at > last_modified):
+            last_modified = updated_at
+
+    if last_modified is not None:
+        # Update times are stored in local time, headers are in UTC
+        last_modified = datetime.utcfromtimestamp(
+            mktime(last_modified.timetuple()))
+    return digest.hexdigest(), last_modified
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the client's copy is current, or None
+
+    If-Modified-Since is only used if the request has no If-None-Match
+    header."""
+    if request.if_none_match:
+        current = request.if_none_match.contains(etag)
+    elif request.if_modified_since is not None and last_modified is not None:
+        current = last_modified.replace(microsecond=0) <= \
+            request.if_modified_since
+    else:
+        current = False
+
+    if current:
+        return add_validators(
+            current_app.response_class(status=304), etag, last_modified)
+    return None
+
+
+def add_validators(response, etag, last_modified=None):
+    """Add ETag and Last-Modified headers to a response"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
@@ -0,0 +1,130 @@
+"""Concurrent delivery of posts to followers, using gevent
+
+Each outbox thread sends one delivery at a time, which does not keep up
+with entities that have thousands of followers. The delivery engine runs
+in its own process, started with ``tentd --deliver``, and sends deliveries
+from the outbox concurrently in greenlets. This requires the ``gevent``
+package. The standard library is patched by gevent before the application
+and its connections are created, so that pymongo and requests wait for the
+network without blocking other greenlets.
+
+At most ``DELIVERY_CONCURRENCY`` deliveries are sent at once, and at most
+``DELIVERY_HOST_CONCURRENCY`` to the same host. Deliveries to a host that
+is already busy are left in the outbox until the host has room, rather than
+being claimed and holding up deliveries to other hosts.
+Each delivery must be sent within ``DELIVERY_TIMEOUT`` seconds, and failed
+deliveries are retried as they are by the outbox threads.
+"""
+
+from __future__ import absolute_import
+
+from collections import defaultdict
+
+from gevent import Timeout
+from gevent.event import Event
+from gevent.lock import Semaphore
+from gevent.pool import Pool
+
+from tentd.lib.flask import json_backend
+from tentd.utils.cache import Cache
+from tentd.utils.outbox import (
+    DeliveryFailed, claim, deliver, notification_host, send)
+
+__all__ = ['DeliveryEngine']
+
+
+class DeliveryEngine(object):
+    """Sends many deliveries from the outbox at once"""
+
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.pool = Pool(config['DELIVERY_CONCURRENCY'])
+        self.host_limit = config['DELIVERY_HOST_CONCURRENCY']
+        self.timeout = config['DELIVERY_TIMEOUT']
+        self.stopping = Event()
+
+        #: The number of deliveries sent or waiting to be sent to each host
+        self.active = defaultdict(int)
+
+        #: Limits the deliveries sent to each active host
+        self.semaphores = {}
+
+        #: Serialized posts, as each post is sent to many followers
+        self.posts = Cache(maxsize=1000, ttl=60)
+
+    def busy_hosts(self):
+        """Return the hosts that can't be sent any more deliveries"""
+        return [host for host, count in self.active.items()
+                if count >= self.host_limit]
+
+    def run(self):
+        """Claim and send deliveries until the engine is stopped
+
+        A delivery is only claimed once there is room to send it, so that
+        deliveries are not held by a busy engine."""
+        interval = self.app.config['OUTBOX_POLL_INTERVAL']
+        with self.app.app_context():
+            while not self.stopping.is_set():
+                self.pool.wait_available()
+                try:
+                    delivery = claim(exclude_hosts=self.busy_hosts())
+                except Exception:
+                    self.app.logger.exception("Could not claim a delivery")
+                    delivery = None
+
+                if delivery is None:
+                    self.stopping.wait(interval)
+                else:
+                    self.pool.spawn(self.deliver, delivery)
+
+        # Deliveries that are not finished are claimed again once their
+        # lock expires
+        self.pool.join(timeout=self.timeout)
+
+    def stop(self):
+        self.stopping.set()
+
+    def deliver(self, delivery):
+        """Send a delivery, waiting if its host is already busy
+
+        Busy hosts are not claimed, so deliveries only wait here if their
+        host has changed since they were created."""
+        with self.app.app_context():
+            host = notification_host(delivery.follower)
+            if host is None:
+                # Let the outbox record why the delivery can't be sent
+                return deliver(delivery, sender=self.send)
+
+            self.active[host] += 1
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = self.semaphores[host] = Semaphore(self.host_limit)
+            try:
+                with semaphore:
+                    return deliver(delivery, sender=self.send)
+            finally:
+                self.active[host] -= 1
+                if not self.active[host]:
+                    del self.active[host]
+                    del self.semaphores[host]
+
+    def send(self, delivery):
+        """Send a delivery, failing if it takes too long"""
+        error = DeliveryFailed(
+            "No response after {} seconds".format(self.timeout))
+        with Timeout(self.timeout, error):
+            send(delivery, data=self.post_data(delivery))
+
+    def post_data(self, delivery):
+        """Return the serialized post, which is only serialized once for all
+        of its deliveries"""
+        # Use the reference's id, to avoid dereferencing the post
+        reference = delivery._data.get('post')
+        key = getattr(reference, 'id', reference)
+        data = self.posts.get(key)
+        if data is None:
+            data = self.posts.set(
+                key, json_backend().dumps(delivery.post.to_json()))
+        return data
+
@@ -1,30 +1,71 @@
 """Controls the following of entities."""
 
 import re
+from datetime import datetime
 
-import requests
+from flask import current_app
+from requests import RequestException
+from werkzeug.datastructures import ResponseCacheControl
+from werkzeug.http import parse_cache_control_header, parse_date
 
+from tentd.lib.flask import json_backend
+from tentd.lib.requests import http
+from tentd.utils.auth import sign_request
+from tentd.utils.cache import Cache
 from tentd.utils.exceptions import APIException, APIBadRequest
 from tentd.documents.auth import KeyPair
-from tentd.documents.entity import Follower
+from tentd.documents.entity import Follower, Following
 from tentd.documents.profiles import CoreProfile
 
 
+#: Discovered entities, keyed by identity url
+discovery_cache = Cache()
+
+
 def discover_entity(identity):
+    """Find an entity from the given identity, returning its profiles
+
+    Results are cached for ``DISCOVERY_CACHE_TTL`` seconds, or less if the
+    responses from the entity's server say they should not be cached for as
+    long. Failures are cached for ``DISCOVERY_CACHE_NEGATIVE_TTL`` seconds.
+    """
+    result = discovery_cache.get(identity)
+    if result is None:
+        config = current_app.config
+        try:
+            url, profile, lifetime = fetch_entity(identity)
+        except APIException as error:
+            result = discovery_cache.set(
+                identity, error, config['DISCOVERY_CACHE_NEGATIVE_TTL'])
+        else:
+            ttl = min(lifetime, config['DISCOVERY_CACHE_TTL'])
+            result = {'url': url, 'profile': profile}
+            if ttl > 0:
+                discovery_cache.set(identity, result, ttl)
+
+    if isinstance(result, Exception):
+        raise result
+    return result['profile']
+
+
+def fetch_entity(identity):
     """Find an entity from the given identity
 
     - Fetch the identity, giving us a list of profiles
     - Fetch a profile, giving us the entity's canonical identity url
       and api endpoints
 
+    Returns the profile url, the profiles, and the number of seconds the
+    result can be cached for.
+
     TODO: Move this into a generic tent module?
     """
 
     # TODO: Parse html for links
     # https://tent.io/docs/server-protocol#server-discovery
     try:
-        response = requests.head(identity)
-    except requests.ConnectionError as ex:
+        response = http.head(identity)
+    except RequestException as ex:
         raise APIBadRequest("Could not discover entity ({})".format(ex))
 
     if not 'Link' in response.headers:
@@ -34,20 +75,68 @@ def discover_entity(identity):
 
     # TODO: deal with multiple headers
     # https://tent.io/docs/server-protocol#http-codelinkcode-header
-    url = re.search('^<(.+)>; rel="https://tent.io/rels/profile"$',
-                    link).group(1)
+    match = re.search('^<(.+)>; rel="https://tent.io/rels/profile"$', link)
+    if match is None:
+        raise APIBadRequest("Entity has no profile link")
+    url = match.group(1)
 
     # https://tent.io/docs/server-protocol#completing-the-discovery-process
     # TODO: Accept: application/vnd.tent.v0+json
     try:
-        profile = requests.get(url).json()
+        profile_response = http.get(url)
+        profile = profile_response.json()
         if CoreProfile.__schema__ not in profile:
             raise APIException("Entity has no core profile.")
-    except requests.ConnectionError as ex:
+    except RequestException as ex:
         raise APIException(
             "Could not fetch entity profile ({})".format(ex))
 
-    return profile
+    lifetime = min(cache_lifetime(response), cache_lifetime(profile_response))
+    return url, profile, lifetime
+
+
+def fetch_post(identity, post_id, credentials=None):
+    """Fetch a post from the server of the entity that published it
+
+    The request is signed with ``credentials``, a ``(mac id, key,
+    algorithm)`` tuple given by the server when its entity was followed."""
+    servers = discover_entity(identity)[CoreProfile.__schema__]['servers']
+    if not servers:
+        raise APIException("Entity {} has no servers".format(identity))
+
+    url = '{}/posts/{}'.format(servers[0].rstrip('/'), post_id)
+    headers = {}
+    if credentials is not None:
+        headers['Authorization'] = sign_request('GET', url, *credentials)
+    try:
+        response = http.get(url, headers=headers)
+    except RequestException as ex:
+        raise APIException("Could not fetch post ({})".format(ex))
+
+    if response.status_code != 200:
+        raise APIException("Could not fetch post {} ({})".format(
+            url, response.status_code))
+    return response.json()
+
+
+def cache_lifetime(response):
+    """Return the number of seconds a response may be cached for
+
+    Uses the Cache-Control and Expires headers of the response, returning
+    infinity if neither limits the lifetime of the response."""
+    cache_control = parse_cache_control_header(
+        response.headers.get('Cache-Control'), cls=ResponseCacheControl)
+
+    if cache_control.no_store or cache_control.no_cache:
+        return 0
+    if cache_control.max_age is not None:
+        return cache_control.max_age
+
+    expires = parse_date(response.headers.get('Expires'))
+    if expires is not None:
+        return max(0, (expires - datetime.utcnow()).total_seconds())
+
+    return float('inf')
 
 
 def start_following(entity, details):
@@ -67,7 +156,7 @@ def start_following(entity, details):
         entity=entity,
         identity=profile[CoreProfile.__schema__]['entity'],
         servers=profile[CoreProfile.__schema__]['servers'],
-        licenses=details['licences'],
+        licenses=details.get('licenses', details.get('licences')),
         types=details['types'],
         notification_path=details['notification_path'])
 
@@ -82,11 +171,47 @@ def start_following(entity, details):
     return follower.save()
 
 
+def follow_entity(entity, identity):
+    """Start following another entity, returning the new Following
+
+    The entity's server is sent a follow request, and responds with the
+    credentials used to fetch its posts. Notifications are sent to the
+    ``/notification`` endpoint under the following entity's api root."""
+    profile = discover_entity(identity)[CoreProfile.__schema__]
+    if not profile.get('servers'):
+        raise APIException("Entity {} has no servers".format(identity))
+
+    url = '{}/followers'.format(profile['servers'][0].rstrip('/'))
+    data = json_backend().dumps({
+        'entity': entity.identity,
+        'licenses': [],
+        'types': ['all'],
+        'notification_path': 'notification',
+    })
+    try:
+        response = http.post(url, data=data,
+            headers={'Content-Type': 'application/vnd.tent.v0+json'})
+    except RequestException as ex:
+        raise APIException("Could not follow {} ({})".format(identity, ex))
+
+    if response.status_code != 200:
+        raise APIException("Could not follow {} ({})".format(
+            identity, response.status_code))
+    details = response.json()
+
+    return Following(
+        entity=entity,
+        identity=profile['entity'],
+        mac_key_id=details.get('mac_key_id'),
+        mac_key=details.get('mac_key'),
+        mac_algorithm=details.get('mac_algorithm')).save()
+
+
 def notify_following(follower):
     """Perform the GET request to the new follower's notification path.
 
     It should return 200 OK if it's acceptable."""
-    resp = requests.get(get_notification_link(follower))
+    resp = http.get(get_notification_link(follower))
     return resp.status_code
 
 
@@ -0,0 +1,275 @@
+"""Metrics for monitoring systems, served from ``/metrics``
+
+Requests to each endpoint are counted and timed, along with notifications
+received from other servers, notifications delivered to followers on each
+remote host, and MongoDB commands. The metrics are returned in the
+Prometheus text format.
+
+Recording a metric never takes a lock. Each thread records its metrics in
+its own shard, and the shards are only added together when the metrics are
+read. The shards of threads that have finished are merged into a single
+shard, so that servers starting a thread for each request do not keep a
+shard for every request they have handled.
+"""
+
+from bisect import bisect_left
+from threading import Lock, current_thread, local
+from time import time
+
+from flask import g, request
+from mongoengine.connection import get_connection
+
+from tentd.lib.pymongo import add_listener, remove_listener
+from tentd.utils.auth import require_admin
+
+__all__ = ['Metrics', 'metrics']
+
+#: The upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'tentd_http_requests_total':
+        ('counter', "Requests handled, by endpoint, method and status"),
+    'tentd_http_request_duration_seconds':
+        ('histogram', "Time taken to handle requests, by endpoint"),
+    'tentd_notifications_received_total':
+        ('counter', "Notifications received from other servers"),
+    'tentd_deliveries_total':
+        ('counter', "Notifications sent to followers, by host and outcome"),
+    'tentd_delivery_duration_seconds':
+        ('histogram', "Time taken to send notifications, by host"),
+    'tentd_mongo_commands_total':
+        ('counter', "Commands sent to MongoDB, by command and collection"),
+    'tentd_mongo_command_duration_seconds':
+        ('histogram', "Time taken by MongoDB commands, by command"),
+    'tentd_mongo_pool_idle_connections':
+        ('gauge', "Idle connections in the MongoDB connection pool"),
+    'tentd_mongo_pool_max_size':
+        ('gauge', "Maximum size of the MongoDB connection pool"),
+}
+
+
+class Shard(object):
+    """The metrics recorded by a single thread"""
+
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        """Add the metrics of another shard to this one"""
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in other.histograms.items():
+            values = list(values)
+            totals = self.histograms.get(key)
+            if totals is None:
+                self.histograms[key] = values
+            else:
+                for i, value in enumerate(values):
+                    totals[i] += value
+
+
+def escape(value):
+    return unicode(value).replace('\\', r'\\').replace(
+        '"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, escape(value)) for name, value in labels))
+
+
+def mongo_pool():
+    """Return gauges for the size of the MongoDB connection pool
+
+    pymongo 2.x does not count the connections that are in use, but the
+    pool keeps the connections that are not."""
+    pool = getattr(get_connection(), '_MongoClient__pool', None)
+    if pool is None:
+        return []
+    return [
+        ('tentd_mongo_pool_idle_connections', (), len(pool.sockets)),
+        ('tentd_mongo_pool_max_size', (), pool.max_size),
+    ]
+
+
+class Metrics(object):
+    """Counters and latency histograms, recorded without locking
+
+    Labels are given as a tuple of ``(name, value)`` pairs. Functions in
+    ``gauges`` are called when the metrics are read, and return a list of
+    ``(name, labels, value)`` tuples."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.gauges = [mongo_pool]
+        self._shards = []
+        self._finished = Shard()
+        self._lock = Lock()
+        self._local = local()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['METRICS']
+        if not self.enabled:
+            self.remove_listeners()
+            return
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.add_url_rule('/metrics', 'metrics', require_admin(self.view))
+        add_listener(self.mongo_command)
+
+    def remove_listeners(self):
+        """Stop counting commands, which were counted for a previous
+        application if it recorded metrics"""
+        remove_listener(self.mongo_command)
+
+    def shard(self):
+        """Return the current thread's shard"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = Shard(current_thread())
+            # Only taken once by each thread
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def increment(self, name, labels=(), value=1):
+        if not self.enabled:
+            return
+        counters = self.shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """Add a value to a histogram"""
+        if not self.enabled:
+            return
+        histograms = self.shard().histograms
+        key = (name, labels)
+        values = histograms.get(key)
+        if values is None:
+            # A count for each bucket and +Inf, followed by the sum
+            values = histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        values[bisect_left(BUCKETS, value)] += 1
+        values[-1] += value
+
+    def start(self):
+        g.metrics_start = time()
+
+    def finish(self, response):
+        """Count and time the request"""
+        start = getattr(g, 'metrics_start', None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'none'
+        self.increment('tentd_http_requests_total', (
+            ('endpoint', endpoint),
+            ('method', request.method),
+            ('status', response.status_code)))
+        self.observe('tentd_http_request_duration_seconds',
+            time() - start, (('endpoint', endpoint),))
+        return response
+
+    def mongo_command(self, event):
+        self.increment('tentd_mongo_commands_total', (
+            ('command', event.name),
+            ('collection', event.collection or '')))
+        self.observe('tentd_mongo_command_duration_seconds',
+            event.duration, (('command', event.name),))
+
+    def notification_received(self):
+        self.increment('tentd_notifications_received_total')
+
+    def delivery(self, host, success, duration):
+        """Record the outcome of sending a notification to a host"""
+        self.increment('tentd_deliveries_total', (
+            ('host', host),
+            ('outcome', 'success' if success else 'failure')))
+        self.observe('tentd_delivery_duration_seconds',
+            duration, (('host', host),))
+
+    def collect(self):
+        """Return the counters and histograms of all threads added together"""
+        with self._lock:
+            running = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    running.append(shard)
+                else:
+                    self._finished.merge(shard)
+            self._shards = running
+
+            total = Shard()
+            total.merge(self._finished)
+            for shard in running:
+                total.merge(shard)
+        return total
+
+    def gauge_values(self):
+        values = []
+        for gauge in self.gauges:
+            try:
+                values.extend(gauge())
+            except Exception:
+                self.app.logger.exception("Could not read a gauge")
+        return values
+
+    def render(self):
+        """Return the metrics in the Prometheus text format"""
+        total = self.collect()
+        samples = {}
+
+        for (name, labels), value in sorted(total.counters.items()):
+            samples.setdefault(name, []).append(
+                (name, labels, value))
+
+        for (name, labels), values in sorted(total.histograms.items()):
+            lines = samples.setdefault(name, [])
+            count = 0
+            for bound, value in zip(BUCKETS + ('+Inf',), values):
+                count += value
+                lines.append(('{}_bucket'.format(name),
+                              labels + (('le', bound),), count))
+            lines.append(('{}_sum'.format(name), labels, values[-1]))
+            lines.append(('{}_count'.format(name), labels, count))
+
+        for name, labels, value in self.gauge_values():
+            samples.setdefault(name, []).append((name, labels, value))
+
+        output = []
+        for name in sorted(samples):
+            if name in HELP:
+                kind, description = HELP[name]
+                output.append('# HELP {} {}'.format(name, description))
+                output.append('# TYPE {} {}'.format(name, kind))
+            for sample, labels, value in samples[name]:
+                output.append('{}{} {}'.format(
+                    sample, format_labels(labels), value))
+        return '\n'.join(output) + '\n'
+
+    def view(self):
+        """Returns the metrics in the Prometheus text format"""
+        return self.app.response_class(
+            self.render(), content_type='text/plain; version=0.0.4')
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+            self._finished = Shard()
+
+metrics = Metrics()
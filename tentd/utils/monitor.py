@@ -0,0 +1,142 @@
+"""Logging of slow MongoDB commands
+
+Every command sent to the database is timed. Commands that take longer
+than ``SLOW_QUERY_THRESHOLD`` seconds are logged with the endpoint, or the
+background thread, that sent them. Only the shape of each query is logged,
+as its values may include private content. With ``SLOW_QUERY_EXPLAIN`` enabled, the
+query plan of each slow query is fetched with ``explain()`` the first time
+a query of that shape is slow, which shows queries that scan a collection
+instead of using an index.
+"""
+
+from collections import deque
+from datetime import datetime
+from threading import Lock, current_thread, local
+
+from flask import has_request_context, request
+from mongoengine.connection import get_connection
+
+from tentd.lib.pymongo import add_listener, remove_listener
+from tentd.utils.cache import Cache
+
+
+def query_shape(value):
+    """Return a hashable description of a query, without its values
+
+    Queries with the same shape use the same query plan."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, query_shape(v))
+                            for key, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return ('[]',)
+    return None
+
+
+def redact(value):
+    """Return a query with each of its values replaced by ``?``"""
+    if isinstance(value, dict):
+        return dict((key, redact(v)) for key, v in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return ['?']
+    return '?'
+
+
+class QueryMonitor(object):
+    """Logs and remembers slow database commands"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.threshold = None
+        self.explain = False
+        self.recent = deque()
+        self.explained = Cache(maxsize=1000)
+        self._lock = Lock()
+        self._local = local()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD']
+        self.explain = app.config['SLOW_QUERY_EXPLAIN']
+        self.recent = deque(maxlen=app.config['SLOW_QUERY_LOG_SIZE'])
+        self.explained.clear()
+
+        if self.threshold is None:
+            self.remove_listeners()
+        else:
+            add_listener(self.command)
+
+    def remove_listeners(self):
+        """Stop timing commands, which were timed for a previous application
+        if it enabled the log"""
+        remove_listener(self.command)
+
+    @staticmethod
+    def source():
+        """Return the endpoint or thread that sent a command"""
+        if has_request_context():
+            return request.endpoint
+        return current_thread().name
+
+    def command(self, event):
+        """Log a command if it was slow"""
+        if self.threshold is None or event.duration < self.threshold:
+            return
+        # Ignore the queries made by explain()
+        if getattr(self._local, 'explaining', False):
+            return
+
+        slow = {
+            'time': datetime.utcnow(),
+            'source': self.source(),
+            'command': event.name,
+            'collection': '{}.{}'.format(event.database, event.collection),
+            'query': redact(event.spec),
+            'sort': event.sort,
+            'duration': event.duration,
+            'explain': None,
+        }
+        if self.explain and event.name == 'query':
+            slow['explain'] = self.explain_query(event)
+
+        with self._lock:
+            self.recent.append(slow)
+
+        self.app.logger.warning(
+            "Slow {command} on {collection} from {source} "
+            "({duration_ms:.1f}ms): {query!r}".format(
+                duration_ms=slow['duration'] * 1000, **slow))
+        if slow['explain'] is not None:
+            self.app.logger.warning("Query plan: {!r}".format(
+                slow['explain']))
+
+    def explain_query(self, event):
+        """Return the query plan of a query, if a query of the same shape
+        has not already been explained"""
+        key = (event.database, event.collection,
+               query_shape(event.spec), query_shape(event.sort))
+        if key in self.explained:
+            return None
+
+        self._local.explaining = True
+        try:
+            collection = get_connection()[event.database][event.collection]
+            cursor = collection.find(event.spec)
+            if event.sort:
+                cursor = cursor.sort(event.sort.items())
+            plan = cursor.explain()
+        except Exception:
+            self.app.logger.exception("Could not explain a slow query")
+            return None
+        finally:
+            self._local.explaining = False
+        return self.explained.set(key, plan)
+
+    def slow_queries(self):
+        """Return the most recent slow commands, oldest first"""
+        with self._lock:
+            return list(self.recent)
+
+monitor = QueryMonitor()
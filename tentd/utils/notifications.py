@@ -0,0 +1,186 @@
+"""Buffered storage of notifications received from other servers
+
+Notifications tend to arrive in bursts, as the servers of popular entities
+notify their followers of a new post at once, and retry notifications that
+failed. Notifications are held in a buffer and written with a single insert
+once ``NOTIFICATION_FLUSH_SIZE`` notifications are waiting, or after at most
+``NOTIFICATION_FLUSH_LATENCY`` seconds.
+
+Notifications are unique for each entity and post, so a notification of a
+post that has already been stored is ignored. Once notifications are stored
+their posts are added to the timelines of the entities that received them by
+another background thread, as each post is fetched from its author's server,
+so that requests never wait for other servers.
+"""
+
+import atexit
+from collections import OrderedDict
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+from mongoengine import NotUniqueError
+
+from tentd.documents import Notification
+from tentd.utils.metrics import metrics
+from tentd.utils.timeline import add_to_timelines
+
+
+class NotificationBuffer(object):
+    """Holds notifications until they are written to the database
+
+    A background thread flushes the buffer every
+    ``NOTIFICATION_FLUSH_LATENCY`` seconds, or as soon as the buffer is
+    full. If the latency is 0 notifications are written as soon as they are
+    received. Stored notifications are queued for a second thread, which
+    adds their posts to timelines if ``TIMELINE_WORKER`` is set. The threads
+    are started by the first request the application handles, so that
+    threads are never created in a process that later forks."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pending = OrderedDict()
+        self.unfiled = []
+        self.lock = Lock()
+        self.thread = None
+        self.timeline_thread = None
+        self.stopping = Event()
+
+        #: Set to flush the buffer, and to add posts to timelines
+        self.wake = Event()
+        self.filing = Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_first_request(self.start)
+
+    def add(self, entity, post_id, received_at=None, post=None):
+        """Add a notification of a post to the buffer
+
+        ``post`` is the JSON the notification was sent with. Notifications
+        of a post that is already in the buffer are ignored. The buffer's
+        thread is woken if the buffer is full."""
+        config = self.app.config
+        metrics.notification_received()
+        with self.lock:
+            self.pending.setdefault(
+                (entity.id, post_id),
+                (entity, received_at or datetime.utcnow(), post))
+            full = len(self.pending) >= config['NOTIFICATION_FLUSH_SIZE']
+
+        if not config['NOTIFICATION_FLUSH_LATENCY']:
+            self.flush()
+        elif full:
+            self.wake.set()
+
+    def flush(self):
+        """Write the buffered notifications to the database, and queue them
+        to be added to timelines
+
+        Returns the number of notifications that were written, including
+        those that had already been stored. If they can't be written they
+        are put back in the buffer, and the error is raised."""
+        with self.lock:
+            pending, self.pending = self.pending, OrderedDict()
+        if not pending:
+            return 0
+
+        notifications = [
+            (entity, post_id, received_at, post)
+            for (_, post_id), (entity, received_at, post)
+            in pending.iteritems()]
+
+        try:
+            # Continue past notifications that have already been stored
+            Notification.objects.insert([Notification(
+                entity=entity,
+                post_id=post_id,
+                received_at=received_at)
+                for entity, post_id, received_at, _ in notifications],
+                load_bulk=False, safe=True,
+                write_options={'continue_on_error': True})
+        except NotUniqueError:
+            pass
+        except Exception:
+            with self.lock:
+                for key, value in pending.iteritems():
+                    self.pending.setdefault(key, value)
+            raise
+
+        with self.lock:
+            self.unfiled.extend(notifications)
+        self.filing.set()
+        return len(notifications)
+
+    def file_timelines(self):
+        """Add the posts of the stored notifications to timelines
+
+        Returns the number of posts added."""
+        with self.lock:
+            unfiled, self.unfiled = self.unfiled, []
+        if not unfiled:
+            return 0
+        try:
+            return add_to_timelines(unfiled, self.app.logger)
+        except Exception:
+            self.app.logger.exception("Could not update timelines")
+            return 0
+
+    def start(self):
+        """Start the threads that are enabled and not running"""
+        config = self.app.config
+        if self.thread is None and config['NOTIFICATION_FLUSH_LATENCY']:
+            self.thread = self._start_thread(self.work, 'notification-buffer')
+        if self.timeline_thread is None and config['TIMELINE_WORKER']:
+            self.timeline_thread = self._start_thread(
+                self.work_timelines, 'notification-timelines')
+
+    def _start_thread(self, target, name):
+        if self.thread is None and self.timeline_thread is None:
+            self.stopping.clear()
+            # Don't lose buffered notifications when the process exits
+            atexit.register(self.stop)
+        thread = Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self, timeout=None):
+        """Stop the threads, flush the buffer and add any posts waiting for
+        the timelines"""
+        self.stopping.set()
+        self.wake.set()
+        self.filing.set()
+        for thread in (self.thread, self.timeline_thread):
+            if thread is not None:
+                thread.join(timeout)
+        self.thread = self.timeline_thread = None
+        with self.app.app_context():
+            self.flush()
+            self.file_timelines()
+
+    def work(self):
+        """Flush the buffer until stopped"""
+        with self.app.app_context():
+            interval = self.app.config['NOTIFICATION_FLUSH_LATENCY']
+            while not self.stopping.is_set():
+                self.wake.wait(interval)
+                self.wake.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception(
+                        "Could not store notifications")
+
+    def work_timelines(self):
+        """Add the posts of stored notifications to timelines until
+        stopped"""
+        with self.app.app_context():
+            while not self.stopping.is_set():
+                self.filing.wait()
+                self.filing.clear()
+                self.file_timelines()
+
+notifications = NotificationBuffer()
@@ -0,0 +1,248 @@
+"""Background delivery of posts to followers
+
+Publishing a post creates a :class:`Delivery` in the outbox for each of the
+entity's followers. A pool of worker threads claims pending deliveries and
+sends them, retrying failed deliveries with an exponential backoff. Many
+deliveries can be sent at once by the engine in :mod:`tentd.utils.engine`.
+"""
+
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from time import time
+from urlparse import urlparse
+
+from bson import SON
+from flask import current_app
+
+from tentd.documents import Delivery
+from tentd.lib.flask import json_backend
+from tentd.lib.requests import http
+from tentd.utils.follow import get_notification_link
+from tentd.utils.metrics import metrics
+
+
+class DeliveryFailed(Exception):
+    """Raised when a follower does not accept a notification"""
+
+
+def notification_host(follower):
+    """Return the host of a follower's notification link, or None if the
+    follower has no link"""
+    try:
+        return urlparse(get_notification_link(follower)).netloc
+    except Exception:
+        return None
+
+
+def enqueue(post, followers=None):
+    """Add a delivery of the post to the outbox for each follower
+
+    If no followers are given, the post is sent to all followers of the
+    post's entity. Returns the number of deliveries created."""
+    return enqueue_many([post], followers)
+
+
+def enqueue_many(posts, followers=None):
+    """Add deliveries of several posts by the same entity to the outbox
+
+    The followers are only fetched once, and all deliveries are created with
+    a single insert. Returns the number of deliveries created."""
+    if not posts:
+        return 0
+
+    if followers is None:
+        followers = posts[0].entity.followers.only(
+            'id', 'identity', 'servers', 'notification_path')
+    followers = [(follower, notification_host(follower))
+                 for follower in followers]
+
+    deliveries = [Delivery(
+        entity=post.entity,
+        post=post,
+        follower=follower,
+        identity=follower.identity,
+        host=host)
+        for post in posts for follower, host in followers]
+
+    if deliveries:
+        Delivery.objects.insert(deliveries, load_bulk=False)
+    return len(deliveries)
+
+
+def claim(exclude_hosts=None):
+    """Atomically claim the next delivery that is ready to be sent
+
+    Deliveries that were claimed by a worker that never finished sending them
+    are reclaimed after ``OUTBOX_LOCK_TIMEOUT`` seconds. Deliveries to the
+    hosts in ``exclude_hosts`` are not claimed."""
+    now = datetime.now()
+    expired = now - timedelta(
+        seconds=current_app.config['OUTBOX_LOCK_TIMEOUT'])
+
+    query = {'$or': [
+        {'status': Delivery.PENDING, 'next_attempt_at': {'$lte': now}},
+        {'status': Delivery.SENDING, 'locked_at': {'$lte': expired}},
+    ]}
+    if exclude_hosts:
+        query['host'] = {'$nin': list(exclude_hosts)}
+
+    son = Delivery._get_collection().find_and_modify(
+        query=query,
+        update={'$set': {'status': Delivery.SENDING, 'locked_at': now}},
+        sort=SON([('next_attempt_at', 1)]),
+        new=True)
+
+    return Delivery._from_son(son) if son is not None else None
+
+
+def send(delivery, data=None):
+    """Send a delivery to the follower's notification path
+
+    ``data`` is the serialized post, which is serialized from the delivery's
+    post if it is not given."""
+    if data is None:
+        data = json_backend().dumps(delivery.post.to_json())
+    link = get_notification_link(delivery.follower)
+
+    start, success = time(), False
+    try:
+        response = http.post(link, data=data,
+            headers={'Content-Type': 'application/vnd.tent.v0+json'})
+        success = 200 <= response.status_code < 300
+    finally:
+        metrics.delivery(urlparse(link).netloc, success, time() - start)
+
+    if not success:
+        raise DeliveryFailed(
+            "Follower responded with {}".format(response.status_code))
+
+
+def deliver(delivery, sender=None):
+    """Send a delivery and record the outcome in the outbox
+
+    Failed deliveries are rescheduled, waiting twice as long after each
+    attempt, until ``OUTBOX_MAX_ATTEMPTS`` is reached. The delivery is sent
+    with ``sender``, which defaults to :func:`send`."""
+    config = current_app.config
+    queryset = Delivery.objects(id=delivery.id)
+    attempts = delivery.attempts + 1
+
+    try:
+        (sender or send)(delivery)
+    except Exception as error:
+        now = datetime.now()
+        if attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+            queryset.update_one(
+                set__status=Delivery.FAILED,
+                set__attempts=attempts,
+                set__last_error=str(error),
+                set__completed_at=now)
+            return False
+
+        delay = config['OUTBOX_RETRY_DELAY'] * 2 ** (attempts - 1)
+        queryset.update_one(
+            set__status=Delivery.PENDING,
+            set__attempts=attempts,
+            set__last_error=str(error),
+            set__next_attempt_at=now + timedelta(seconds=delay))
+        return False
+
+    queryset.update_one(
+        set__status=Delivery.DELIVERED,
+        set__attempts=attempts,
+        set__completed_at=datetime.now())
+    return True
+
+
+def drain():
+    """Send deliveries until none are ready, returning the number sent"""
+    count = 0
+    delivery = claim()
+    while delivery is not None:
+        deliver(delivery)
+        count += 1
+        delivery = claim()
+    return count
+
+
+def stats():
+    """Return the depth of the outbox and the rate at which it is draining
+
+    The drain rate is the number of deliveries completed per second over the
+    last ``OUTBOX_RATE_WINDOW`` seconds."""
+    window = current_app.config['OUTBOX_RATE_WINDOW']
+    since = datetime.now() - timedelta(seconds=window)
+
+    statuses = {status: Delivery.objects(status=status).count()
+                for status in Delivery.STATUSES}
+    delivered = Delivery.objects(
+        status=Delivery.DELIVERED, completed_at__gte=since).count()
+
+    return {
+        'depth': statuses[Delivery.PENDING] + statuses[Delivery.SENDING],
+        'statuses': statuses,
+        'drain_rate': delivered / float(window),
+    }
+
+
+class Outbox(object):
+    """A pool of background threads that send deliveries from the outbox
+
+    The pool is started by the first request the application handles, so
+    that worker threads are never created in a process that later forks.
+    The number of threads is set with ``OUTBOX_WORKERS``, and no threads are
+    started if it is 0."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.threads = []
+        self.stopping = Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_first_request(self.start)
+
+    def start(self):
+        """Start the worker threads, if they are not already running"""
+        if self.threads:
+            return
+        self.stopping.clear()
+        for i in range(self.app.config['OUTBOX_WORKERS']):
+            thread = Thread(target=self.work, name='outbox-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Signal the worker threads to stop and wait for them to finish"""
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def work(self):
+        """Send deliveries until the pool is stopped"""
+        with self.app.app_context():
+            interval = self.app.config['OUTBOX_POLL_INTERVAL']
+            while not self.stopping.is_set():
+                try:
+                    delivery = claim()
+                except Exception:
+                    self.app.logger.exception("Could not claim a delivery")
+                    delivery = None
+
+                if delivery is None:
+                    self.stopping.wait(interval)
+                    continue
+
+                # The delivery is claimed again once its lock expires
+                try:
+                    deliver(delivery)
+                except Exception:
+                    self.app.logger.exception(
+                        "Could not send delivery {}".format(delivery.id))
+
+outbox = Outbox()
@@ -0,0 +1,104 @@
+"""Pagination of API listings using the tent protocol's query parameters
+
+Documents are ordered by id, newest first. The parameters are:
+
+- ``before_id``: Only return documents older than this id.
+- ``since_id``: Only return documents newer than this id, starting from the
+  oldest, so that new documents can be fetched in order without gaps. This
+  is used to fetch the page before another page.
+- ``until_id``: Only return documents newer than this id, starting from the
+  newest.
+- ``limit``: The number of documents to return.
+
+Pages are always returned newest first.
+
+Each page is fetched with a single range query over ``_id``, so collections
+should have an index on ``(entity, -_id)``.
+"""
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app, request, url_for
+
+from tentd.lib.flask import jsonify
+from tentd.lib.mongoengine import projected
+from tentd.utils.conditional import validators, not_modified, add_validators
+from tentd.utils.exceptions import APIBadRequest
+
+__all__ = ['paginate', 'page_of']
+
+
+def object_id(name):
+    """Return a query parameter as an ObjectId"""
+    try:
+        return ObjectId(request.args[name])
+    except (InvalidId, TypeError):
+        raise APIBadRequest("{} must be a valid id".format(name))
+
+
+def page_limit():
+    """Return the limit query parameter, bounded by the configured maximum"""
+    config = current_app.config
+    try:
+        limit = int(request.args.get(
+            'limit', config['PAGINATION_DEFAULT_LIMIT']))
+    except ValueError:
+        raise APIBadRequest("limit must be an integer")
+    return max(1, min(limit, config['PAGINATION_MAX_LIMIT']))
+
+
+def page_of(queryset):
+    """Return the documents selected by the request's query parameters
+
+    Returns the documents as a list, newest first, and the limit used."""
+    limit = page_limit()
+
+    if 'before_id' in request.args:
+        queryset = queryset.filter(id__lt=object_id('before_id'))
+
+    if 'since_id' in request.args:
+        queryset = queryset.filter(id__gt=object_id('since_id'))
+        documents = list(queryset.order_by('id').limit(limit))
+        documents.reverse()
+        return documents, limit
+
+    if 'until_id' in request.args:
+        queryset = queryset.filter(id__gt=object_id('until_id'))
+
+    return list(queryset.order_by('-id').limit(limit)), limit
+
+
+def page_links(documents, limit):
+    """Return the urls of the pages either side of a page"""
+    args = request.args.to_dict()
+    for name in ('before_id', 'since_id', 'until_id'):
+        args.pop(name, None)
+    args.update(request.view_args or {})
+
+    links = []
+    if documents and any(name in request.args for name in
+                         ('before_id', 'since_id', 'until_id')):
+        links.append(('prev', url_for(request.endpoint, _external=True,
+            since_id=str(documents[0].id), **args)))
+
+    if len(documents) == limit:
+        links.append(('next', url_for(request.endpoint, _external=True,
+            before_id=str(documents[-1].id), **args)))
+    return links
+
+
+def paginate(queryset):
+    """Return a JSON response containing a page of documents, with Link
+    headers pointing to the next and previous pages
+
+    Only the fields the documents are serialized from are fetched. The
+    response has an ETag computed from the documents on the page, and is
+    not serialized if the client already has the same page."""
+    documents, limit = page_of(projected(queryset))
+    etag, last_modified = validators(documents)
+    response = not_modified(etag, last_modified)
+    if response is None:
+        response = add_validators(jsonify(documents), etag, last_modified)
+    for rel, url in page_links(documents, limit):
+        response.headers.add('Link', '<{}>; rel="{}"'.format(url, rel))
+    return response
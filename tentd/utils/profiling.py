@@ -0,0 +1,140 @@
+"""Per-request profiling, enabled with ``PROFILING``
+
+Each request records its wall time, the number and duration of the MongoDB
+commands it sent, and the time it spent waiting for other servers. These
+are returned in a ``Server-Timing`` header, and totals for each endpoint
+are available from ``/profiling``. Nothing is recorded, and no hooks are
+installed, unless profiling is enabled.
+
+The wall time does not include sending the body of streamed responses.
+"""
+
+from threading import Lock
+from time import time
+
+from flask import g, has_request_context, request
+
+from tentd.lib.flask import jsonify
+from tentd.lib.pymongo import add_listener, remove_listener
+from tentd.lib.requests import http
+from tentd.utils.auth import require_admin
+
+
+class Profiler(object):
+    """Records where the time spent handling each request went"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.endpoints = {}
+        self._lock = Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        if not app.config['PROFILING']:
+            self.remove_listeners()
+            return
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.add_url_rule('/profiling', 'profiling', require_admin(self.view))
+
+        add_listener(self.mongo_command)
+        if self.http_request not in http.listeners:
+            http.listeners.append(self.http_request)
+
+    def remove_listeners(self):
+        """Stop timing commands and requests, which were timed for a previous
+        application if it was profiled"""
+        remove_listener(self.mongo_command)
+        if self.http_request in http.listeners:
+            http.listeners.remove(self.http_request)
+
+    @staticmethod
+    def current():
+        """Return the profile of the current request, or None"""
+        if not has_request_context():
+            return None
+        return getattr(g, 'profile', None)
+
+    def start(self):
+        g.profile = {
+            'start': time(),
+            'mongo_count': 0,
+            'mongo_time': 0.0,
+            'http_count': 0,
+            'http_time': 0.0,
+        }
+
+    def mongo_command(self, event):
+        profile = self.current()
+        if profile is not None:
+            profile['mongo_count'] += 1
+            profile['mongo_time'] += event.duration
+
+    def http_request(self, method, url, duration, response):
+        profile = self.current()
+        if profile is not None:
+            profile['http_count'] += 1
+            profile['http_time'] += duration
+
+    def finish(self, response):
+        """Add the Server-Timing header and record the request's totals"""
+        profile = self.current()
+        if profile is None:
+            return response
+
+        profile['time'] = time() - profile['start']
+        response.headers['Server-Timing'] = ', '.join([
+            'app;dur={:.2f}'.format(profile['time'] * 1000),
+            'mongo;dur={:.2f};desc="{} commands"'.format(
+                profile['mongo_time'] * 1000, profile['mongo_count']),
+            'http;dur={:.2f};desc="{} requests"'.format(
+                profile['http_time'] * 1000, profile['http_count']),
+        ])
+        self.record(request.endpoint, profile)
+        return response
+
+    def record(self, endpoint, profile):
+        """Add a request's profile to the totals for its endpoint"""
+        with self._lock:
+            totals = self.endpoints.get(endpoint)
+            if totals is None:
+                totals = self.endpoints[endpoint] = {
+                    'requests': 0,
+                    'time': 0.0,
+                    'max_time': 0.0,
+                    'mongo_count': 0,
+                    'mongo_time': 0.0,
+                    'http_count': 0,
+                    'http_time': 0.0,
+                }
+            totals['requests'] += 1
+            totals['max_time'] = max(totals['max_time'], profile['time'])
+            for key in ('time', 'mongo_count', 'mongo_time',
+                        'http_count', 'http_time'):
+                totals[key] += profile[key]
+
+    def stats(self):
+        """Return the totals and averages for each endpoint"""
+        with self._lock:
+            endpoints = {name: dict(totals)
+                         for name, totals in self.endpoints.items()}
+        for totals in endpoints.values():
+            requests = totals['requests']
+            totals['mean_time'] = totals['time'] / requests
+            totals['mean_mongo_count'] = totals['mongo_count'] / float(
+                requests)
+        return endpoints
+
+    def view(self):
+        """Returns the totals for each endpoint"""
+        return jsonify(self.stats())
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+
+profiler = Profiler()
@@ -0,0 +1,104 @@
+"""Adds the posts of incoming notifications to entity timelines
+
+The timeline of an entity holds the posts of the entities it is following.
+Notifications are not signed, so the post they contain can't be trusted, and
+the post is always fetched from its author's server, signed with the
+credentials given when the author was followed. Each post is only fetched
+once, however many local entities follow its author.
+"""
+
+from mongoengine import NotUniqueError, ValidationError
+
+from tentd.documents import Following, TimelinePost
+from tentd.utils.follow import fetch_post
+
+
+def warn(logger, message, *args):
+    if logger is not None:
+        logger.warning(message.format(*args))
+
+
+def credentials(son):
+    """Return the credentials of a raw Following, or None if it has none"""
+    if son.get('mac_key_id') is None:
+        return None
+    return (son['mac_key_id'], son['mac_key'],
+            son.get('mac_algorithm') or 'hmac-sha-256')
+
+
+def add_to_timelines(notifications, logger=None):
+    """Add the posts of a batch of notifications to the timelines of the
+    entities that received them
+
+    Each notification is an ``(entity, post_id, received_at, post)`` tuple,
+    where post is the JSON the notification was sent with. Only the author
+    of the post is used from the notification. Posts by entities that are
+    not being followed are ignored, and a post that can't be fetched or
+    stored is skipped without affecting the rest of the batch. Returns the
+    number of posts added."""
+    notifications = [n for n in notifications
+                     if isinstance(n[3], dict)
+                     and isinstance(n[3].get('entity'), basestring)]
+    if not notifications:
+        return 0
+
+    # Raw queries are used so that the entities are not dereferenced
+    entities = list(set(entity.id for entity, _, _, _ in notifications))
+    followed = dict(
+        ((son['entity'], son['identity']), credentials(son))
+        for son in Following._get_collection().find(
+            {'entity': {'$in': entities}},
+            fields=['entity', 'identity', 'mac_key_id', 'mac_key',
+                    'mac_algorithm']))
+
+    # Skip posts that are already in a timeline
+    post_ids = list(set(post_id for _, post_id, _, _ in notifications))
+    stored = set(
+        (son['entity'], son['author'], son['post_id'])
+        for son in TimelinePost._get_collection().find(
+            {'entity': {'$in': entities}, 'post_id': {'$in': post_ids}},
+            fields=['entity', 'author', 'post_id']))
+
+    fetched = {}
+    posts = []
+    for entity, post_id, received_at, json in notifications:
+        author = json['entity']
+        if (entity.id, author) not in followed:
+            continue
+        if (entity.id, author, post_id) in stored:
+            continue
+
+        key = (author, post_id)
+        if key not in fetched:
+            try:
+                fetched[key] = fetch_post(
+                    author, post_id, followed[(entity.id, author)])
+            except Exception as error:
+                fetched[key] = None
+                warn(logger, "Could not fetch post {} by {}: {}",
+                     post_id, author, getattr(error, 'description', error))
+        json = fetched[key]
+
+        # The author's server must agree that this is the author's post
+        if not isinstance(json, dict) or json.get('entity') != author:
+            continue
+
+        try:
+            post = TimelinePost.from_json(entity, json, received_at)
+            post.validate()
+        except (KeyError, TypeError, ValueError, OverflowError,
+                ValidationError) as error:
+            warn(logger, "Invalid post {} by {}: {!r}",
+                 post_id, author, error)
+            continue
+        posts.append(post)
+        stored.add((entity.id, author, post_id))
+
+    if posts:
+        try:
+            TimelinePost.objects.insert(
+                posts, load_bulk=False, safe=True,
+                write_options={'continue_on_error': True})
+        except NotUniqueError:
+            pass
+    return len(posts)